@@ -0,0 +1,57 @@
+// assets/columnar.js
+// Browser decoder for the columnar wire format produced by utils/columnar.py.
+// Exposed as dash_clientside.columnar so clientside callbacks can turn a
+// columnar store straight into ag-Grid rowData / DataTable data.
+
+(function () {
+    function decodeColumn(encoded, length) {
+        if (!encoded) return new Array(length).fill(null);
+
+        if (encoded.type === 'dict') {
+            const dictionary = encoded.dictionary || [];
+            return (encoded.codes || []).map(code => (code < 0 ? null : dictionary[code]));
+        }
+
+        const values = encoded.values || [];
+        if (encoded.type === 'datetime') {
+            return values.map(ms => (ms === null ? null : new Date(ms).toISOString().replace('Z', '')));
+        }
+        return values;
+    }
+
+    function isColumnar(payload) {
+        return !!payload && !Array.isArray(payload) && payload.encoding === 'columnar';
+    }
+
+    // Columnar payload -> array of row objects (legacy record arrays pass through)
+    function toRecords(payload) {
+        if (!payload) return [];
+        if (Array.isArray(payload)) return payload;
+        if (!isColumnar(payload)) return [];
+
+        const length = payload.length || 0;
+        const columns = payload.columns || [];
+        const decoded = columns.map((_, i) => decodeColumn(payload.data[i], length));
+
+        const rows = new Array(length);
+        for (let r = 0; r < length; r++) {
+            const row = {};
+            for (let c = 0; c < columns.length; c++) {
+                row[columns[c]] = decoded[c][r];
+            }
+            rows[r] = row;
+        }
+        return rows;
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        columnar: {
+            isColumnar: isColumnar,
+            toRecords: toRecords,
+            // Clientside callback entry point: store data -> ag-Grid rowData / DataTable data
+            toRowData: function (payload) {
+                return toRecords(payload);
+            }
+        }
+    });
+})();
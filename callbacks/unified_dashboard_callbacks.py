@@ -7,7 +7,7 @@ This file consolidates ALL dashboard callbacks to eliminate duplicates
 from dash import callback, Input, Output, State, html, ctx, clientside_callback
 from dash.exceptions import PreventUpdate
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import timedelta
 import logging
 
 logger = logging.getLogger(__name__)
@@ -316,43 +316,42 @@ def register_unified_dashboard_callbacks():
     # ========================================
     # 5. EXPORT DATA CALLBACK
     # ========================================
-    @callback(
+    # Streams the filtered selection from /api/export/filtered-data (see endpoints/export_routes.py)
+    clientside_callback(
+        """
+        function(n_clicks, agency, cluster, site, startDate, endDate) {
+            if (!n_clicks) return window.dash_clientside.no_update;
+
+            const params = new URLSearchParams({
+                source: 'analytics',
+                format: 'csv',
+                agency: agency || 'all',
+                cluster: cluster || 'all',
+                site: site || 'all'
+            });
+            if (startDate) params.append('start_date', startDate);
+            if (endDate) params.append('end_date', endDate);
+
+            window.location.assign('/api/export/filtered-data?' + params.toString());
+
+            return {
+                namespace: 'dash_html_components',
+                type: 'Span',
+                props: {
+                    children: '⬇️ Export started',
+                    style: {color: '#38A169', fontWeight: '600'}
+                }
+            };
+        }
+        """,
         Output('analytics-filter-container-loading', 'children'),
         [Input('analytics-filter-container-export-btn', 'n_clicks')],
         [State('analytics-filter-container-agency-filter', 'value'),
          State('analytics-filter-container-cluster-filter', 'value'),
          State('analytics-filter-container-site-filter', 'value'),
          State('analytics-filter-container-date-filter', 'start_date'),
-         State('analytics-filter-container-date-filter', 'end_date'),
-         State('current-theme', 'data')],
+         State('analytics-filter-container-date-filter', 'end_date')],
         prevent_initial_call=True
     )
-    def unified_export_data(n_clicks, agency, cluster, site, start_date, end_date, theme_name):
-        """UNIFIED: Export filtered data"""
-        if not n_clicks:
-            raise PreventUpdate
-        
-        try:
-            from utils.theme_utils import get_theme_styles
-            theme_styles = get_theme_styles(theme_name or 'dark')
-            theme = theme_styles["theme"]
-            
-            # Create export filename
-            export_filename = f"filtered_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            
-            return html.Div([
-                html.Span("✅ Export completed", style={
-                    "color": "#38A169",
-                    "fontWeight": "600"
-                }),
-                html.Div(f"📄 File: {export_filename}", style={
-                    "fontSize": "0.9rem",
-                    "color": theme["text_secondary"]
-                })
-            ])
-            
-        except Exception as e:
-            logger.error(f"Export error: {e}")
-            return html.Div("❌ Export failed", style={"color": "#dc3545"})
 
     logger.info("✅ Unified dashboard callbacks registered successfully")
@@ -499,7 +499,9 @@ def apply_filters(n_clicks, agency, cluster, site, start_date, end_date, theme_n
     theme_styles = get_theme_styles(theme_name or 'dark')
     theme = theme_styles["theme"]
     
-    display = create_filtered_data_display(filtered_df, theme)
+    display = create_filtered_data_display(filtered_df, theme, filters={
+        'agency': agency, 'cluster': cluster, 'site': site, 'start_date': start_date, 'end_date': end_date
+    })
     
     # Update status
     status_style = {"display": "block"}
@@ -0,0 +1,229 @@
+# analyzer_backfill.py - Backfill the waste analyzer's outputs for every date x agency
+"""
+Computes WasteManagementAnalyzer's eight outputs for every (date, agency)
+combination across a process pool and writes them as partitioned Parquet.
+
+The prepared dataset is written once, sorted by agency, to an Arrow IPC file.
+Workers memory-map it read-only and each task materializes only its agency's
+row range. For a given target date, the outputs are computed as of that date:
+the day's totals and hourly breakdown, plus history-wide tables (cluster
+performance, trends, vehicles, materials, KPIs) over trips up to that date.
+
+Output layout:
+    <output-dir>/<table>/agency=<agency>/<first-date>_<last-date>.parquet
+with tables agencies, day, hourly, cluster_performance, daily_trends,
+vehicle_utilization, materials and kpis, each row tagged with target_date.
+
+Usage (from the data/ directory):
+    python analyzer_backfill.py --input waste_management_data_updated.csv
+    python analyzer_backfill.py --start 2025-01-01 --end 2025-12-31 --workers 16
+    python analyzer_backfill.py --agency "Zigma Global Environ Solutions" --output-dir /tmp/backfill
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Tuple
+from urllib.parse import quote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    from waste_analyzer import (VERSION_COLUMNS, WasteManagementAnalyzer, aggregate_outputs, build_fact_cube,
+                                distinct_sketches)
+except ImportError:
+    from data.waste_analyzer import (VERSION_COLUMNS, WasteManagementAnalyzer, aggregate_outputs,
+                                     build_fact_cube, distinct_sketches)
+
+DATASET_FILENAME = '_dataset.arrow'
+DEFAULT_OUTPUT_DIR = 'analyzer_backfill'
+DEFAULT_DATES_PER_TASK = 31
+
+# Object columns stored as strings in the shared file (Arrow needs one type per column)
+TEXT_COLUMNS = ['Time', 'agency', 'cluster', 'site', 'Vehicle No', 'Material Name', 'Ticket No']
+
+
+def write_shared_dataset(df: pd.DataFrame, path: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Write the columns the analyzer needs to an Arrow IPC file, sorted by agency.
+
+    Returns:
+        dict: agency -> (first row, row count) in the file
+    """
+    columns = [col for col in VERSION_COLUMNS + ['hour'] if col in df.columns]
+    frame = df.loc[df['agency'].notna(), columns].copy()
+    for col in TEXT_COLUMNS:
+        if col in frame.columns and frame[col].dtype == object:
+            frame[col] = frame[col].astype(str).where(frame[col].notna(), None)
+    frame['agency'] = frame['agency'].astype(str)
+    if 'Net Weight' in frame.columns:
+        frame['Net Weight'] = pd.to_numeric(frame['Net Weight'], errors='coerce')
+    frame = frame.sort_values(['agency', 'Date'], kind='mergesort').reset_index(drop=True)
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+    counts = frame.groupby('agency', sort=False).size()
+    starts = counts.cumsum() - counts
+    return {agency: (int(starts[agency]), int(count)) for agency, count in counts.items()}
+
+
+# Per-process state, set up by _init_worker
+_worker_table = None
+_worker_cube = (None, None, None)  # (agency, fact cube, distinct sketches) - tasks arrive agency by agency
+
+
+def _init_worker(dataset_path: str):
+    """Memory-map the shared dataset once per worker process"""
+    global _worker_table
+    _worker_table = pa.ipc.open_file(pa.memory_map(dataset_path, 'r')).read_all()
+
+
+def _agency_cube(agency: str, start: int, length: int):
+    """The agency's fact cube and its distinct-count sketches (the as-of KPIs merge these per date)"""
+    global _worker_cube
+    if _worker_cube[0] != agency:
+        cube = build_fact_cube(_worker_table.slice(start, length).to_pandas())
+        _worker_cube = (agency, cube, distinct_sketches(cube))
+    return _worker_cube[1], _worker_cube[2]
+
+
+def result_frames(results) -> Dict[str, pd.DataFrame]:
+    """AnalysisResults as one DataFrame per output table"""
+    agencies = results.agencies
+    frames = {
+        'agencies': pd.DataFrame([{
+            'primary_agency': agencies.primary_agency,
+            'total_agencies': agencies.total_agencies,
+            'all_agencies': json.dumps({str(k): int(v) for k, v in agencies.all_agencies.items()})
+        }]),
+        'day': pd.DataFrame([results.day._asdict()]),
+    }
+    for name in results._fields[2:]:
+        frames[name] = getattr(results, name)
+    return frames
+
+
+def agency_partition(output_dir: str, table: str, agency: str) -> str:
+    return os.path.join(output_dir, table, f"agency={quote(agency, safe='')}")
+
+
+def backfill_task(agency: str, start: int, length: int, dates: List[pd.Timestamp], output_dir: str) -> int:
+    """
+    Compute the outputs for one agency over a run of target dates and write one part per table.
+
+    Returns:
+        int: Number of (date, agency) combinations computed
+    """
+    cube, sketches = _agency_cube(agency, start, length)
+    tables = {}
+
+    for target_date in dates:
+        as_of = cube[cube['Date'] <= target_date]
+        results = aggregate_outputs(as_of, target_date, int(as_of['rows'].sum()), sketches)
+        for name, frame in result_frames(results).items():
+            if len(frame):
+                tables.setdefault(name, []).append(frame.assign(target_date=target_date))
+
+    part_name = f"{dates[0].strftime('%Y-%m-%d')}_{dates[-1].strftime('%Y-%m-%d')}.parquet"
+    for name, frames in tables.items():
+        partition = agency_partition(output_dir, name, agency)
+        os.makedirs(partition, exist_ok=True)
+        path = os.path.join(partition, part_name)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        pq.write_table(pa.Table.from_pandas(pd.concat(frames, ignore_index=True, sort=False),
+                                            preserve_index=False), tmp_path)
+        os.replace(tmp_path, path)
+
+    return len(dates)
+
+
+def plan_tasks(df: pd.DataFrame, ranges: Dict[str, Tuple[int, int]], start_date=None, end_date=None,
+               dates_per_task: int = DEFAULT_DATES_PER_TASK):
+    """(agency, first row, row count, target dates) per task - each agency's active days in chunks"""
+    active = df.loc[df['agency'].notna() & df['Date'].notna(), ['agency', 'Date']].drop_duplicates()
+    if start_date is not None:
+        active = active[active['Date'] >= start_date]
+    if end_date is not None:
+        active = active[active['Date'] <= end_date]
+
+    tasks = []
+    for agency, group in active.groupby(active['agency'].astype(str)):
+        if agency not in ranges:
+            continue
+        dates = sorted(group['Date'].unique())
+        for i in range(0, len(dates), dates_per_task):
+            chunk = [pd.Timestamp(date) for date in dates[i:i + dates_per_task]]
+            tasks.append((agency, ranges[agency][0], ranges[agency][1], chunk))
+    return tasks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill waste analyzer outputs for every date x agency")
+    parser.add_argument('--input', default='waste_management_data_updated.csv', help="Trips CSV (plain or .gz)")
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR, help="Root of the partitioned Parquet output")
+    parser.add_argument('--start', help="First target date (YYYY-MM-DD)")
+    parser.add_argument('--end', help="Last target date (YYYY-MM-DD)")
+    parser.add_argument('--agency', action='append', help="Only backfill this agency (repeatable)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument('--dates-per-task', type=int, default=DEFAULT_DATES_PER_TASK,
+                        help="Target dates computed per task")
+    parser.add_argument('--keep-dataset', action='store_true', help="Keep the shared Arrow file afterwards")
+    args = parser.parse_args(argv)
+
+    analyzer = WasteManagementAnalyzer(args.input, verbose=False)
+    if analyzer.df is None:
+        print(f"❌ Could not load {args.input}")
+        return 1
+
+    df = analyzer.df
+    if args.agency:
+        df = df[df['agency'].isin(args.agency)]
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    dataset_path = os.path.join(args.output_dir, DATASET_FILENAME)
+    started = time.perf_counter()
+    ranges = write_shared_dataset(df, dataset_path)
+    tasks = plan_tasks(df, ranges,
+                       pd.to_datetime(args.start) if args.start else None,
+                       pd.to_datetime(args.end) if args.end else None,
+                       max(1, args.dates_per_task))
+    total = sum(len(task[3]) for task in tasks)
+    print(f"🗂️  Shared dataset: {dataset_path} ({len(df):,} trips, {len(ranges)} agencies)")
+    print(f"🚀 Backfilling {total:,} date x agency combinations in {len(tasks)} tasks on {args.workers} workers")
+
+    done = 0
+    errors = 0
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, args.workers), initializer=_init_worker,
+                                 initargs=(dataset_path,)) as pool:
+            futures = {pool.submit(backfill_task, *task, args.output_dir): task for task in tasks}
+            for future in as_completed(futures):
+                agency, _, _, dates = futures[future]
+                try:
+                    done += future.result()
+                except Exception as e:
+                    errors += 1
+                    print(f"❌ {agency} {dates[0]:%Y-%m-%d}..{dates[-1]:%Y-%m-%d}: {e}")
+                    continue
+                print(f"   {done:,}/{total:,} done ({time.perf_counter() - started:.1f}s)")
+    finally:
+        if not args.keep_dataset:
+            os.remove(dataset_path)
+
+    print(f"✅ Backfilled {done:,} combinations into {args.output_dir} "
+          f"in {time.perf_counter() - started:.1f}s ({errors} failed tasks)")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
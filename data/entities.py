@@ -0,0 +1,296 @@
+# entities.py - Shared entity dictionary for agencies, clusters, sites and vehicles
+"""
+Interns every raw spelling of an agency, cluster, site or vehicle to a stable
+integer id and a display name.
+
+Spellings are canonicalized once per distinct value - case-folded, punctuation
+dropped, whitespace collapsed (vehicles: upper-case letters and digits only) -
+so 'Saurashtra_Enviro_Projects_Pvt._Ltd.' and 'saurashtra enviro projects pvt
+ltd' get the same id, as do the configured agency aliases. After that, every
+lookup of a known spelling is a single dict hit.
+
+Loaders add integer code columns (agency_id, cluster_id, site_id, vehicle_id)
+with add_entity_codes(), and filters, groupbys and joins run on those codes.
+Ids are assigned in order of first registration and are stable for the life of
+the process; they are not meant to be persisted - drop_entity_codes() before a
+frame leaves the process (browser stores, API responses, exports).
+
+Importable both from the cloud function (`from entities import ...`) and from
+the dashboard (`from data.entities import ...`).
+"""
+
+import re
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+MISSING_ID = -1
+CODE_SUFFIX = '_id'
+
+# Known agencies: configuration key -> full display name
+AGENCY_DISPLAY_NAMES = {
+    'Zigma': 'Zigma Global Enviro Solutions Private Limited, Erode',
+    'Saurashtra': 'Saurastra Enviro Pvt Ltd, Gujarat',
+    'Tharuni': 'Tharuni Associates, Guntur'
+}
+
+# Other spellings of the configured agencies (matched after canonicalization, never by substring)
+AGENCY_ALIASES = {
+    'Saurashtra': ['Saurastra', 'Saurashtra_Enviro_Projects_Pvt._Ltd.'],
+}
+
+# Columns holding each kind of entity, checked in order (same order the filters use)
+ENTITY_COLUMNS = {
+    'agency': ['agency_name', 'Agency', 'agency', 'AGENCY'],
+    'cluster': ['Cluster', 'cluster', 'CLUSTER'],
+    'site': ['Site', 'site', 'SITE', 'site_name'],
+    'vehicle': ['Vehicle No', 'vehicle_no', 'vehicle'],
+}
+
+_NON_WORD = re.compile(r'[\W_]+')
+_NON_ALNUM = re.compile(r'[^0-9A-Z]')
+
+
+def canonical_name(value) -> str:
+    """Canonical form of an agency/cluster/site name: 'Pvt. Ltd ,' -> 'pvt ltd'"""
+    return ' '.join(_NON_WORD.sub(' ', str(value).casefold()).split())
+
+
+def canonical_vehicle(value) -> str:
+    """Canonical form of a vehicle number: 'AP 39 uq-4518' -> 'AP39UQ4518'"""
+    return _NON_ALNUM.sub('', str(value).upper())
+
+
+def _display_form(value) -> str:
+    return ' '.join(str(value).split())
+
+
+def _is_missing(value) -> bool:
+    try:
+        return bool(pd.isna(value))
+    except (TypeError, ValueError):
+        return False
+
+
+class EntityDictionary:
+    """Raw spelling -> stable integer id for one kind of entity"""
+
+    def __init__(self, kind: str, canonicalize: Callable[[object], str] = canonical_name):
+        self.kind = kind
+        self._canonicalize = canonicalize
+        self._lock = threading.Lock()
+        self._by_spelling = {}  # raw spelling -> id
+        self._by_key = {}       # canonical key -> id
+        self._names = []        # id -> display name
+        self._seeded_ids = set()  # ids of entities registered with add()
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, name: str, display_name: Optional[str] = None, aliases: Iterable[str] = ()) -> int:
+        """Register a known entity (and its aliases) under one id"""
+        with self._lock:
+            key = self._canonicalize(name)
+            entity_id = self._by_key.get(key)
+            if entity_id is None:
+                entity_id = self._new_id(key, display_name or _display_form(name))
+            elif display_name:
+                self._names[entity_id] = display_name
+            for spelling in [name, *aliases]:
+                alias_key = self._canonicalize(spelling)
+                self._by_key.setdefault(alias_key, entity_id)
+                self._by_spelling[spelling] = entity_id
+            self._seeded_ids.add(entity_id)
+            return entity_id
+
+    def _new_id(self, key: str, display_name: str) -> int:
+        entity_id = len(self._names)
+        self._names.append(display_name)
+        self._by_key[key] = entity_id
+        return entity_id
+
+    def intern(self, value) -> int:
+        """Id for a raw spelling, registering a new entity if it is unknown"""
+        entity_id = self._by_spelling.get(value)
+        if entity_id is not None:
+            return entity_id
+        if _is_missing(value):
+            return MISSING_ID
+
+        with self._lock:
+            entity_id = self._by_spelling.get(value)
+            if entity_id is not None:
+                return entity_id
+
+            key = self._canonicalize(value)
+            if not key:
+                entity_id = MISSING_ID
+            else:
+                entity_id = self._by_key.get(key)
+                if entity_id is None:
+                    entity_id = self._new_id(key, _display_form(value))
+            self._by_spelling[value] = entity_id
+            return entity_id
+
+    def lookup(self, value) -> Optional[int]:
+        """Id for a raw spelling without registering it (None if unknown)"""
+        entity_id = self._by_spelling.get(value)
+        if entity_id is not None or _is_missing(value):
+            return entity_id
+        return self._by_key.get(self._canonicalize(value))
+
+    def ids_for(self, values: Iterable) -> List[int]:
+        """Ids of the known spellings among values (unknown ones are dropped)"""
+        ids = (self.lookup(value) for value in values)
+        return sorted({entity_id for entity_id in ids if entity_id is not None and entity_id != MISSING_ID})
+
+    def encode(self, values) -> np.ndarray:
+        """
+        Vectorized intern: int32 id per value, MISSING_ID for missing/blank values.
+
+        Only the distinct spellings are canonicalized; rows are coded with one take().
+        """
+        codes, uniques = pd.factorize(pd.Series(values, copy=False), sort=False)
+        ids = np.fromiter((self.intern(value) for value in uniques), dtype=np.int32, count=len(uniques))
+        # Code -1 (missing) picks the MISSING_ID appended at the end
+        return np.append(ids, np.int32(MISSING_ID))[codes]
+
+    def decode(self, ids) -> np.ndarray:
+        """Display name per id (object array); None for MISSING_ID, NaN or unknown ids"""
+        names = np.array(self._names + [None], dtype=object)
+        ids = pd.Series(ids, copy=False).fillna(MISSING_ID).values.astype(np.int64)
+        # Out-of-range ids pick the None appended at the end
+        return names[np.where((ids >= 0) & (ids < len(names) - 1), ids, len(names) - 1)]
+
+    def display_name(self, entity_id: int) -> Optional[str]:
+        if 0 <= entity_id < len(self._names):
+            return self._names[entity_id]
+        return None
+
+    def is_seeded(self, entity_id: int) -> bool:
+        """True for entities registered with add() (e.g. configured agencies)"""
+        return entity_id in self._seeded_ids
+
+
+def _build_dictionaries() -> Dict[str, EntityDictionary]:
+    dictionaries = {
+        'agency': EntityDictionary('agency'),
+        'cluster': EntityDictionary('cluster'),
+        'site': EntityDictionary('site'),
+        'vehicle': EntityDictionary('vehicle', canonicalize=canonical_vehicle),
+    }
+    for key, display_name in AGENCY_DISPLAY_NAMES.items():
+        # The display name is an alias too, so labelled outputs intern back to the same agency
+        dictionaries['agency'].add(key, display_name, [display_name, *AGENCY_ALIASES.get(key, ())])
+    return dictionaries
+
+
+_dictionaries = _build_dictionaries()
+
+
+def get_entity_dictionary(kind: str) -> EntityDictionary:
+    """The shared dictionary for 'agency', 'cluster', 'site' or 'vehicle'"""
+    return _dictionaries[kind]
+
+
+def code_column(kind: str) -> str:
+    return f"{kind}{CODE_SUFFIX}"
+
+
+def entity_column(df: pd.DataFrame, kind: str) -> Optional[str]:
+    """First column of df holding this kind of entity"""
+    return next((col for col in ENTITY_COLUMNS[kind] if col in df.columns), None)
+
+
+def add_entity_codes(df: pd.DataFrame, kinds: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    Add integer code columns (agency_id, cluster_id, site_id, vehicle_id) in place.
+
+    Each code is taken from the first matching column in ENTITY_COLUMNS; kinds
+    without a column are skipped.
+    """
+    for kind in kinds or ENTITY_COLUMNS:
+        col = entity_column(df, kind)
+        if col is not None:
+            df[code_column(kind)] = get_entity_dictionary(kind).encode(df[col])
+    return df
+
+
+def drop_entity_codes(df: pd.DataFrame) -> pd.DataFrame:
+    """df without its integer code columns, for frames that leave the process"""
+    codes = [code_column(kind) for kind in ENTITY_COLUMNS if code_column(kind) in df.columns]
+    return df.drop(columns=codes) if codes else df
+
+
+def entity_mask(df: pd.DataFrame, kind: str, values: Iterable, column: Optional[str] = None) -> pd.Series:
+    """
+    Boolean mask of rows whose entity is one of values.
+
+    Uses the integer code column when present, else encodes the raw column here
+    (e.g. for frames that came back from the browser without their codes).
+    """
+    dictionary = get_entity_dictionary(kind)
+    ids = dictionary.ids_for(values)
+    code_col = code_column(kind)
+    if code_col in df.columns:
+        return df[code_col].isin(ids)
+    column = column or entity_column(df, kind)
+    if column is None:
+        return pd.Series(True, index=df.index)
+    return pd.Series(np.isin(dictionary.encode(df[column]), ids), index=df.index)
+
+
+def join_on_entity(left: pd.DataFrame, right: pd.DataFrame, kind: str, left_on: str, right_on: str,
+                   how: str = 'inner') -> pd.DataFrame:
+    """Merge two frames on the interned id of an entity column (an integer hash join)"""
+    dictionary = get_entity_dictionary(kind)
+    key = f"_{code_column(kind)}_key"
+    left_keyed = left.assign(**{key: dictionary.encode(left[left_on])})
+    right_keyed = right.assign(**{key: dictionary.encode(right[right_on])})
+    left_keyed = left_keyed[left_keyed[key] != MISSING_ID]
+    right_keyed = right_keyed[right_keyed[key] != MISSING_ID]
+    return left_keyed.merge(right_keyed, on=key, how=how).drop(columns=key)
+
+
+def display_name(kind: str, entity_id: int) -> Optional[str]:
+    """Display name for an id"""
+    return get_entity_dictionary(kind).display_name(entity_id)
+
+
+def is_configured_agency(value) -> bool:
+    """True if value is a spelling of one of the configured agencies"""
+    agencies = get_entity_dictionary('agency')
+    entity_id = agencies.lookup(value)
+    return entity_id is not None and agencies.is_seeded(entity_id)
+
+
+def agency_display_name(value):
+    """Full display name of a configured agency for any of its spellings, else the name itself"""
+    agencies = get_entity_dictionary('agency')
+    entity_id = agencies.lookup(value)
+    if entity_id is None or not agencies.is_seeded(entity_id):
+        return value
+    return agencies.display_name(entity_id)
+
+
+__all__ = [
+    'MISSING_ID',
+    'AGENCY_DISPLAY_NAMES',
+    'AGENCY_ALIASES',
+    'ENTITY_COLUMNS',
+    'EntityDictionary',
+    'canonical_name',
+    'canonical_vehicle',
+    'get_entity_dictionary',
+    'code_column',
+    'entity_column',
+    'add_entity_codes',
+    'drop_entity_codes',
+    'entity_mask',
+    'join_on_entity',
+    'display_name',
+    'is_configured_agency',
+    'agency_display_name'
+]
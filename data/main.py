@@ -1,13 +1,39 @@
-# main.py - Complete Cloud Function for Weighbridge Processing + Viz CSV Generation (Multi-Path)
+# main.py - Complete Cloud Function for Weighbridge Processing + Viz CSV Generation (Multi-Path, Sharded)
 import json
 import pandas as pd
-from google.cloud import storage
+import numpy as np
 import io
 import logging
 from typing import Dict, Any, List
 from datetime import datetime
-import functions_framework
 import base64
+import gzip
+import hashlib
+from collections import Counter
+import os
+import random
+import re
+import threading
+import time
+
+from storage_backend import GCSBackend, ObjectNotFound, PreconditionFailed, StorageBackend
+from entities import join_on_entity
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import functions_framework
+except ImportError:  # Off-cloud use (replay_benchmark.py, local runs) without the Functions runtime
+    functions_framework = None
+
+def _cloud_event_entry(func):
+    return functions_framework.cloud_event(func) if functions_framework else func
+
+def _http_entry(func):
+    return functions_framework.http(func) if functions_framework else func
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -31,6 +57,60 @@ CSV_PATHS = {
 MAPPING_CSV = "csv_outputs/data/mapping.csv"  # Path to mapping CSV
 VIZ_CSV = "csv_outputs/data/viz.csv"  # Output visualization CSV
 
+# Append-only shard layout: one object per processed JSON file, partitioned by day/hour
+#   csv_outputs/data/shards/<source_key>/date=YYYY-MM-DD/hour=HH/<event_digest>.csv[.gz]
+# The compaction job merges a finished day into date=YYYY-MM-DD/part-00000.csv[.gz]
+SHARD_ROOT = "csv_outputs/data/shards"
+SOURCE_KEYS = {
+    "Saurashtra_Enviro_Projects_Pvt._Ltd.": "saurashtra",
+    "Tharuni": "tharuni"
+}
+COMPACTED_SHARD_NAME = "part-00000.csv"
+PROCESSED_MARKER_ROOT = "csv_outputs/data/_processed"
+
+# Compression of CSV objects written by this function: gzip (default), zstd or none.
+# Readers detect the codec from the object's bytes, so mixed histories stay readable.
+CSV_COMPRESSION = os.environ.get('WEIGHBRIDGE_CSV_COMPRESSION', 'gzip').lower()
+CSV_COMPRESSION_SUFFIXES = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+CSV_CONTENT_TYPES = {'none': 'text/csv', 'gzip': 'application/gzip', 'zstd': 'application/zstd'}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 9
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Optimistic concurrency: every read-modify-write is conditioned on the generation
+# that was read, and retried with exponential backoff + full jitter on conflict.
+# Shards and markers are create-only (if_generation_match=0). Together these let
+# several function instances process events in parallel.
+WRITE_RETRY_ATTEMPTS = 8
+WRITE_RETRY_BASE_DELAY = 0.05
+WRITE_RETRY_MAX_DELAY = 2.0
+
+if CSV_COMPRESSION == 'zstd' and zstandard is None:
+    CSV_COMPRESSION = 'gzip'
+elif CSV_COMPRESSION not in CSV_COMPRESSION_SUFFIXES:
+    CSV_COMPRESSION = 'gzip'
+
+# viz rows partitioned by ticket date, plus a manifest of the mapping generation used
+VIZ_PARTITION_ROOT = "csv_outputs/data/viz/"
+VIZ_MANIFEST = "csv_outputs/data/viz/_manifest.json"
+
+NUMERIC_COLUMNS = ['first_weight', 'second_weight', 'net_weight', 'net_weight_calculated']
+
+# Expected fields from weighbridge JSON (based on user's format)
+WEIGHBRIDGE_FIELDS = [
+    'date', 'time', 'site_name', 'agency_name', 'material', 'ticket_no',
+    'vehicle_no', 'transfer_party_name', 'first_weight', 'first_timestamp',
+    'second_weight', 'second_timestamp', 'net_weight', 'material_type',
+    'first_front_image', 'first_back_image', 'second_front_image',
+    'second_back_image', 'site_incharge', 'user_name', 'cloud_upload_timestamp',
+    'record_status', 'net_weight_calculated'
+]
+LOGGED_RECORDS_PER_FILE = 5
+DEDUP_COLUMNS = ['ticket_no', 'cloud_upload_timestamp']
+# Read as text wherever stored records are loaded, so dedup keys hash the same values as at ingest
+KEY_COLUMN_DTYPES = {col: str for col in DEDUP_COLUMNS + ['_source_file']}
+
 def get_source_from_path(file_path: str) -> str:
     """
     Determine which source/company the file belongs to based on its path.
@@ -46,79 +126,306 @@ def get_source_from_path(file_path: str) -> str:
             return prefix
     return None
 
-@functions_framework.cloud_event
+def get_shard_prefix(source: str) -> str:
+    """Object prefix holding all shards for a source."""
+    return f"{SHARD_ROOT}/{SOURCE_KEYS[source]}/"
+
+def build_shard_path(source: str, json_file_path: str, generation: str = None,
+                     received_at: datetime = None) -> str:
+    """
+    Build the shard object name for one processed JSON file.
+
+    The name is derived from the JSON path and its object generation, so a
+    redelivered notification maps onto the same shard instead of a new one.
+    """
+    received_at = received_at or datetime.utcnow()
+    return (f"{get_shard_prefix(source)}date={received_at.strftime('%Y-%m-%d')}/"
+            f"hour={received_at.strftime('%H')}/{csv_object_name(object_digest(json_file_path, generation) + '.csv')}")
+
+def object_digest(json_file_path: str, generation: str = None) -> str:
+    """Stable short key for one generation of an uploaded JSON object."""
+    return hashlib.sha1(f"{json_file_path}#{generation or ''}".encode('utf-8')).hexdigest()[:20]
+
+def get_processed_marker_path(source: str, json_file_path: str, generation: str = None) -> str:
+    """Marker object recording that one object generation has been ingested."""
+    return f"{PROCESSED_MARKER_ROOT}/{SOURCE_KEYS[source]}/{object_digest(json_file_path, generation)}"
+
+def is_already_processed(backend: StorageBackend, source: str, json_file_path: str, generation: str = None) -> bool:
+    return backend.exists(get_processed_marker_path(source, json_file_path, generation))
+
+def mark_processed(backend: StorageBackend, source: str, json_file_path: str, generation: str,
+                   shard_path: str):
+    """Create the processed marker; an existing marker (a concurrent redelivery) is left alone."""
+    marker = {'object': json_file_path, 'generation': generation, 'shard': shard_path}
+    try:
+        backend.write_text(get_processed_marker_path(source, json_file_path, generation),
+                           json.dumps(marker), content_type='application/json', if_generation_match=0)
+    except PreconditionFailed:
+        logger.info(f"⏭️  Processed marker already exists for {json_file_path}")
+
+_SHARD_PATTERN = re.compile(r"date=(\d{4}-\d{2}-\d{2})/(?:hour=(\d{2})/)?[^/]+\.csv(?:\.gz|\.zst)?$")
+
+def parse_shard_path(shard_path: str):
+    """
+    Extract partition info from a shard name.
+
+    Returns:
+        (day, hour) tuple - hour is None for compacted day files - or None if not a shard
+    """
+    match = _SHARD_PATTERN.search(shard_path)
+    if not match:
+        return None
+    return match.group(1), match.group(2)
+
+def list_source_shards(backend: StorageBackend, source: str) -> List[str]:
+    """
+    List shard names for a source in read order: per day, the compacted file
+    first and then the hourly event shards, so later rows win on dedup.
+    """
+    shards = []
+    for obj in backend.list_objects(prefix=get_shard_prefix(source)):
+        partition = parse_shard_path(obj.name)
+        if partition:
+            day, hour = partition
+            shards.append(((day, hour is not None, hour or '', obj.name), obj.name))
+    return [name for _, name in sorted(shards)]
+
+def csv_object_name(name: str) -> str:
+    """Object name for a CSV written with the configured compression."""
+    return name + CSV_COMPRESSION_SUFFIXES[CSV_COMPRESSION]
+
+def csv_name_variants(name: str) -> List[str]:
+    """Plain and compressed object names a CSV may have been written under."""
+    return [name + suffix for suffix in dict.fromkeys(CSV_COMPRESSION_SUFFIXES.values())]
+
+def encode_csv(df: pd.DataFrame) -> bytes:
+    """Serialize a DataFrame to CSV, compressing while it is written."""
+    if CSV_COMPRESSION == 'none':
+        return df.to_csv(index=False).encode('utf-8')
+
+    buffer = io.BytesIO()
+    if CSV_COMPRESSION == 'zstd':
+        raw = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(buffer, closefd=False)
+    else:
+        raw = gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=GZIP_LEVEL, mtime=0)
+
+    with io.TextIOWrapper(raw, encoding='utf-8', newline='') as text:
+        df.to_csv(text, index=False)
+    return buffer.getvalue()
+
+def write_csv_object(backend: StorageBackend, name: str, df: pd.DataFrame, **kwargs) -> int:
+    """Write a DataFrame as a (compressed) CSV object; returns the new generation."""
+    return backend.write_bytes(name, encode_csv(df), content_type=CSV_CONTENT_TYPES[CSV_COMPRESSION], **kwargs)
+
+def read_csv_blob(backend: StorageBackend, blob_name: str, **kwargs) -> pd.DataFrame:
+    """Read a plain, gzip or zstd CSV object into a DataFrame (kwargs go to pd.read_csv)."""
+    return parse_csv_bytes(backend.read_bytes(blob_name), blob_name, **kwargs)
+
+def read_source_shard(backend: StorageBackend, blob_name: str) -> pd.DataFrame:
+    """
+    Read a source record CSV with the key columns kept as text.
+
+    Without this, pd.read_csv would infer ticket "00123" as 123, so keys hashed
+    after a re-read (rebuild, resume, compaction) would not match the ones
+    hashed at ingest.
+    """
+    return read_csv_blob(backend, blob_name, dtype=KEY_COLUMN_DTYPES)
+
+def parse_csv_bytes(data: bytes, blob_name: str = '', **kwargs) -> pd.DataFrame:
+    """Parse plain, gzip or zstd CSV bytes."""
+    if data.startswith(GZIP_MAGIC):
+        return pd.read_csv(io.BytesIO(data), compression='gzip', **kwargs)
+    if data.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise ImportError(f"zstandard is required to read {blob_name}")
+        return pd.read_csv(zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)), **kwargs)
+    return pd.read_csv(io.BytesIO(data), **kwargs)
+
+class ConcurrentUpdateError(Exception):
+    """Raised when an object keeps changing underneath a read-modify-write."""
+
+def retry_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(WRITE_RETRY_MAX_DELAY, WRITE_RETRY_BASE_DELAY * (2 ** attempt)))
+
+def update_object(backend: StorageBackend, name: str, update_fn, content_type: str,
+                  attempts: int = WRITE_RETRY_ATTEMPTS):
+    """
+    Read-modify-write an object under a generation precondition.
+
+    Args:
+        update_fn: Called as update_fn(current_bytes_or_None, generation) and returns
+                   the new bytes, or None when nothing needs writing
+        
+    Returns:
+        New generation, or None if update_fn decided not to write
+    """
+    for attempt in range(attempts):
+        try:
+            try:
+                data, generation = backend.read_with_generation(name)
+            except ObjectNotFound:
+                data, generation = None, 0
+
+            new_data = update_fn(data, generation)
+            if new_data is None:
+                return None
+            return backend.write_bytes(name, new_data, content_type=content_type,
+                                       if_generation_match=generation)
+        except PreconditionFailed:
+            delay = retry_delay(attempt)
+            logger.info(f"🔁 {name} changed concurrently, retrying in {delay:.2f}s ({attempt + 1}/{attempts})")
+            time.sleep(delay)
+
+    raise ConcurrentUpdateError(f"Gave up updating {name} after {attempts} conflicting attempts")
+
+def update_csv_object(backend: StorageBackend, name: str, merge_fn):
+    """
+    Read-modify-write a CSV object; merge_fn(df_current_or_None, generation) returns
+    the DataFrame to store (or None to leave the object alone).
+    """
+    def update(data, generation):
+        df_current = parse_csv_bytes(data, name, dtype=KEY_COLUMN_DTYPES) if data is not None else None
+        df = merge_fn(df_current, generation)
+        return None if df is None else encode_csv(df)
+
+    return update_object(backend, name, update, CSV_CONTENT_TYPES[CSV_COMPRESSION])
+
+def drop_duplicate_records(df: pd.DataFrame) -> pd.DataFrame:
+    """Drop repeated tickets, keeping the most recently written row."""
+    if all(col in df.columns for col in DEDUP_COLUMNS):
+        return df[~df.duplicated(subset=DEDUP_COLUMNS, keep='last')]
+    if '_source_file' in df.columns:
+        return df.drop_duplicates(subset=['_source_file'], keep='last')
+    return df
+
+def load_source_dataframe(backend: StorageBackend, source: str) -> pd.DataFrame:
+    """
+    Assemble the full record set for a source from its shards.
+
+    The legacy single-file CSV (written before sharding) is read first when present.
+    """
+    frames = []
+
+    legacy_csv = CSV_PATHS.get(source)
+    if legacy_csv and backend.exists(legacy_csv):
+        frames.append(read_source_shard(backend, legacy_csv))
+
+    for shard_name in list_source_shards(backend, source):
+        frames.append(read_source_shard(backend, shard_name))
+
+    if not frames:
+        return pd.DataFrame()
+
+    df = pd.concat(frames, ignore_index=True, sort=False)
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+
+    return drop_duplicate_records(df)
+
+@_cloud_event_entry
 def process_new_json_file(cloud_event):
     """
     Cloud Function triggered by Pub/Sub notification from GCS.
     Processes new weighbridge JSON files from multiple sources and updates viz.csv.
     """
     try:
-        # Parse Pub/Sub message from GCS notification
-        if hasattr(cloud_event, 'data') and 'message' in cloud_event.data:
-            # Decode the Pub/Sub message
-            message = cloud_event.data['message']
-            
-            if 'data' in message:
-                # Decode base64 message data
-                message_data = base64.b64decode(message['data']).decode('utf-8')
-                event_data = json.loads(message_data)
-            else:
-                # Use attributes if no data
-                event_data = message.get('attributes', {})
-        else:
-            # Fallback for direct event
-            event_data = cloud_event.data
+        event_data = parse_cloud_event(cloud_event)
+        return handle_storage_event(event_data, GCSBackend.from_bucket_name(BUCKET_NAME))
 
-        # Extract file information from GCS notification
-        bucket_name = event_data.get("bucketId", event_data.get("bucket", ""))
-        file_name = event_data.get("objectId", event_data.get("name", ""))
-        event_type = event_data.get("eventType", "unknown")
-        
-        logger.info(f"🔔 Pub/Sub Event triggered: {event_type}")
-        logger.info(f"📁 Bucket: {bucket_name}")
-        logger.info(f"📄 File: {file_name}")
+    except Exception as e:
+        error_msg = f"❌ Error processing event: {str(e)}"
+        logger.error(error_msg)
+        logger.error(f"Event data: {cloud_event.data}")
+        return f"error_{str(e)}"
+
+def parse_cloud_event(cloud_event) -> Dict[str, Any]:
+    """Extract the GCS notification payload from a Pub/Sub or direct cloud event."""
+    # Parse Pub/Sub message from GCS notification
+    if hasattr(cloud_event, 'data') and 'message' in cloud_event.data:
+        # Decode the Pub/Sub message
+        message = cloud_event.data['message']
         
-        # Validate the event
-        if not bucket_name or not file_name:
-            logger.warning("⚠️  Missing bucket or file name in event")
-            return "ignored_invalid_event"
-
-        # Check if this is the correct bucket
-        if bucket_name != BUCKET_NAME:
-            logger.info(f"⏭️  Ignoring event from different bucket: {bucket_name}")
-            return "ignored_different_bucket"
-
-        # Check if file is in any of our watch paths
-        source = get_source_from_path(file_name)
-        if not source:
-            logger.info(f"⏭️  Ignoring file outside watch paths: {file_name}")
-            logger.info(f"📋 Monitored paths: {WATCH_PREFIXES}")
-            return "ignored_outside_watch_paths"
-
-        # Only process JSON files
-        if not file_name.endswith('.json'):
-            logger.info(f"⏭️  Ignoring non-JSON file: {file_name}")
-            return "ignored_non_json"
-
-        # Skip temporary files and system files
-        if '/.tmp' in file_name or file_name.endswith('.tmp'):
-            logger.info(f"⏭️  Ignoring temporary file: {file_name}")
-            return "ignored_temp_file"
+        if 'data' in message:
+            # Decode base64 message data
+            message_data = base64.b64decode(message['data']).decode('utf-8')
+            event_data = json.loads(message_data)
+        else:
+            # Use attributes if no data
+            event_data = message.get('attributes', {})
+    else:
+        # Fallback for direct event
+        event_data = cloud_event.data
+    
+    return event_data
 
-        logger.info(f"✅ Processing weighbridge JSON file from {source}: {file_name}")
+def classify_storage_event(event_data: Dict[str, Any]):
+    """
+    Validate a GCS notification and work out what it refers to.
 
-        # Initialize GCS client
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
+    Returns:
+        (None, file_name, source, generation) for a weighbridge JSON upload, or
+        (ignored_status, file_name, None, generation) for anything else
+    """
+    # Extract file information from GCS notification
+    bucket_name = event_data.get("bucketId", event_data.get("bucket", ""))
+    file_name = event_data.get("objectId", event_data.get("name", ""))
+    generation = str(event_data.get("generation", event_data.get("objectGeneration", "")))
+
+    # Validate the event
+    if not bucket_name or not file_name:
+        logger.warning("⚠️  Missing bucket or file name in event")
+        return "ignored_invalid_event", file_name, None, generation
+
+    # Check if this is the correct bucket
+    if bucket_name != BUCKET_NAME:
+        logger.info(f"⏭️  Ignoring event from different bucket: {bucket_name}")
+        return "ignored_different_bucket", file_name, None, generation
 
-        # Process the JSON file and append to the appropriate CSV
-        result = append_weighbridge_json_to_csv(bucket, file_name, source)
+    # Check if file is in any of our watch paths
+    source = get_source_from_path(file_name)
+    if not source:
+        logger.info(f"⏭️  Ignoring file outside watch paths: {file_name}")
+        logger.info(f"📋 Monitored paths: {WATCH_PREFIXES}")
+        return "ignored_outside_watch_paths", file_name, None, generation
 
-        # After updating source CSV, update viz.csv with combined data
-        if "success" in result or "appended" in result:
-            logger.info("📊 Updating viz.csv with combined data from all sources...")
-            viz_result = update_viz_csv_combined(bucket)
-            logger.info(f"📈 Viz CSV update result: {viz_result}")
+    # Only process JSON files
+    if not file_name.endswith('.json'):
+        logger.info(f"⏭️  Ignoring non-JSON file: {file_name}")
+        return "ignored_non_json", file_name, None, generation
+
+    # Skip temporary files and system files
+    if '/.tmp' in file_name or file_name.endswith('.tmp'):
+        logger.info(f"⏭️  Ignoring temporary file: {file_name}")
+        return "ignored_temp_file", file_name, None, generation
+
+    return None, file_name, source, generation
+
+def handle_storage_event(event_data: Dict[str, Any], backend: StorageBackend) -> str:
+    """
+    Process one GCS object notification against a storage backend.
+    
+    Args:
+        event_data: Decoded notification (bucketId/objectId/generation...)
+        backend: Storage backend holding the bucket contents
+        
+    Returns:
+        Status string (success_..., ignored_... or error_...)
+    """
+    try:
+        logger.info(f"🔔 Pub/Sub Event triggered: {event_data.get('eventType', 'unknown')}")
+        logger.info(f"📁 Bucket: {event_data.get('bucketId', event_data.get('bucket', ''))}")
+        logger.info(f"📄 File: {event_data.get('objectId', event_data.get('name', ''))}")
+
+        ignored, file_name, source, generation = classify_storage_event(event_data)
+        if ignored:
+            return ignored
+
+        logger.info(f"✅ Processing weighbridge JSON file from {source}: {file_name}")
+
+        # Append the JSON file as a shard and merge only its records into the viz partitions
+        result, _ = ingest_weighbridge_json(backend, file_name, source, generation, update_viz=True)
 
         logger.info(f"🎉 Successfully processed {file_name}: {result}")
         return f"success_{result}"
@@ -126,7 +433,7 @@ def process_new_json_file(cloud_event):
     except Exception as e:
         error_msg = f"❌ Error processing event: {str(e)}"
         logger.error(error_msg)
-        logger.error(f"Event data: {cloud_event.data}")
+        logger.error(f"Event data: {event_data}")
         return f"error_{str(e)}"
 
 def process_weighbridge_json(data: Dict[str, Any]) -> Dict[str, Any]:
@@ -140,16 +447,7 @@ def process_weighbridge_json(data: Dict[str, Any]) -> Dict[str, Any]:
         Processed dictionary ready for CSV
     """
     processed_data = {}
-    
-    # Expected fields from weighbridge JSON (based on user's format)
-    expected_fields = [
-        'date', 'time', 'site_name', 'agency_name', 'material', 'ticket_no',
-        'vehicle_no', 'transfer_party_name', 'first_weight', 'first_timestamp',
-        'second_weight', 'second_timestamp', 'net_weight', 'material_type',
-        'first_front_image', 'first_back_image', 'second_front_image', 
-        'second_back_image', 'site_incharge', 'user_name', 'cloud_upload_timestamp',
-        'record_status', 'net_weight_calculated'
-    ]
+    expected_fields = WEIGHBRIDGE_FIELDS
     
     # Process each expected field
     for field in expected_fields:
@@ -157,7 +455,7 @@ def process_weighbridge_json(data: Dict[str, Any]) -> Dict[str, Any]:
             value = data[field]
             
             # Handle numeric fields (weights)
-            if field in ['first_weight', 'second_weight', 'net_weight', 'net_weight_calculated']:
+            if field in NUMERIC_COLUMNS:
                 try:
                     if value is not None and str(value).strip():
                         # Remove commas and convert to float
@@ -173,7 +471,7 @@ def process_weighbridge_json(data: Dict[str, Any]) -> Dict[str, Any]:
                 processed_data[field] = str(value).strip() if value is not None else ""
         else:
             # Add missing fields with default values
-            if field in ['first_weight', 'second_weight', 'net_weight', 'net_weight_calculated']:
+            if field in NUMERIC_COLUMNS:
                 processed_data[field] = 0
             else:
                 processed_data[field] = ""
@@ -186,373 +484,975 @@ def process_weighbridge_json(data: Dict[str, Any]) -> Dict[str, Any]:
     
     return processed_data
 
-def append_weighbridge_json_to_csv(bucket, json_file_path: str, source: str) -> str:
+def normalize_weighbridge_records(items: List[Dict[str, Any]]) -> pd.DataFrame:
     """
-    Process a weighbridge JSON file and append its data to the appropriate source CSV.
+    Vectorized equivalent of process_weighbridge_json for a whole list payload.
+
+    Builds the columns once, then coerces weights and fills defaults per column
+    instead of per record. Unknown fields are kept and reported in one summary line.
     
     Args:
-        bucket: GCS bucket object
+        items: Weighbridge records (dicts) from one JSON payload
+        
+    Returns:
+        DataFrame with the expected fields first, then any additional fields
+    """
+    # One object column per field, built without type inference: from_records would
+    # upcast integers with gaps to float and turn ticket 123 into '123.0'
+    fields = list(dict.fromkeys(field for item in items for field in item))
+    columns = {field: pd.Series([item.get(field) for item in items], dtype=object) for field in fields}
+    n_rows = len(items)
+
+    normalized = {}
+    for field in WEIGHBRIDGE_FIELDS:
+        if field not in columns:
+            normalized[field] = np.zeros(n_rows, dtype=np.int64) if field in NUMERIC_COLUMNS else np.full(n_rows, '', dtype=object)
+            continue
+
+        column = columns[field]
+        present = column.notna()
+        if field in NUMERIC_COLUMNS:
+            text = column.astype(str).str.replace(',', '', regex=False).str.strip()
+            values = pd.to_numeric(text.where(present & (text != ''), None), errors='coerce')
+            invalid = int((values.isna() & present & (text != '')).sum())
+            if invalid:
+                logger.warning(f"⚠️  {invalid} invalid numeric values for {field} set to 0")
+            values = values.fillna(0)
+            # Whole-number columns stay integers, as the per-record path produced
+            if (values % 1 == 0).all():
+                values = values.astype(np.int64)
+            normalized[field] = values.values
+        else:
+            normalized[field] = column.astype(str).str.strip().where(present, '').values
+
+    extra_fields = Counter()
+    for field, column in columns.items():
+        if field not in WEIGHBRIDGE_FIELDS:
+            extra_fields[field] = int(column.notna().sum())
+            normalized[field] = column.astype(str).where(column.notna(), '').values
+
+    if extra_fields:
+        logger.info(f"📝 Additional fields found (records per field): {dict(extra_fields)}")
+
+    return pd.DataFrame(normalized, columns=list(normalized))
+
+def extract_weighbridge_records(backend: StorageBackend, json_file_path: str, source: str) -> pd.DataFrame:
+    """
+    Read a weighbridge JSON file and normalize its records into a DataFrame.
+
+    Args:
+        backend: Storage backend (GCS bucket or local stand-in)
+        json_file_path: Path to the JSON file
+        source: Source company/prefix
+
+    Returns:
+        DataFrame of processed records (empty if nothing could be extracted)
+    """
+    # Read the JSON file
+    logger.info(f"📖 Reading weighbridge JSON file from {source}: {json_file_path}")
+    if not backend.exists(json_file_path):
+        raise FileNotFoundError(f"JSON file not found: {json_file_path}")
+
+    json_content = backend.read_text(json_file_path)
+    json_data = json.loads(json_content)
+
+    # Process JSON data into weighbridge records
+    if isinstance(json_data, (list, dict)):
+        # A list of weighbridge records, or a single record
+        items = json_data if isinstance(json_data, list) else [json_data]
+        records = [item for item in items if isinstance(item, dict)]
+        skipped = Counter(type(item).__name__ for item in items if not isinstance(item, dict))
+        if skipped:
+            logger.warning(f"⚠️  Skipping non-dict items in JSON list: {dict(skipped)}")
+        if not records:
+            return pd.DataFrame()
+
+        df_new = normalize_weighbridge_records(records)
+        df_new['_source_file'] = json_file_path
+        df_new['_source_company'] = source
+        df_new['_processed_timestamp'] = datetime.now().isoformat()
+    else:
+        # Handle unexpected JSON structure
+        logger.warning(f"⚠️  Unexpected JSON structure: {type(json_data)}")
+        df_new = pd.DataFrame([{
+            'date': '',
+            'time': '',
+            'site_name': '',
+            'agency_name': '',
+            'material': '',
+            'ticket_no': '',
+            'vehicle_no': '',
+            'transfer_party_name': '',
+            'first_weight': 0,
+            'first_timestamp': '',
+            'second_weight': 0,
+            'second_timestamp': '',
+            'net_weight': 0,
+            'material_type': '',
+            'first_front_image': '',
+            'first_back_image': '',
+            'second_front_image': '',
+            'second_back_image': '',
+            'site_incharge': '',
+            'user_name': '',
+            'cloud_upload_timestamp': '',
+            'record_status': '',
+            'net_weight_calculated': 0,
+            'raw_data': str(json_data),
+            '_source_file': json_file_path,
+            '_source_company': source,
+            '_processed_timestamp': datetime.now().isoformat()
+        }])
+
+    logger.info(f"📊 Extracted {len(df_new)} weighbridge records from {source} JSON")
+
+    # Log details of the first few records (bulk backfills would otherwise log every ticket)
+    for i, record in enumerate(df_new.head(LOGGED_RECORDS_PER_FILE).to_dict('records')):
+        ticket_no = record.get('ticket_no', 'Unknown')
+        vehicle_no = record.get('vehicle_no', 'Unknown')
+        site_name = record.get('site_name', 'Unknown')
+        net_weight = record.get('net_weight', 0)
+        logger.info(f"   Record {i+1}: Ticket {ticket_no}, Vehicle {vehicle_no}, Site {site_name}, Net Weight {net_weight}kg")
+    if len(df_new) > LOGGED_RECORDS_PER_FILE:
+        logger.info(f"   ... and {len(df_new) - LOGGED_RECORDS_PER_FILE} more records")
+
+    # Duplicates inside this file; cross-file duplicates are dropped on read and at compaction
+    return drop_duplicate_records(df_new)
+
+def write_source_shard(backend: StorageBackend, shard_path: str, df_new: pd.DataFrame) -> bool:
+    """
+    Write new records as one shard object - proportional to the records only.
+
+    Shards are create-only; returns False if another instance already wrote it.
+    """
+    logger.info(f"💾 Writing {len(df_new)} records to shard {shard_path}")
+    try:
+        write_csv_object(backend, shard_path, df_new, if_generation_match=0)
+    except PreconditionFailed:
+        logger.info(f"⏭️  Shard {shard_path} was written concurrently")
+        return False
+    logger.info(f"✅ Successfully appended shard {shard_path}")
+    return True
+
+def ingest_weighbridge_json(backend: StorageBackend, json_file_path: str, source: str,
+                            generation: str = None, update_viz: bool = False):
+    """
+    Append one weighbridge JSON file as a shard and return the new records.
+
+    Steps run in the order shard -> viz -> key index -> processed marker, and
+    each is idempotent, so a delivery that crashed part-way is completed by the
+    redelivery instead of losing records.
+
+    Returns:
+        (status, df_new) - df_new is empty when nothing was appended
+    """
+    if source not in SOURCE_KEYS:
+        raise ValueError(f"No shard location configured for source: {source}")
+
+    if is_already_processed(backend, source, json_file_path, generation):
+        logger.info(f"⏭️  Already ingested {json_file_path} (generation {generation})")
+        return f"already_appended_{source}", pd.DataFrame()
+
+    shard_path = build_shard_path(source, json_file_path, generation)
+    if backend.exists(shard_path):
+        # An earlier delivery wrote the shard but did not finish
+        logger.info(f"🔁 Resuming ingestion of {json_file_path} from {shard_path}")
+        df_new = read_source_shard(backend, shard_path)
+    else:
+        df_new = extract_weighbridge_records(backend, json_file_path, source)
+        if df_new.empty:
+            logger.warning(f"⚠️  No records extracted from {json_file_path}")
+            return "no_records_extracted", df_new
+
+        df_new = drop_indexed_duplicates(backend, source, df_new)
+        if df_new.empty:
+            mark_processed(backend, source, json_file_path, generation, '')
+            return f"duplicate_records_only_{source}", df_new
+
+        if not write_source_shard(backend, shard_path, df_new):
+            df_new = read_source_shard(backend, shard_path)
+
+    if update_viz:
+        logger.info("📊 Updating viz partitions with the new records...")
+        viz_result = update_viz_incremental(backend, df_new)
+        logger.info(f"📈 Viz update result: {viz_result}")
+        if viz_result.startswith('viz_update_failed'):
+            # Leave the marker unwritten so a redelivery retries the viz merge
+            return f"appended_{len(df_new)}_records_viz_pending_for_{source}", df_new
+
+    add_to_key_index(backend, source, df_new)
+    mark_processed(backend, source, json_file_path, generation, shard_path)
+
+    # Show sample of new data added
+    sample_record = df_new.iloc[0]
+    logger.info(f"📋 Sample new {source} record:")
+    logger.info(f"   - Date: {sample_record.get('date', 'N/A')}")
+    logger.info(f"   - Ticket: {sample_record.get('ticket_no', 'N/A')}")
+    logger.info(f"   - Vehicle: {sample_record.get('vehicle_no', 'N/A')}")
+    logger.info(f"   - Site: {sample_record.get('site_name', 'N/A')}")
+    logger.info(f"   - Net Weight: {sample_record.get('net_weight', 0)}kg")
+
+    return f"appended_{len(df_new)}_records_to_shard_for_{source}", df_new
+
+def append_weighbridge_json_to_csv(backend: StorageBackend, json_file_path: str, source: str, generation: str = None) -> str:
+    """
+    Process a weighbridge JSON file and append its records as a new shard for the source.
+
+    Only the new records are written - existing history is never read or rewritten.
+
+    Args:
+        backend: Storage backend (GCS bucket or local stand-in)
         json_file_path: Path to the JSON file
         source: Source company/prefix (e.g., "Tharuni" or "Saurashtra_Enviro_Projects_Pvt._Ltd.")
-        
+        generation: GCS generation of the JSON object (makes redeliveries idempotent)
+
     Returns:
         Status message about what was done
     """
     try:
-        # Get the target CSV path for this source
-        target_csv = CSV_PATHS.get(source)
-        if not target_csv:
-            raise ValueError(f"No CSV path configured for source: {source}")
-        
-        # Read the JSON file
-        logger.info(f"📖 Reading weighbridge JSON file from {source}: {json_file_path}")
-        json_blob = bucket.blob(json_file_path)
-        
-        if not json_blob.exists():
-            raise FileNotFoundError(f"JSON file not found: {json_file_path}")
-        
-        json_content = json_blob.download_as_text()
-        json_data = json.loads(json_content)
-        
-        # Process JSON data into weighbridge records
-        new_records = []
-        
-        if isinstance(json_data, list):
-            # If JSON contains a list of weighbridge records
-            for item in json_data:
-                if isinstance(item, dict):
-                    processed_item = process_weighbridge_json(item)
-                    processed_item['_source_file'] = json_file_path
-                    processed_item['_source_company'] = source
-                    processed_item['_processed_timestamp'] = datetime.now().isoformat()
-                    new_records.append(processed_item)
-                else:
-                    logger.warning(f"⚠️  Skipping non-dict item in JSON list: {type(item)}")
-        elif isinstance(json_data, dict):
-            # If JSON contains a single weighbridge record
-            processed_item = process_weighbridge_json(json_data)
-            processed_item['_source_file'] = json_file_path
-            processed_item['_source_company'] = source
-            processed_item['_processed_timestamp'] = datetime.now().isoformat()
-            new_records.append(processed_item)
-        else:
-            # Handle unexpected JSON structure
-            logger.warning(f"⚠️  Unexpected JSON structure: {type(json_data)}")
-            new_records.append({
-                'date': '',
-                'time': '',
-                'site_name': '',
-                'agency_name': '',
-                'material': '',
-                'ticket_no': '',
-                'vehicle_no': '',
-                'transfer_party_name': '',
-                'first_weight': 0,
-                'first_timestamp': '',
-                'second_weight': 0,
-                'second_timestamp': '',
-                'net_weight': 0,
-                'material_type': '',
-                'first_front_image': '',
-                'first_back_image': '',
-                'second_front_image': '',
-                'second_back_image': '',
-                'site_incharge': '',
-                'user_name': '',
-                'cloud_upload_timestamp': '',
-                'record_status': '',
-                'net_weight_calculated': 0,
-                'raw_data': str(json_data),
-                '_source_file': json_file_path,
-                '_source_company': source,
-                '_processed_timestamp': datetime.now().isoformat()
-            })
-        
-        if not new_records:
-            logger.warning(f"⚠️  No records extracted from {json_file_path}")
-            return "no_records_extracted"
-        
-        logger.info(f"📊 Extracted {len(new_records)} weighbridge records from {source} JSON")
-        
-        # Log details of the weighbridge data being processed
-        for i, record in enumerate(new_records):
-            ticket_no = record.get('ticket_no', 'Unknown')
-            vehicle_no = record.get('vehicle_no', 'Unknown')
-            site_name = record.get('site_name', 'Unknown')
-            net_weight = record.get('net_weight', 0)
-            logger.info(f"   Record {i+1}: Ticket {ticket_no}, Vehicle {vehicle_no}, Site {site_name}, Net Weight {net_weight}kg")
-        
-        # Convert new records to DataFrame
-        df_new = pd.DataFrame(new_records)
-        
-        # Ensure consistent data types for numeric columns
-        numeric_columns = ['first_weight', 'second_weight', 'net_weight', 'net_weight_calculated']
-        for col in numeric_columns:
-            if col in df_new.columns:
-                df_new[col] = pd.to_numeric(df_new[col], errors='coerce').fillna(0)
-        
-        # Check if target CSV exists
-        csv_blob = bucket.blob(target_csv)
-        
-        if csv_blob.exists():
-            logger.info(f"📄 Target CSV exists for {source}, reading: {target_csv}")
-            # Read existing CSV
-            existing_csv_content = csv_blob.download_as_text()
-            df_existing = pd.read_csv(io.StringIO(existing_csv_content))
-            
-            logger.info(f"📊 Existing {source} CSV has {len(df_existing)} rows and {len(df_existing.columns)} columns")
-            
-            # Ensure consistent data types in existing CSV
-            for col in numeric_columns:
-                if col in df_existing.columns:
-                    df_existing[col] = pd.to_numeric(df_existing[col], errors='coerce').fillna(0)
-            
-            # Get all columns that should be in the final CSV
-            all_columns = set(df_existing.columns) | set(df_new.columns)
-            
-            # Add missing columns to both DataFrames with appropriate defaults
-            for col in all_columns:
-                if col not in df_existing.columns:
-                    if col in numeric_columns:
-                        df_existing[col] = 0
-                    else:
-                        df_existing[col] = ""
-                if col not in df_new.columns:
-                    if col in numeric_columns:
-                        df_new[col] = 0
-                    else:
-                        df_new[col] = ""
-            
-            # Reorder columns to match existing CSV structure + new columns at the end
-            existing_column_order = list(df_existing.columns)
-            new_columns = [col for col in df_new.columns if col not in existing_column_order]
-            final_column_order = existing_column_order + new_columns
-            
-            df_existing = df_existing[final_column_order]
-            df_new = df_new[final_column_order]
-            
-            # Combine DataFrames
-            df_combined = pd.concat([df_existing, df_new], ignore_index=True)
-            
-            # Remove duplicates based on ticket_no and timestamp (more specific than just source_file)
-            if 'ticket_no' in df_combined.columns and 'cloud_upload_timestamp' in df_combined.columns:
-                # Check for duplicates by ticket_no and cloud_upload_timestamp
-                duplicate_mask = df_combined.duplicated(subset=['ticket_no', 'cloud_upload_timestamp'], keep='last')
-                if duplicate_mask.any():
-                    duplicates_count = duplicate_mask.sum()
-                    logger.info(f"🔄 Removing {duplicates_count} duplicate records based on ticket_no and timestamp")
-                    df_combined = df_combined[~duplicate_mask]
-            else:
-                # Fallback to source_file deduplication
-                df_combined = df_combined.drop_duplicates(subset=['_source_file'], keep='last')
-            
-            action = f"appended_{len(df_new)}_records_to_existing_{len(df_existing)}_records_for_{source}"
-            
-        else:
-            logger.info(f"📄 Target CSV doesn't exist for {source}, creating new: {target_csv}")
-            
-            # Ensure the csv_outputs/data directory structure exists
-            test_blob = bucket.blob("csv_outputs/data/.keep")
-            if not test_blob.exists():
-                test_blob.upload_from_string("", content_type='text/plain')
-                logger.info("📁 Created csv_outputs/data directory structure")
-            
-            df_combined = df_new
-            action = f"created_new_csv_with_{len(df_new)}_records_for_{source}"
-        
-        # Save updated CSV
-        logger.info(f"💾 Saving {source} CSV with {len(df_combined)} total records")
-        csv_buffer = io.StringIO()
-        df_combined.to_csv(csv_buffer, index=False)
-        
-        # Upload to GCS
-        csv_blob.upload_from_string(
-            csv_buffer.getvalue(),
-            content_type='text/csv'
-        )
-        
-        logger.info(f"✅ Successfully updated {target_csv}")
-        logger.info(f"📈 Final {source} CSV stats:")
-        logger.info(f"   - Total rows: {len(df_combined)}")
-        logger.info(f"   - Total columns: {len(df_combined.columns)}")
-        logger.info(f"   - New records added: {len(df_new)}")
-        
-        # Show sample of new data added
-        if len(df_new) > 0:
-            sample_record = df_new.iloc[0]
-            logger.info(f"📋 Sample new {source} record:")
-            logger.info(f"   - Date: {sample_record.get('date', 'N/A')}")
-            logger.info(f"   - Ticket: {sample_record.get('ticket_no', 'N/A')}")
-            logger.info(f"   - Vehicle: {sample_record.get('vehicle_no', 'N/A')}")
-            logger.info(f"   - Site: {sample_record.get('site_name', 'N/A')}")
-            logger.info(f"   - Net Weight: {sample_record.get('net_weight', 0)}kg")
-        
-        return action
-        
+        status, _ = ingest_weighbridge_json(backend, json_file_path, source, generation)
+        return status
+
     except Exception as e:
         logger.error(f"❌ Error processing {source} weighbridge JSON {json_file_path}: {str(e)}")
         raise
 
-def update_viz_csv_combined(bucket) -> str:
+# ---------------------------------------------------------------------------
+# DEDUP KEY INDEX
+# ---------------------------------------------------------------------------
+# Per source, the 64-bit hashes of every stored (ticket_no, cloud_upload_timestamp)
+# key are kept in KEY_INDEX_BUCKETS sorted binary objects (8 bytes per key).
+# New records only touch the buckets their keys fall into, and buckets are
+# cached in memory by object generation, so checking a batch never loads the
+# record history. The history (legacy CSV and shards) is indexed by a full
+# rebuild, which writes a bootstrap marker when it completes; ingest creates
+# buckets before that, so the marker, not the buckets, says the index is whole.
+
+KEY_INDEX_ROOT = "csv_outputs/data/_keys"
+KEY_INDEX_BUCKETS = 256
+KEY_INDEX_WRITE_ATTEMPTS = WRITE_RETRY_ATTEMPTS
+
+# Instance-level bucket cache: object name -> (generation, sorted uint64 array)
+_key_bucket_cache = {}
+
+def get_key_index_prefix(source: str) -> str:
+    return f"{KEY_INDEX_ROOT}/{SOURCE_KEYS[source]}/"
+
+def get_key_index_marker_path(source: str) -> str:
+    return f"{get_key_index_prefix(source)}_bootstrap.json"
+
+def get_key_bucket_path(source: str, bucket: int) -> str:
+    return f"{get_key_index_prefix(source)}bucket={bucket:03d}.u64"
+
+def compute_record_keys(df: pd.DataFrame) -> pd.Series:
     """
-    Create/update viz.csv by combining data from all source CSVs and joining with mapping.csv
-    
+    64-bit key per record, indexed like df; records without a usable key are left out.
+
+    Uses the dedup columns when present and the source file otherwise, matching
+    drop_duplicate_records.
+    """
+    if all(col in df.columns for col in DEDUP_COLUMNS):
+        key_frame = df[DEDUP_COLUMNS].fillna('').astype(str)
+        usable = key_frame['ticket_no'].str.strip() != ''
+    elif '_source_file' in df.columns:
+        key_frame = df[['_source_file']].fillna('').astype(str)
+        usable = key_frame['_source_file'] != ''
+    else:
+        return pd.Series([], dtype='uint64')
+
+    keys = pd.Series(pd.util.hash_pandas_object(key_frame, index=False).values, index=df.index)
+    return keys[usable.values]
+
+def load_key_bucket(backend: StorageBackend, bucket_path: str):
+    """
+    Load one key bucket, reusing the cached array while its generation is unchanged.
+
+    Returns:
+        (sorted uint64 array, generation) - generation 0 when the bucket does not exist
+    """
+    generation = backend.get_generation(bucket_path)
+    if generation is None:
+        return np.empty(0, dtype=np.uint64), 0
+
+    cached = _key_bucket_cache.get(bucket_path)
+    if cached and cached[0] == generation:
+        return cached[1], generation
+
+    content, generation = backend.read_with_generation(bucket_path)
+    keys = np.frombuffer(content, dtype='<u8').astype(np.uint64)
+    _key_bucket_cache[bucket_path] = (generation, keys)
+    return keys, generation
+
+def _group_keys_by_bucket(keys: pd.Series):
+    return keys.groupby((keys % KEY_INDEX_BUCKETS).astype(int))
+
+def drop_indexed_duplicates(backend: StorageBackend, source: str, df_new: pd.DataFrame) -> pd.DataFrame:
+    """Drop records whose key is already in the source's key index."""
+    if df_new.empty:
+        return df_new
+
+    keys = compute_record_keys(df_new)
+    known = pd.Series(False, index=df_new.index)
+    for bucket, bucket_keys in _group_keys_by_bucket(keys):
+        stored, _ = load_key_bucket(backend, get_key_bucket_path(source, bucket))
+        if len(stored):
+            hits = np.isin(bucket_keys.values.astype(np.uint64), stored, assume_unique=False)
+            known.loc[bucket_keys.index[hits]] = True
+
+    if known.any():
+        logger.info(f"⏭️  Skipping {int(known.sum())} {source} records already stored")
+    return df_new[~known]
+
+def add_to_key_index(backend: StorageBackend, source: str, df_records: pd.DataFrame):
+    """
+    Add record keys to the source's key index.
+
+    Each touched bucket is rewritten with a generation precondition and re-read
+    on conflict, so concurrent writers never drop each other's keys.
+    """
+    for bucket, bucket_keys in _group_keys_by_bucket(compute_record_keys(df_records)):
+        bucket_path = get_key_bucket_path(source, bucket)
+        new_keys = bucket_keys.values.astype(np.uint64)
+
+        for attempt in range(KEY_INDEX_WRITE_ATTEMPTS):
+            stored, generation = load_key_bucket(backend, bucket_path)
+            merged = np.union1d(stored, new_keys).astype('<u8')
+            if len(merged) == len(stored):
+                break
+            try:
+                new_generation = backend.write_bytes(bucket_path, merged.tobytes(),
+                                                     if_generation_match=generation)
+                _key_bucket_cache[bucket_path] = (new_generation, merged.astype(np.uint64))
+                break
+            except PreconditionFailed:
+                delay = retry_delay(attempt)
+                logger.info(f"🔁 Key bucket {bucket_path} changed concurrently, retrying in {delay:.2f}s ({attempt + 1})")
+                time.sleep(delay)
+        else:
+            raise ConcurrentUpdateError(f"Could not update key index bucket {bucket_path}")
+
+def key_index_bootstrapped(backend: StorageBackend, source: str) -> bool:
+    """True once a full rebuild has indexed the source's history"""
+    return backend.exists(get_key_index_marker_path(source))
+
+def rebuild_key_index(backend: StorageBackend, source: str) -> str:
+    """
+    Build a source's key index from its full history (bootstrap, or after data repair).
+
+    The old index and marker are removed before the history is read, so records
+    ingested meanwhile are either in the history or add their own keys; the
+    marker is written only after every key is stored.
+    """
+    for obj in backend.list_objects(prefix=get_key_index_prefix(source)):
+        backend.delete(obj.name)
+        _key_bucket_cache.pop(obj.name, None)
+
+    df_source = load_source_dataframe(backend, source)
+    if not df_source.empty:
+        add_to_key_index(backend, source, df_source)
+
+    marker = {'records': int(len(df_source)), 'rebuilt_at': datetime.utcnow().isoformat()}
+    backend.write_text(get_key_index_marker_path(source), json.dumps(marker), content_type='application/json')
+
+    logger.info(f"🔑 Rebuilt {source} key index from {len(df_source)} records")
+    return f"rebuilt_key_index_with_{len(df_source)}_records_for_{source}"
+
+# ---------------------------------------------------------------------------
+# VIZ PARTITIONS
+# ---------------------------------------------------------------------------
+# viz rows live in one object per ticket date (viz/date=YYYY-MM-DD.csv[.gz]). New
+# records are joined against a cached mapping table and merged into just the
+# partitions they touch; the manifest records which mapping generation the
+# partitions were built from, and a mapping change triggers a full rebuild.
+# Rows are deduplicated on the same key as the source records (DEDUP_COLUMNS),
+# scoped by source company the way the per-source shards and key index are.
+
+VIZ_REQUIRED_COLUMNS = [
+    'Agency', 'Sub_contractor', 'Cluster', 'Site', 'Machines',
+    'Total_capacity_per_day', 'Total_waste_to_be_remediated',
+    'date', 'ticket_no', 'vehicle_no', 'net_weight_calculated', '_source_company',
+    'cloud_upload_timestamp'
+]
+VIZ_DEDUP_COLUMNS = ['_source_company'] + DEDUP_COLUMNS
+
+# Instance-level mapping cache, reused across warm invocations
+_mapping_cache = {'generation': None, 'frame': None}
+
+def get_viz_partition_path(partition_key: str) -> str:
+    """Object name of the viz partition for a YYYY-MM-DD key (or 'unknown')."""
+    return csv_object_name(f"{VIZ_PARTITION_ROOT}date={partition_key}.csv")
+
+_VIZ_PARTITION_PATTERN = re.compile(r"/date=[^/]+\.csv(?:\.gz|\.zst)?$")
+
+def list_viz_partitions(backend: StorageBackend) -> List[str]:
+    return [obj.name for obj in backend.list_objects(prefix=VIZ_PARTITION_ROOT)
+            if _VIZ_PARTITION_PATTERN.search(obj.name)]
+
+def viz_partition_keys(dates: pd.Series) -> pd.Series:
+    """Map DD-MM-YYYY ticket dates to partition keys."""
+    parsed = pd.to_datetime(dates.astype(str), format='%d-%m-%Y', errors='coerce')
+    return parsed.dt.strftime('%Y-%m-%d').fillna('unknown')
+
+def load_mapping_table(backend: StorageBackend):
+    """
+    Load mapping.csv, reusing the cached copy while its generation is unchanged.
+
+    Returns:
+        (df_mapping, generation) or (None, None) if the mapping file is missing
+    """
+    generation = backend.get_generation(MAPPING_CSV)
+    if generation is None:
+        return None, None
+
+    if _mapping_cache['generation'] == generation:
+        return _mapping_cache['frame'], generation
+
+    content, generation = backend.read_with_generation(MAPPING_CSV)
+    df_mapping = pd.read_csv(io.BytesIO(content))
+    df_mapping.columns = df_mapping.columns.str.strip()
+    if 'Site' in df_mapping.columns:
+        df_mapping['Site'] = df_mapping['Site'].astype(str).str.strip()
+
+    _mapping_cache['generation'] = generation
+    _mapping_cache['frame'] = df_mapping
+    logger.info(f"📋 Loaded mapping data (generation {generation}): {len(df_mapping)} rows, {len(df_mapping.columns)} columns")
+    return df_mapping, generation
+
+def build_viz_rows(df_records: pd.DataFrame, df_mapping: pd.DataFrame) -> pd.DataFrame:
+    """Join weighbridge records with the mapping table and select the viz columns."""
+    if df_records.empty:
+        return pd.DataFrame(columns=VIZ_REQUIRED_COLUMNS)
+
+    df_records = df_records.copy()
+    df_records.columns = df_records.columns.str.strip()
+
+    if 'site_name' not in df_records.columns:
+        logger.error(f"❌ Column 'site_name' not found in records. Available columns: {list(df_records.columns)}")
+        return pd.DataFrame(columns=VIZ_REQUIRED_COLUMNS)
+
+    # Clean the join column (remove extra spaces)
+    df_records['site_name'] = df_records['site_name'].astype(str).str.strip()
+
+    # Inner join on the interned site id, so spelling/case/spacing variants still match
+    df_joined = join_on_entity(df_records, df_mapping, 'site', left_on='site_name', right_on='Site')
+
+    # Add missing columns with default values
+    for col in VIZ_REQUIRED_COLUMNS:
+        if col not in df_joined.columns:
+            df_joined[col] = 0 if col == 'net_weight_calculated' else ""
+
+    return df_joined[VIZ_REQUIRED_COLUMNS].copy()
+
+def drop_duplicate_viz_rows(df_viz: pd.DataFrame, keep: str = 'last') -> pd.DataFrame:
+    """Drop repeated tickets, comparing keys as text like compute_record_keys."""
+    key_frame = df_viz[VIZ_DEDUP_COLUMNS].fillna('').astype(str)
+    return df_viz[~key_frame.duplicated(keep=keep).values]
+
+def sort_viz_rows(df_viz: pd.DataFrame) -> pd.DataFrame:
+    """Order rows within a partition by source company and ticket."""
+    return df_viz.sort_values(['_source_company', 'ticket_no'], kind='mergesort')
+
+
+def read_viz_manifest(backend: StorageBackend) -> Dict[str, Any]:
+    if not backend.exists(VIZ_MANIFEST):
+        return {}
+    return json.loads(backend.read_text(VIZ_MANIFEST))
+
+def write_viz_manifest(backend: StorageBackend, mapping_generation):
+    manifest = {
+        'mapping_generation': mapping_generation,
+        'dedup_columns': VIZ_DEDUP_COLUMNS,
+        'updated_at': datetime.utcnow().isoformat()
+    }
+    backend.write_text(VIZ_MANIFEST, json.dumps(manifest), content_type='application/json')
+
+def merge_into_viz_partitions(backend: StorageBackend, df_viz: pd.DataFrame) -> int:
+    """
+    Merge new viz rows into the partitions for their dates.
+
+    Returns:
+        Number of partitions written
+    """
+    if df_viz.empty:
+        return 0
+
+    partitions_written = 0
+    for partition_key, df_part in df_viz.groupby(viz_partition_keys(df_viz['date'])):
+        partition_path = get_viz_partition_path(partition_key)
+        # Also pick up a partition written under a different compression setting
+        others = [name for name in csv_name_variants(f"{VIZ_PARTITION_ROOT}date={partition_key}.csv")
+                  if name != partition_path and backend.exists(name)]
+        if others:
+            df_part = pd.concat([read_csv_blob(backend, name, dtype=KEY_COLUMN_DTYPES) for name in others] + [df_part],
+                                ignore_index=True, sort=False)
+
+        def merge(df_current, generation, df_part=df_part):
+            if df_current is not None:
+                df_part = pd.concat([df_current, df_part], ignore_index=True, sort=False)
+            return sort_viz_rows(drop_duplicate_viz_rows(df_part, keep='last'))
+
+        update_csv_object(backend, partition_path, merge)
+        for name in others:
+            backend.delete(name)
+        partitions_written += 1
+
+    return partitions_written
+
+def update_viz_incremental(backend: StorageBackend, df_new: pd.DataFrame) -> str:
+    """
+    Add newly ingested records to the viz partitions.
+
+    Only the new records are joined; a full rebuild happens when mapping.csv
+    changed since the partitions were built.
+
     Args:
-        bucket: GCS bucket object
-        
+        backend: Storage backend (GCS bucket or local stand-in)
+        df_new: Records just appended to the source shards
+
     Returns:
         Status message about the viz update
     """
     try:
-        logger.info("📊 Starting combined viz.csv update process...")
-        
-        # Read mapping.csv
-        mapping_blob = bucket.blob(MAPPING_CSV)
-        if not mapping_blob.exists():
+        df_mapping, mapping_generation = load_mapping_table(backend)
+        if df_mapping is None:
             logger.warning(f"⚠️  Mapping file not found: {MAPPING_CSV}")
             logger.info("💡 Upload mapping.csv first using the setup script")
             return "mapping_file_not_found"
-        
-        mapping_content = mapping_blob.download_as_text()
-        df_mapping = pd.read_csv(io.StringIO(mapping_content))
-        logger.info(f"📋 Loaded mapping data: {len(df_mapping)} rows, {len(df_mapping.columns)} columns")
-        
-        # Read and combine all source CSV files
+
+        manifest = read_viz_manifest(backend)
+        if manifest.get('mapping_generation') != mapping_generation:
+            logger.info(f"🔄 Mapping changed ({manifest.get('mapping_generation')} -> {mapping_generation}), rebuilding viz partitions")
+            return update_viz_csv_combined(backend)
+        if manifest.get('dedup_columns') != VIZ_DEDUP_COLUMNS:
+            logger.info(f"🔄 Viz dedup key changed ({manifest.get('dedup_columns')} -> {VIZ_DEDUP_COLUMNS}), rebuilding viz partitions")
+            return update_viz_csv_combined(backend)
+
+        df_viz = build_viz_rows(df_new, df_mapping)
+        if df_viz.empty:
+            logger.warning("⚠️  No new records matched the mapping sites")
+            return "no_matching_sites"
+
+        partitions_written = merge_into_viz_partitions(backend, df_viz)
+        logger.info(f"✅ Merged {len(df_viz)} viz rows into {partitions_written} partitions")
+        return f"merged_{len(df_viz)}_viz_rows_into_{partitions_written}_partitions"
+
+    except Exception as e:
+        logger.error(f"❌ Error updating viz partitions: {str(e)}")
+        return f"viz_update_failed_{str(e)}"
+
+def update_viz_csv_combined(backend: StorageBackend) -> str:
+    """
+    Rebuild every viz partition by combining all source data and joining with mapping.csv.
+
+    Used when mapping.csv changes (or no partitions exist yet); regular events go
+    through update_viz_incremental.
+
+    Args:
+        backend: Storage backend (GCS bucket or local stand-in)
+
+    Returns:
+        Status message about the viz update
+    """
+    try:
+        logger.info("📊 Starting full viz partition rebuild...")
+
+        df_mapping, mapping_generation = load_mapping_table(backend)
+        if df_mapping is None:
+            logger.warning(f"⚠️  Mapping file not found: {MAPPING_CSV}")
+            logger.info("💡 Upload mapping.csv first using the setup script")
+            return "mapping_file_not_found"
+
+        if 'Site' not in df_mapping.columns:
+            logger.error(f"❌ Column 'Site' not found in mapping.csv. Available columns: {list(df_mapping.columns)}")
+            return "missing_site_column_in_mapping"
+
+        # Read and combine all source data
         all_dataframes = []
-        total_records = 0
-        
-        for source, csv_path in CSV_PATHS.items():
-            csv_blob = bucket.blob(csv_path)
-            if csv_blob.exists():
-                logger.info(f"📄 Reading {source} data from: {csv_path}")
-                csv_content = csv_blob.download_as_text()
-                df_source = pd.read_csv(io.StringIO(csv_content))
-                
+        for source in WATCH_PREFIXES:
+            df_source = load_source_dataframe(backend, source)
+            if not df_source.empty:
                 # Ensure source company column exists
                 if '_source_company' not in df_source.columns:
                     df_source['_source_company'] = source
-                
                 all_dataframes.append(df_source)
-                total_records += len(df_source)
                 logger.info(f"   📊 {source}: {len(df_source)} records")
             else:
-                logger.warning(f"⚠️  CSV file not found for {source}: {csv_path}")
-        
+                logger.warning(f"⚠️  No shards found for {source}: {get_shard_prefix(source)}")
+
         if not all_dataframes:
             logger.warning("⚠️  No source CSV files found")
             return "no_source_csvs_found"
-        
-        # Combine all source dataframes
-        logger.info(f"🔗 Combining {len(all_dataframes)} source datasets with {total_records} total records")
+
         df_combined = pd.concat(all_dataframes, ignore_index=True, sort=False)
-        
-        logger.info(f"📋 Combined data: {len(df_combined)} rows, {len(df_combined.columns)} columns")
-        logger.info(f"📋 Sources in combined data: {sorted(df_combined['_source_company'].unique())}")
-        
-        # Clean column names (remove extra spaces)
-        df_mapping.columns = df_mapping.columns.str.strip()
-        df_combined.columns = df_combined.columns.str.strip()
-        
-        # Ensure join columns exist
-        if 'Site' not in df_mapping.columns:
-            logger.error(f"❌ Column 'Site' not found in mapping.csv. Available columns: {list(df_mapping.columns)}")
-            return "missing_site_column_in_mapping"
-        
-        if 'site_name' not in df_combined.columns:
-            logger.error(f"❌ Column 'site_name' not found in combined data. Available columns: {list(df_combined.columns)}")
-            return "missing_site_name_column_in_combined"
-        
-        # Clean the join columns (remove extra spaces, handle case)
-        df_mapping['Site'] = df_mapping['Site'].astype(str).str.strip()
-        df_combined['site_name'] = df_combined['site_name'].astype(str).str.strip()
-        
-        logger.info(f"🔗 Joining combined data with mapping on site_name = Site")
-        logger.info(f"   Mapping sites: {sorted(df_mapping['Site'].unique()[:5])}...")
-        logger.info(f"   Combined sites: {sorted(df_combined['site_name'].unique()[:5])}...")
-        
-        # Perform inner join
-        df_joined = pd.merge(
-            df_combined, 
-            df_mapping, 
-            left_on='site_name', 
-            right_on='Site', 
-            how='inner'
-        )
-        
-        logger.info(f"🔗 Join result: {len(df_joined)} rows (from {len(df_combined)} combined + {len(df_mapping)} mapping)")
-        
-        if len(df_joined) == 0:
-            logger.warning("⚠️  No matching records found between combined data and mapping")
-            # Show some sample values for debugging
-            logger.warning(f"Sample mapping Sites: {list(df_mapping['Site'].head())}")
-            logger.warning(f"Sample combined site_names: {list(df_combined['site_name'].head())}")
-            return "no_matching_sites"
-        
-        # Select required columns for viz.csv including source company
-        required_columns = [
-            'Agency', 'Sub_contractor', 'Cluster', 'Site', 'Machines', 
-            'Total_capacity_per_day', 'Total_waste_to_be_remediated',
-            'date', 'ticket_no', 'net_weight_calculated', '_source_company'
-        ]
-        
-        # Check if all required columns exist
-        missing_columns = [col for col in required_columns if col not in df_joined.columns]
-        if missing_columns:
-            logger.warning(f"⚠️  Missing columns in joined data: {missing_columns}")
-            logger.info(f"Available columns: {list(df_joined.columns)}")
-            
-            # Add missing columns with default values
-            for col in missing_columns:
-                if col in ['net_weight_calculated']:
-                    df_joined[col] = 0
+        df_viz = build_viz_rows(df_combined, df_mapping)
+
+        logger.info(f"🔗 Join result: {len(df_viz)} rows (from {len(df_combined)} combined + {len(df_mapping)} mapping)")
+
+        # Rewrite all partitions and drop those that no longer have rows. A partition
+        # that changed since the listing (a concurrent incremental merge) keeps the
+        # rows that were added to it.
+        existing = {obj.name: obj.generation for obj in backend.list_objects(prefix=VIZ_PARTITION_ROOT)
+                    if _VIZ_PARTITION_PATTERN.search(obj.name)}
+        written = set()
+        if not df_viz.empty:
+            for partition_key, df_part in df_viz.groupby(viz_partition_keys(df_viz['date'])):
+                partition_path = get_viz_partition_path(partition_key)
+                df_part = drop_duplicate_viz_rows(df_part, keep='last')
+
+                def replace(df_current, generation, df_part=df_part, listed=existing.get(partition_path, 0)):
+                    if df_current is not None and generation != listed:
+                        df_part = pd.concat([df_part, df_current], ignore_index=True, sort=False)
+                        df_part = drop_duplicate_viz_rows(df_part, keep='first')
+                    return sort_viz_rows(df_part)
+
+                update_csv_object(backend, partition_path, replace)
+                written.add(partition_path)
+
+        for stale in set(existing) - written:
+            try:
+                backend.delete(stale, if_generation_match=existing[stale])
+            except (PreconditionFailed, ObjectNotFound):
+                logger.info(f"⏭️  Keeping {stale} - it changed during the rebuild")
+
+        write_viz_manifest(backend, mapping_generation)
+
+        logger.info(f"✅ Rebuilt {len(written)} viz partitions with {len(df_viz)} records")
+        return f"rebuilt_viz_with_{len(df_viz)}_records_in_{len(written)}_partitions"
+
+    except Exception as e:
+        logger.error(f"❌ Error rebuilding viz partitions: {str(e)}")
+        return f"viz_update_failed_{str(e)}"
+
+def materialize_viz_csv(backend: StorageBackend) -> str:
+    """
+    Concatenate the viz partitions into the single viz.csv file.
+
+    Run periodically (with compaction) for consumers that still fetch viz.csv.
+    """
+    partitions = list_viz_partitions(backend)
+    if not partitions:
+        return "no_viz_partitions"
+
+    # Newest dates first, matching the previous viz.csv ordering
+    frames = [read_csv_blob(backend, name, dtype=KEY_COLUMN_DTYPES) for name in sorted(partitions, reverse=True)]
+    df_viz = pd.concat(frames, ignore_index=True, sort=False)
+
+    viz_name = csv_object_name(VIZ_CSV)
+    write_csv_object(backend, viz_name, df_viz)
+
+    logger.info(f"✅ Materialized {viz_name} from {len(partitions)} partitions ({len(df_viz)} records)")
+    return f"materialized_viz_with_{len(df_viz)}_records"
+
+
+# ---------------------------------------------------------------------------
+# MICRO-BATCHING
+# ---------------------------------------------------------------------------
+# Events arriving within BATCH_WINDOW_SECONDS (or until BATCH_MAX_EVENTS) are
+# coalesced: one shard per source and one viz update per batch. Each object
+# generation gets a create-only processed marker, so redeliveries - in the
+# same batch or a later one - are skipped.
+
+BATCH_WINDOW_SECONDS = float(os.environ.get('WEIGHBRIDGE_BATCH_WINDOW_SECONDS', '5'))
+BATCH_MAX_EVENTS = int(os.environ.get('WEIGHBRIDGE_BATCH_MAX_EVENTS', '100'))
+BATCH_SUBSCRIPTION = os.environ.get('WEIGHBRIDGE_SUBSCRIPTION', '')
+
+def build_batch_shard_path(source: str, object_keys: List[str], received_at: datetime = None) -> str:
+    """Shard name for a batch, derived from the (path, generation) keys it contains."""
+    return build_shard_path(source, "\n".join(sorted(object_keys)), 'batch', received_at)
+
+def process_event_batch(backend: StorageBackend, events: List[Dict[str, Any]]) -> List[str]:
+    """
+    Ingest a batch of GCS notifications with one append per source and one viz update.
+
+    Args:
+        backend: Storage backend (GCS bucket or local stand-in)
+        events: Decoded notifications, in arrival order
+
+    Returns:
+        One status string per event, in the same order
+    """
+    results = [None] * len(events)
+    pending = {}  # source -> list of (event index, file_name, generation)
+    seen = {}
+
+    for i, event_data in enumerate(events):
+        ignored, file_name, source, generation = classify_storage_event(event_data)
+        if ignored:
+            results[i] = ignored
+            continue
+
+        key = f"{file_name}#{generation}"
+        if key in seen:
+            results[i] = f"success_already_appended_{source}"
+            continue
+        seen[key] = i
+
+        if is_already_processed(backend, source, file_name, generation):
+            logger.info(f"⏭️  Already ingested {file_name} (generation {generation})")
+            results[i] = f"success_already_appended_{source}"
+            continue
+
+        pending.setdefault(source, []).append((i, file_name, generation))
+
+    written = []  # (source, shard_path, df_source, ingested) per source
+    for source, items in pending.items():
+        frames = []
+        ingested = []
+        for i, file_name, generation in items:
+            try:
+                df_file = extract_weighbridge_records(backend, file_name, source)
+            except Exception as e:
+                logger.error(f"❌ Error processing {source} weighbridge JSON {file_name}: {str(e)}")
+                results[i] = f"error_{str(e)}"
+                continue
+
+            if df_file.empty:
+                results[i] = "success_no_records_extracted"
+                continue
+            frames.append(df_file)
+            ingested.append((i, file_name, generation, len(df_file)))
+
+        if not frames:
+            continue
+
+        df_source = drop_duplicate_records(pd.concat(frames, ignore_index=True, sort=False))
+        shard_path = build_batch_shard_path(source, [f"{f}#{g}" for _, f, g, _ in ingested])
+        try:
+            df_source = drop_indexed_duplicates(backend, source, df_source)
+            if df_source.empty:
+                for i, file_name, generation, _ in ingested:
+                    mark_processed(backend, source, file_name, generation, '')
+                    results[i] = f"success_duplicate_records_only_{source}"
+                continue
+            write_source_shard(backend, shard_path, df_source)
+        except Exception as e:
+            logger.error(f"❌ Error writing batch shard for {source}: {str(e)}")
+            for i, _, _, _ in ingested:
+                results[i] = f"error_{str(e)}"
+            continue
+
+        written.append((source, shard_path, df_source, ingested))
+
+    if not written:
+        return results
+
+    # Same order as ingest_weighbridge_json: viz, then key index, then markers
+    df_new = pd.concat([df for _, _, df, _ in written], ignore_index=True, sort=False)
+    viz_result = update_viz_incremental(backend, df_new)
+    logger.info(f"📈 Batch of {len(events)} events ({len(df_new)} records) - viz update result: {viz_result}")
+    if viz_result.startswith('viz_update_failed'):
+        # As in ingest_weighbridge_json: no key index and no markers, so a
+        # redelivery re-reads the shards and retries the viz merge
+        for _, _, _, ingested in written:
+            for i, _, _, _ in ingested:
+                results[i] = f"error_{viz_result}"
+        return results
+
+    for source, shard_path, df_source, ingested in written:
+        try:
+            add_to_key_index(backend, source, df_source)
+        except Exception as e:
+            logger.error(f"❌ Error updating {source} key index: {str(e)}")
+            for i, _, _, _ in ingested:
+                results[i] = f"error_{str(e)}"
+            continue
+
+        for i, file_name, generation, count in ingested:
+            mark_processed(backend, source, file_name, generation, shard_path)
+            results[i] = f"success_appended_{count}_records_to_shard_for_{source}"
+
+    return results
+
+class MicroBatcher:
+    """
+    Collects notifications and flushes them through process_event_batch once
+    the window has elapsed since the first queued event or max_events are queued.
+    """
+
+    def __init__(self, backend: StorageBackend, window_seconds: float = BATCH_WINDOW_SECONDS,
+                 max_events: int = BATCH_MAX_EVENTS):
+        self.backend = backend
+        self.window_seconds = window_seconds
+        self.max_events = max(1, max_events)
+        self._lock = threading.Lock()
+        self._events = []
+        self._first_at = None
+
+    def __len__(self):
+        return len(self._events)
+
+    def add(self, event_data: Dict[str, Any]) -> List[str]:
+        """Queue an event; returns the batch results if this triggered a flush, else []."""
+        with self._lock:
+            if not self._events:
+                self._first_at = time.monotonic()
+            self._events.append(event_data)
+        return self.flush_if_due()
+
+    def is_due(self) -> bool:
+        if not self._events:
+            return False
+        return (len(self._events) >= self.max_events or
+                time.monotonic() - self._first_at >= self.window_seconds)
+
+    def flush_if_due(self) -> List[str]:
+        return self.flush() if self.is_due() else []
+
+    def flush(self) -> List[str]:
+        """Process everything queued so far as one batch."""
+        with self._lock:
+            events, self._events, self._first_at = self._events, [], None
+        if not events:
+            return []
+        return process_event_batch(self.backend, events)
+
+def drain_subscription(backend: StorageBackend, subscription: str,
+                       window_seconds: float = BATCH_WINDOW_SECONDS,
+                       max_events: int = BATCH_MAX_EVENTS,
+                       max_batches: int = 20) -> List[str]:
+    """
+    Pull GCS notifications from a Pub/Sub subscription and ingest them in micro-batches.
+
+    Messages are acknowledged only after their batch has been processed, so a
+    crash leads to redelivery, which the processed markers make harmless.
+    Events that failed (error_ results, e.g. a failed viz update) are nacked
+    for redelivery instead of acknowledged.
+    """
+    from google.cloud import pubsub_v1
+
+    subscriber = pubsub_v1.SubscriberClient()
+    results = []
+
+    for _ in range(max_batches):
+        deadline = time.monotonic() + window_seconds
+        events, ack_ids = [], []
+        while len(events) < max_events and time.monotonic() < deadline:
+            response = subscriber.pull(
+                request={"subscription": subscription, "max_messages": max_events - len(events)},
+                timeout=max(1.0, deadline - time.monotonic())
+            )
+            if not response.received_messages:
+                break
+            for received in response.received_messages:
+                message = received.message
+                if message.data:
+                    events.append(json.loads(message.data.decode('utf-8')))
                 else:
-                    df_joined[col] = ""
-        
-        # Create viz dataframe with required columns
-        df_viz = df_joined[required_columns].copy()
-        
-        # Sort by source company, date and ticket_no for better organization
-        if 'date' in df_viz.columns and 'ticket_no' in df_viz.columns:
-            df_viz = df_viz.sort_values(['_source_company', 'date', 'ticket_no'], ascending=[True, False, True])
-        
-        # Save viz.csv
-        logger.info(f"💾 Saving combined viz.csv with {len(df_viz)} records and {len(df_viz.columns)} columns")
+                    events.append(dict(message.attributes))
+                ack_ids.append(received.ack_id)
+
+        if not events:
+            break
+
+        batch_results = process_event_batch(backend, events)
+        results.extend(batch_results)
+        done = [ack_id for ack_id, result in zip(ack_ids, batch_results) if not result.startswith('error_')]
+        failed = [ack_id for ack_id, result in zip(ack_ids, batch_results) if result.startswith('error_')]
+        if done:
+            subscriber.acknowledge(request={"subscription": subscription, "ack_ids": done})
+        if failed:
+            # Deadline 0 = nack: Pub/Sub redelivers these for another attempt
+            subscriber.modify_ack_deadline(request={"subscription": subscription, "ack_ids": failed,
+                                                    "ack_deadline_seconds": 0})
+        logger.info(f"📦 Processed batch of {len(events)} events ({len(failed)} left for redelivery)")
+
+    return results
+
+@_http_entry
+def process_weighbridge_batch(request):
+    """
+    HTTP entry point for micro-batch mode (e.g. Cloud Scheduler every minute).
+
+    Drains WEIGHBRIDGE_SUBSCRIPTION - a pull subscription on the bucket's
+    notification topic - instead of handling each notification on its own.
+    """
+    try:
+        if not BATCH_SUBSCRIPTION:
+            return {"status": "error", "message": "WEIGHBRIDGE_SUBSCRIPTION is not set"}, 500
+
+        backend = GCSBackend.from_bucket_name(BUCKET_NAME)
+        results = drain_subscription(backend, BATCH_SUBSCRIPTION)
+        errors = sum(1 for result in results if result.startswith('error_'))
+        return {"status": "success", "events": len(results), "errors": errors}
+
+    except Exception as e:
+        logger.error(f"❌ Error processing batch: {str(e)}")
+        return {"status": "error", "message": str(e)}, 500
+
+def compact_source_shards(backend: StorageBackend, source: str, now: datetime = None) -> str:
+    """
+    Merge the small per-event shards of finished days into one file per day.
+
+    For every day before today, the day's compacted file and hourly shards are
+    concatenated, deduplicated and written to date=YYYY-MM-DD/part-00000.csv;
+    the merged inputs are deleted afterwards. A crash between the write and the
+    deletes only leaves duplicates, which readers drop.
+    
+    Args:
+        backend: Storage backend (GCS bucket or local stand-in)
+        source: Source company/prefix
+        now: Reference time (defaults to UTC now)
         
-        viz_buffer = io.StringIO()
-        df_viz.to_csv(viz_buffer, index=False)
+    Returns:
+        Status message about the compaction
+    """
+    today = (now or datetime.utcnow()).strftime('%Y-%m-%d')
+    
+    # Group shard names by day partition
+    days = {}
+    for shard_name in list_source_shards(backend, source):
+        day, _ = parse_shard_path(shard_name)
+        if day < today:
+            days.setdefault(day, []).append(shard_name)
+    
+    generations = {obj.name: obj.generation for obj in backend.list_objects(prefix=get_shard_prefix(source))}
+    
+    compacted_days = 0
+    merged_shards = 0
+    for day, shard_names in sorted(days.items()):
+        target = csv_object_name(f"{get_shard_prefix(source)}date={day}/{COMPACTED_SHARD_NAME}")
+        if shard_names == [target]:
+            continue
         
-        viz_blob = bucket.blob(VIZ_CSV)
-        viz_blob.upload_from_string(
-            viz_buffer.getvalue(),
-            content_type='text/csv'
-        )
+        df_day = pd.concat([read_source_shard(backend, name) for name in shard_names],
+                           ignore_index=True, sort=False)
+        df_day = drop_duplicate_records(df_day)
         
-        logger.info(f"✅ Successfully updated {VIZ_CSV}")
-        logger.info(f"📊 Combined Viz CSV stats:")
-        logger.info(f"   - Total records: {len(df_viz)}")
-        logger.info(f"   - Columns: {list(df_viz.columns)}")
+        # Only replace the compacted file we read; a concurrent compaction wins otherwise
+        try:
+            write_csv_object(backend, target, df_day, if_generation_match=generations.get(target, 0))
+        except PreconditionFailed:
+            logger.info(f"⏭️  {target} changed during compaction, skipping {day}")
+            continue
         
-        # Show breakdown by source company
-        if '_source_company' in df_viz.columns:
-            source_counts = df_viz['_source_company'].value_counts()
-            logger.info(f"📋 Records by source:")
-            for source, count in source_counts.items():
-                logger.info(f"   - {source}: {count} records")
+        for name in shard_names:
+            if name != target:
+                try:
+                    backend.delete(name, if_generation_match=generations.get(name))
+                except (PreconditionFailed, ObjectNotFound):
+                    pass
         
-        # Show sample of latest records
-        if len(df_viz) > 0:
-            logger.info(f"📋 Sample viz records:")
-            for i, row in df_viz.head(3).iterrows():
-                site = row.get('Site', 'N/A')
-                agency = row.get('Agency', 'N/A')
-                source_company = row.get('_source_company', 'N/A')
-                date = row.get('date', 'N/A')
-                ticket = row.get('ticket_no', 'N/A')
-                weight = row.get('net_weight_calculated', 0)
-                logger.info(f"   {source_company} | {site} | {agency} | {date} | {ticket} | {weight}kg")
+        compacted_days += 1
+        merged_shards += len(shard_names)
+        logger.info(f"🗜️  Compacted {len(shard_names)} {source} shards for {day} into {len(df_day)} rows")
+    
+    return f"compacted_{merged_shards}_shards_into_{compacted_days}_days_for_{source}"
+
+@_http_entry
+def compact_weighbridge_shards(request):
+    """
+    HTTP entry point for the periodic compaction job (e.g. Cloud Scheduler, nightly).
+    """
+    try:
+        backend = GCSBackend.from_bucket_name(BUCKET_NAME)
         
-        return f"updated_combined_viz_with_{len(df_viz)}_records_from_{len(all_dataframes)}_sources"
+        results = [compact_source_shards(backend, source) for source in WATCH_PREFIXES]
+        results.extend(rebuild_key_index(backend, source) for source in WATCH_PREFIXES
+                       if not key_index_bootstrapped(backend, source))
+        results.append(materialize_viz_csv(backend))
+        logger.info(f"🗜️  Compaction results: {results}")
+        return {"status": "success", "results": results}
         
     except Exception as e:
-        logger.error(f"❌ Error updating combined viz.csv: {str(e)}")
-        return f"viz_update_failed_{str(e)}"
+        logger.error(f"❌ Error compacting shards: {str(e)}")
+        return {"status": "error", "message": str(e)}, 500
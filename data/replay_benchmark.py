@@ -0,0 +1,279 @@
+# replay_benchmark.py - Replay weighbridge events through the Cloud Function handler off-cloud
+"""
+Feeds recorded or synthetic weighbridge JSON events through handle_storage_event
+against a local-directory bucket (storage_backend.LocalBackend) and reports
+throughput and per-event latency as the stored history grows.
+
+Usage (from the data/ directory):
+    python replay_benchmark.py --events 500 --report-every 50
+    python replay_benchmark.py --input-dir ./recorded_json --root /tmp/wb-bucket
+    python replay_benchmark.py --events 500 --batch-size 20   # micro-batch mode
+    python replay_benchmark.py --events 500 --workers 8       # parallel handlers, checks for lost records
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Tuple
+
+import main as weighbridge
+from storage_backend import LocalBackend
+
+DEFAULT_SITES = ["Kurnool", "Dhone", "Nandyal", "Ongole", "Madanapalle"]
+
+
+def seed_mapping(backend: LocalBackend, mapping_path: str):
+    """Copy mapping.csv into the local bucket so the viz join has data."""
+    if mapping_path and os.path.exists(mapping_path):
+        with open(mapping_path, 'rb') as f:
+            backend.write_bytes(weighbridge.MAPPING_CSV, f.read(), content_type='text/csv')
+        print(f"📋 Seeded mapping from {mapping_path}")
+    else:
+        print("⚠️  No mapping.csv seeded - viz updates will report mapping_file_not_found")
+
+
+def load_mapping_sites(mapping_path: str) -> List[str]:
+    """Site names from mapping.csv, so synthetic tickets join in the viz step."""
+    if not mapping_path or not os.path.exists(mapping_path):
+        return DEFAULT_SITES
+    import pandas as pd
+    sites = pd.read_csv(mapping_path)['Site'].dropna().astype(str).str.strip().unique().tolist()
+    return sites or DEFAULT_SITES
+
+
+def synthetic_record(ticket_no: int, site: str, when: datetime, source: str) -> Dict[str, Any]:
+    """One synthetic weighbridge ticket in the upload JSON format."""
+    first_weight = random.randint(9000, 30000)
+    second_weight = random.randint(8000, first_weight)
+    vehicle = f"AP {random.randint(1, 39):02d} T{random.choice('ABCDEFUV')} {random.randint(1000, 9999)}"
+    return {
+        'date': when.strftime('%d-%m-%Y'),
+        'time': when.strftime('%H:%M:%S'),
+        'site_name': site,
+        'agency_name': source,
+        'material': random.choice(['Inert', 'MSW', 'RDF']),
+        'ticket_no': f"T{ticket_no:05d}",
+        'vehicle_no': vehicle,
+        'transfer_party_name': 'On Site',
+        'first_weight': f"{first_weight:.2f}",
+        'first_timestamp': (when - timedelta(minutes=3)).strftime('%d-%m-%Y %H:%M:%S'),
+        'second_weight': f"{second_weight:.2f}",
+        'second_timestamp': when.strftime('%d-%m-%Y %H:%M:%S'),
+        'net_weight': f"{first_weight - second_weight:.2f}",
+        'material_type': 'Inert',
+        'first_front_image': f"{site}_{ticket_no}_1st_front.jpg",
+        'first_back_image': f"{site}_{ticket_no}_1st_back.jpg",
+        'second_front_image': f"{site}_{ticket_no}_2nd_front.jpg",
+        'second_back_image': f"{site}_{ticket_no}_2nd_back.jpg",
+        'site_incharge': 'Site Incharge',
+        'user_name': 'admin',
+        'cloud_upload_timestamp': (when + timedelta(seconds=5)).strftime('%Y-%m-%d %H:%M:%S'),
+        'record_status': 'complete',
+        'net_weight_calculated': first_weight - second_weight
+    }
+
+
+def synthetic_events(count: int, records_per_event: int, sites: List[str]) -> Iterator[Tuple[str, Any]]:
+    """Yield (object_name, json_payload) pairs resembling weighbridge uploads."""
+    start = datetime.now() - timedelta(days=30)
+    ticket_no = 0
+    for i in range(count):
+        source = random.choice(weighbridge.WATCH_PREFIXES)
+        site = random.choice(sites)
+        when = start + timedelta(minutes=5 * i)
+        records = []
+        for _ in range(records_per_event):
+            ticket_no += 1
+            records.append(synthetic_record(ticket_no, site, when, source))
+        payload = records[0] if records_per_event == 1 else records
+        object_name = (f"{source}/{site}/{when.strftime('%Y-%m-%d')}/json_backups/"
+                       f"T{ticket_no:05d}/{when.strftime('%Y%m%d_%H%M%S')}_{i}.json")
+        yield object_name, payload
+
+
+def recorded_events(input_dir: str) -> Iterator[Tuple[str, Any]]:
+    """
+    Yield (object_name, json_payload) pairs from recorded JSON files.
+
+    Paths are taken relative to input_dir, so a directory mirrored from the
+    bucket replays under its original object names.
+    """
+    for path in sorted(glob.glob(os.path.join(input_dir, '**', '*.json'), recursive=True)):
+        object_name = os.path.relpath(path, input_dir).replace(os.sep, '/')
+        if not weighbridge.get_source_from_path(object_name):
+            object_name = f"{weighbridge.WATCH_PREFIXES[0]}/{object_name}"
+        with open(path, encoding='utf-8') as f:
+            yield object_name, json.load(f)
+
+
+def count_records(payload: Any) -> int:
+    return len(payload) if isinstance(payload, list) else 1
+
+
+def replay(backend: LocalBackend, events: Iterator[Tuple[str, Any]], report_every: int,
+           batch_size: int = 1) -> List[Dict[str, Any]]:
+    """
+    Push events through the handler and collect per-window statistics.
+
+    With batch_size > 1 events go through a MicroBatcher that flushes every
+    batch_size events; an event's latency then runs from enqueue to the end of
+    its batch.
+
+    Returns:
+        One dict per report window (events, records_total, events_per_sec, p50/p95/max ms)
+    """
+    windows = []
+    latencies = []
+    window_start = time.perf_counter()
+    records_total = 0
+    errors = 0
+    batcher = weighbridge.MicroBatcher(backend, window_seconds=float('inf'), max_events=batch_size)
+    queued_at = []
+
+    for i, (object_name, payload) in enumerate(events, start=1):
+        generation = backend.write_text(object_name, json.dumps(payload), content_type='application/json')
+        event_data = {
+            'bucketId': weighbridge.BUCKET_NAME,
+            'objectId': object_name,
+            'generation': generation,
+            'eventType': 'OBJECT_FINALIZE'
+        }
+
+        if batch_size > 1:
+            queued_at.append(time.perf_counter())
+            results = batcher.add(event_data)
+            if results:
+                finished = time.perf_counter()
+                latencies.extend((finished - started) * 1000 for started in queued_at)
+                queued_at = []
+        else:
+            started = time.perf_counter()
+            results = [weighbridge.handle_storage_event(event_data, backend)]
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        records_total += count_records(payload)
+        errors += sum(1 for result in results if result.startswith('error_'))
+
+        if i % report_every == 0 and latencies:
+            elapsed = time.perf_counter() - window_start
+            ordered = sorted(latencies)
+            windows.append({
+                'events': i,
+                'records_total': records_total,
+                'events_per_sec': len(latencies) / elapsed if elapsed else 0.0,
+                'p50_ms': statistics.median(ordered),
+                'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                'max_ms': ordered[-1],
+                'errors': errors
+            })
+            print_window(windows[-1])
+            latencies = []
+            window_start = time.perf_counter()
+
+    # Flush the final partial batch
+    errors += sum(1 for result in batcher.flush() if result.startswith('error_'))
+
+    return windows
+
+
+def replay_parallel(backend: LocalBackend, events: Iterator[Tuple[str, Any]], workers: int) -> Dict[str, Any]:
+    """
+    Run the handler for all events from several threads at once, then check
+    that every ticket reached the source shards.
+    """
+    pending = []
+    expected = 0
+    for object_name, payload in events:
+        generation = backend.write_text(object_name, json.dumps(payload), content_type='application/json')
+        pending.append({
+            'bucketId': weighbridge.BUCKET_NAME,
+            'objectId': object_name,
+            'generation': generation,
+            'eventType': 'OBJECT_FINALIZE'
+        })
+        expected += count_records(payload)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda event: weighbridge.handle_storage_event(event, backend), pending))
+    elapsed = time.perf_counter() - started
+
+    stored = sum(len(weighbridge.load_source_dataframe(backend, source)) for source in weighbridge.WATCH_PREFIXES)
+    summary = {
+        'events': len(pending),
+        'workers': workers,
+        'events_per_sec': len(pending) / elapsed if elapsed else 0.0,
+        'errors': sum(1 for result in results if result.startswith('error_')),
+        'records_expected': expected,
+        'records_stored': stored
+    }
+    print(f"⚡ {summary['events']} events with {workers} workers: {summary['events_per_sec']:.1f} events/s, "
+          f"{summary['errors']} errors, {stored}/{expected} records stored")
+    return summary
+
+
+def print_window(window: Dict[str, Any]):
+    print(f"{window['events']:>8} {window['records_total']:>10} {window['events_per_sec']:>10.1f} "
+          f"{window['p50_ms']:>9.1f} {window['p95_ms']:>9.1f} {window['max_ms']:>9.1f} {window['errors']:>6}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay weighbridge events through the ingestion handler")
+    parser.add_argument('--root', help="Local bucket directory (default: temporary directory)")
+    parser.add_argument('--input-dir', help="Directory of recorded JSON files to replay")
+    parser.add_argument('--events', type=int, default=200, help="Synthetic events to generate")
+    parser.add_argument('--records-per-event', type=int, default=1, help="Tickets per synthetic JSON file")
+    parser.add_argument('--report-every', type=int, default=25, help="Events per report window")
+    parser.add_argument('--mapping', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mapping.csv'),
+                        help="mapping.csv to seed into the bucket")
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help="Events per micro-batch (1 = one handler call per event)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Handle events from this many threads at once (checks for lost records)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--keep', action='store_true', help="Keep the temporary bucket directory")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    weighbridge.logger.setLevel('WARNING')
+
+    root = args.root or tempfile.mkdtemp(prefix='weighbridge-bucket-')
+    backend = LocalBackend(root)
+    print(f"🪣 Local bucket: {root}")
+    seed_mapping(backend, args.mapping)
+
+    if args.input_dir:
+        events = recorded_events(args.input_dir)
+    else:
+        events = synthetic_events(args.events, args.records_per_event, load_mapping_sites(args.mapping))
+
+    if args.workers > 1:
+        summary = replay_parallel(backend, events, args.workers)
+        if not args.root and not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+        return summary
+
+    print(f"{'events':>8} {'records':>10} {'events/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'errors':>6}")
+    windows = replay(backend, events, max(1, args.report_every), max(1, args.batch_size))
+
+    if windows and windows[0]['p50_ms'] > 0:
+        growth = windows[-1]['p50_ms'] / windows[0]['p50_ms']
+        print(f"\n📈 Median latency grew {growth:.2f}x from the first to the last window")
+
+    if not args.root and not args.keep:
+        shutil.rmtree(root, ignore_errors=True)
+
+    return windows
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
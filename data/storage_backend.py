@@ -0,0 +1,243 @@
+# storage_backend.py - Pluggable object storage for the weighbridge Cloud Function
+"""
+Storage backends used by the weighbridge ingestion path.
+
+GCSBackend wraps a google.cloud.storage bucket; LocalBackend keeps objects as
+files under a local directory so the whole ingestion path can run (and be
+measured) off-cloud. Both expose object generations so callers can use
+optimistic-concurrency preconditions.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from typing import List, NamedTuple, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows - cross-process locking unavailable
+    fcntl = None
+
+
+class StorageObject(NamedTuple):
+    """Listing entry for a stored object."""
+    name: str
+    generation: int
+    size: int
+
+
+class PreconditionFailed(Exception):
+    """Raised when an if_generation_match precondition does not hold."""
+
+
+class ObjectNotFound(Exception):
+    """Raised when reading an object that does not exist."""
+
+
+class StorageBackend:
+    """
+    Minimal object-store interface used by data/main.py.
+
+    Generations are positive integers that change on every write;
+    if_generation_match=0 means "only create, never overwrite".
+    """
+
+    def exists(self, name: str) -> bool:
+        return self.get_generation(name) is not None
+
+    def get_generation(self, name: str) -> Optional[int]:
+        """Current generation of an object, or None if it does not exist."""
+        raise NotImplementedError
+
+    def read_with_generation(self, name: str) -> Tuple[bytes, int]:
+        """Read an object and the generation the bytes belong to."""
+        raise NotImplementedError
+
+    def read_bytes(self, name: str) -> bytes:
+        return self.read_with_generation(name)[0]
+
+    def read_text(self, name: str, encoding: str = 'utf-8') -> str:
+        return self.read_bytes(name).decode(encoding)
+
+    def write_bytes(self, name: str, data: bytes, content_type: str = 'application/octet-stream',
+                    if_generation_match: Optional[int] = None) -> int:
+        """Write an object and return its new generation."""
+        raise NotImplementedError
+
+    def write_text(self, name: str, text: str, content_type: str = 'text/plain',
+                   if_generation_match: Optional[int] = None) -> int:
+        return self.write_bytes(name, text.encode('utf-8'), content_type, if_generation_match)
+
+    def delete(self, name: str, if_generation_match: Optional[int] = None):
+        raise NotImplementedError
+
+    def list_objects(self, prefix: str = '') -> List[StorageObject]:
+        """List objects whose name starts with prefix, sorted by name."""
+        raise NotImplementedError
+
+
+class GCSBackend(StorageBackend):
+    """Backend over a google.cloud.storage Bucket."""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    @classmethod
+    def from_bucket_name(cls, bucket_name: str, client=None):
+        from google.cloud import storage
+        client = client or storage.Client()
+        return cls(client.bucket(bucket_name))
+
+    @contextmanager
+    def _translate_errors(self, name: str):
+        from google.api_core import exceptions as gexc
+        try:
+            yield
+        except gexc.PreconditionFailed as e:
+            raise PreconditionFailed(f"Generation precondition failed for {name}") from e
+        except gexc.NotFound as e:
+            raise ObjectNotFound(name) from e
+
+    def get_generation(self, name: str) -> Optional[int]:
+        blob = self.bucket.get_blob(name)
+        return int(blob.generation) if blob is not None else None
+
+    def read_with_generation(self, name: str) -> Tuple[bytes, int]:
+        blob = self.bucket.get_blob(name)
+        if blob is None:
+            raise ObjectNotFound(name)
+        generation = int(blob.generation)
+        with self._translate_errors(name):
+            data = blob.download_as_bytes(if_generation_match=generation)
+        return data, generation
+
+    def write_bytes(self, name: str, data: bytes, content_type: str = 'application/octet-stream',
+                    if_generation_match: Optional[int] = None) -> int:
+        blob = self.bucket.blob(name)
+        with self._translate_errors(name):
+            blob.upload_from_string(data, content_type=content_type,
+                                    if_generation_match=if_generation_match)
+        return int(blob.generation)
+
+    def delete(self, name: str, if_generation_match: Optional[int] = None):
+        with self._translate_errors(name):
+            self.bucket.blob(name).delete(if_generation_match=if_generation_match)
+
+    def list_objects(self, prefix: str = '') -> List[StorageObject]:
+        return sorted(
+            (StorageObject(b.name, int(b.generation), int(b.size or 0))
+             for b in self.bucket.list_blobs(prefix=prefix)),
+            key=lambda obj: obj.name
+        )
+
+
+class LocalBackend(StorageBackend):
+    """
+    Backend over a local directory - a stand-in bucket for tests and benchmarks.
+
+    Object bytes live at <root>/<name>; generations live in <root>/.generations/.
+    Writes are atomic (temp file + rename) and serialised with a lock file, so
+    several processes can share one directory.
+    """
+
+    META_DIR = '.generations'
+    LOCK_FILE = '.lock'
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(os.path.join(self.root, self.META_DIR), exist_ok=True)
+        self._thread_lock = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, *name.split('/'))
+
+    def _generation_path(self, name: str) -> str:
+        return os.path.join(self.root, self.META_DIR, *name.split('/')) + '.gen'
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.root, self.LOCK_FILE), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_generation(self, name: str) -> Optional[int]:
+        if not os.path.exists(self._path(name)):
+            return None
+        try:
+            with open(self._generation_path(name)) as f:
+                return int(f.read().strip() or 1)
+        except (OSError, ValueError):
+            # Object placed in the directory by hand - treat as first generation
+            return 1
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _check_precondition(self, name: str, current: Optional[int], if_generation_match: Optional[int]):
+        if if_generation_match is None:
+            return
+        if (current or 0) != if_generation_match:
+            raise PreconditionFailed(
+                f"Generation precondition failed for {name}: "
+                f"expected {if_generation_match}, found {current or 0}"
+            )
+
+    def get_generation(self, name: str) -> Optional[int]:
+        return self._read_generation(name)
+
+    def read_with_generation(self, name: str) -> Tuple[bytes, int]:
+        with self._locked():
+            generation = self._read_generation(name)
+            if generation is None:
+                raise ObjectNotFound(name)
+            with open(self._path(name), 'rb') as f:
+                return f.read(), generation
+
+    def write_bytes(self, name: str, data: bytes, content_type: str = 'application/octet-stream',
+                    if_generation_match: Optional[int] = None) -> int:
+        with self._locked():
+            current = self._read_generation(name)
+            self._check_precondition(name, current, if_generation_match)
+            generation = (current or 0) + 1
+            self._atomic_write(self._path(name), bytes(data))
+            self._atomic_write(self._generation_path(name), str(generation).encode('ascii'))
+            return generation
+
+    def delete(self, name: str, if_generation_match: Optional[int] = None):
+        with self._locked():
+            current = self._read_generation(name)
+            if current is None:
+                raise ObjectNotFound(name)
+            self._check_precondition(name, current, if_generation_match)
+            os.remove(self._path(name))
+            try:
+                os.remove(self._generation_path(name))
+            except OSError:
+                pass
+
+    def list_objects(self, prefix: str = '') -> List[StorageObject]:
+        objects = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if dirpath == self.root:
+                dirnames[:] = [d for d in dirnames if d != self.META_DIR]
+            for filename in filenames:
+                if filename == self.LOCK_FILE or '.tmp-' in filename:
+                    continue
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if name.startswith(prefix):
+                    objects.append(StorageObject(name, self._read_generation(name) or 1,
+                                                 os.path.getsize(path)))
+        return sorted(objects, key=lambda obj: obj.name)
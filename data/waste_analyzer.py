@@ -1,29 +1,824 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-import seaborn as sns
-from collections import Counter
+from collections import Counter, OrderedDict
+from typing import Any, Dict, NamedTuple, Optional
 import warnings
+import json
 import os
-warnings.filterwarnings('ignore')
+import threading
 
-# Set up plotting style
-plt.style.use('default')
-sns.set_palette("husl")
+# Importable as a script from data/ and as data.waste_analyzer from the repo root
+try:
+    from entities import MISSING_ID, add_entity_codes, code_column, entity_column, get_entity_dictionary
+    from sketches import SketchRollup
+except ImportError:
+    from data.entities import MISSING_ID, add_entity_codes, code_column, entity_column, get_entity_dictionary
+    from data.sketches import SketchRollup
+
+
+def setup_plotting():
+    """
+    Import matplotlib/seaborn and apply the report plotting style.
+
+    Imported on demand so the analyzer can be used headless (e.g. inside the
+    dashboard) without paying for the plotting stack.
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    plt.style.use('default')
+    sns.set_palette("husl")
+    return plt, sns
+
+
+class AgencySummary(NamedTuple):
+    """Output 1: agencies by trip count"""
+    primary_agency: Optional[str]
+    all_agencies: Dict[Any, int]
+    total_agencies: int
+
+
+class DaySummary(NamedTuple):
+    """Output 2: totals for the analysed day"""
+    date: pd.Timestamp
+    total_trips: int
+    total_weight: float
+    unique_vehicles: int
+    unique_sites: int
+
+
+class AnalysisResults(NamedTuple):
+    """All eight analyzer outputs"""
+    agencies: AgencySummary
+    day: DaySummary
+    hourly: pd.DataFrame
+    cluster_performance: pd.DataFrame
+    daily_trends: pd.DataFrame
+    vehicle_utilization: pd.DataFrame
+    materials: pd.DataFrame
+    kpis: pd.DataFrame
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Results keyed output_1 ... output_8, as generate_all_outputs returns them"""
+        return {
+            'output_1': dict(self.agencies._asdict()),
+            'output_2': dict(self.day._asdict()),
+            'output_3': self.hourly,
+            'output_4': self.cluster_performance,
+            'output_5': self.daily_trends,
+            'output_6': self.vehicle_utilization,
+            'output_7': self.materials,
+            'output_8': self.kpis
+        }
+
+# ---------------------------------------------------------------------------
+# TIMESTAMP ASSEMBLY
+# ---------------------------------------------------------------------------
+# Dates and 12-hour times ("11:47:58 PM") repeat heavily across trips, so each
+# distinct string is parsed once with explicit formats (remembered across
+# calls) and the results are mapped back onto the column as int64 nanoseconds.
+
+DATE_FORMATS = ['%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y']
+TIME_FORMATS = ['%I:%M:%S %p', '%H:%M:%S', '%I:%M %p', '%H:%M']
+TIMESTAMP_FORMATS = ['%Y-%m-%d %H:%M:%S', '%d-%m-%Y %H:%M:%S', '%Y-%m-%dT%H:%M:%S']
+
+# Output column -> (date column, time column)
+TRIP_TIMESTAMPS = {
+    'datetime': ('Date', 'Time'),
+    'load_timestamp': ('Load Weight Date', 'Load Weight Time'),
+    'empty_timestamp': ('Empty Weight Date', 'Empty Weight Time'),
+}
+
+NAT_NS = np.iinfo(np.int64).min
+
+# (kind, text) -> parsed int64 nanoseconds (NAT_NS when unparseable), least recently
+# used first. Bounded: distinct timestamps grow without limit in a long-running process.
+PARSE_CACHE_SIZE = 100_000
+_parsed_values = OrderedDict()
+_parsed_values_lock = threading.Lock()
+
+
+def _parse_texts(texts, formats, time_only):
+    """Parse distinct strings: explicit formats first, inferred parsing only for leftovers"""
+    pending = pd.Series(texts, dtype=object)
+    parsed = pd.Series(pd.NaT, index=pending.index, dtype='datetime64[ns]')
+    for fmt in formats:
+        todo = parsed.isna()
+        if not todo.any():
+            break
+        parsed[todo] = pd.to_datetime(pending[todo], format=fmt, errors='coerce')
+    todo = parsed.isna() & (pending != '') & (pending.str.lower() != 'nan')
+    if todo.any():
+        parsed[todo] = pd.to_datetime(pending[todo], errors='coerce')
+
+    if time_only:
+        parsed = parsed - parsed.dt.normalize()
+    return parsed.values.view(np.int64)
+
+
+def parse_distinct(values, formats, kind, time_only=False):
+    """
+    Parse a column by distinct value.
+
+    Args:
+        values: Series of date, time or timestamp strings
+        formats: strptime formats tried in order
+        kind: Cache namespace ('date', 'time', 'timestamp')
+        time_only: Return the time of day (nanoseconds since midnight)
+
+    Returns:
+        np.ndarray: int64 nanoseconds per row, NAT_NS where unparseable
+    """
+    codes, uniques = pd.factorize(values)
+    texts = [str(value).strip() for value in uniques]
+
+    lookup = np.empty(len(texts) + 1, dtype=np.int64)
+    lookup[-1] = NAT_NS  # factorize codes missing values as -1
+    missing = []
+    with _parsed_values_lock:
+        for i, text in enumerate(texts):
+            cached = _parsed_values.get((kind, text))
+            if cached is None:
+                missing.append(i)
+            else:
+                _parsed_values.move_to_end((kind, text))
+                lookup[i] = cached
+
+    if missing:
+        parsed = _parse_texts([texts[i] for i in missing], formats, time_only)
+        with _parsed_values_lock:
+            for i, value in zip(missing, parsed):
+                lookup[i] = value
+                _parsed_values[(kind, texts[i])] = int(value)
+            while len(_parsed_values) > PARSE_CACHE_SIZE:
+                _parsed_values.popitem(last=False)
+
+    return lookup[codes]
+
+
+def _to_datetime_series(ns, index):
+    return pd.Series(ns.view('datetime64[ns]'), index=index)
+
+
+def parse_dates(values):
+    """Date column -> datetime64 Series (day precision)"""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.normalize()
+    return _to_datetime_series(parse_distinct(values, DATE_FORMATS, 'date'), values.index)
+
+
+def parse_timestamps(values):
+    """Full timestamp column (e.g. fetch_timestamp) -> datetime64 Series"""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    return _to_datetime_series(parse_distinct(values, TIMESTAMP_FORMATS, 'timestamp'), values.index)
+
+
+def assemble_timestamps(dates, times):
+    """Combine a date column and a 12/24-hour time column into datetime64"""
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        date_ns = dates.dt.normalize().values.view(np.int64)
+    else:
+        date_ns = parse_distinct(dates, DATE_FORMATS, 'date')
+    time_ns = parse_distinct(times, TIME_FORMATS, 'time', time_only=True)
+
+    valid = (date_ns != NAT_NS) & (time_ns != NAT_NS)
+    combined = np.where(valid, date_ns + np.where(valid, time_ns, 0), NAT_NS)
+    return _to_datetime_series(combined, dates.index)
+
+
+def add_trip_timestamps(df):
+    """Add datetime (trip), load_timestamp and empty_timestamp columns where their sources exist"""
+    for column, (date_col, time_col) in TRIP_TIMESTAMPS.items():
+        if date_col in df.columns and time_col in df.columns:
+            df[column] = assemble_timestamps(df[date_col], df[time_col])
+    return df
+
+
+# ---------------------------------------------------------------------------
+# TRIP SESSIONIZATION
+# ---------------------------------------------------------------------------
+# Trips are sorted by (vehicle, weigh-in time) once; consecutive trips of the
+# same vehicle less than SESSION_GAP_HOURS apart form a working session.
+# Dwell (time at the weighbridge), turnaround (weigh-out to next weigh-in) and
+# cycle time (weigh-in to next weigh-in) come from NumPy diffs over the sorted
+# arrays, and session spans from reduceat over session segments - no
+# per-vehicle Python loops.
+
+SESSION_GAP_HOURS = 6
+SHIFT_START_HOUR = 6   # first shift of the day starts 06:00
+SHIFT_HOURS = 8        # three 8-hour shifts: 06-14, 14-22, 22-06
+
+NS_PER_MINUTE = 60 * 10**9
+
+
+class FleetEfficiency(NamedTuple):
+    """Trip-cycle analysis: per-trip detail plus per-vehicle and per-site tables"""
+    trips: pd.DataFrame
+    vehicles: pd.DataFrame
+    sites: pd.DataFrame
+
+
+def _timestamp_ns(values):
+    if not pd.api.types.is_datetime64_any_dtype(values):
+        values = parse_timestamps(values)
+    return values.values.astype('datetime64[ns]').view(np.int64)
+
+
+def _entity_ids(df, kind, col):
+    """Interned ids (int64, MISSING_ID for missing) of an entity column; col may be the id column itself"""
+    if col not in df.columns and col == code_column(kind):
+        col = entity_column(df, kind)
+    if col is None or col not in df.columns:
+        return np.full(len(df), MISSING_ID, dtype=np.int64)
+    if col == code_column(kind):
+        return df[col].fillna(MISSING_ID).values.astype(np.int64)
+    return get_entity_dictionary(kind).encode(df[col]).astype(np.int64)
+
+
+def sessionize_trips(df, vehicle_col='vehicle_id', site_col='site_id', in_col='load_timestamp',
+                     out_col='empty_timestamp', gap_hours=SESSION_GAP_HOURS):
+    """
+    Per-trip cycle metrics, sorted by vehicle and weigh-in time.
+
+    Vehicles and sites are keyed by their interned ids (entities.py), so
+    spelling variants of one vehicle form one sequence of sessions; the
+    columns may also be raw name columns, which are encoded here.
+
+    The earlier of in_col/out_col is taken as weigh-in and the later as
+    weigh-out, so either weighment order works. Without out_col, dwell is
+    unavailable and turnaround equals cycle time.
+
+    Returns:
+        pd.DataFrame: vehicle_id, vehicle, site_id, site, weigh_in, weigh_out,
+        session_id, trip_in_session, shift_start, dwell_minutes,
+        turnaround_minutes, cycle_minutes (the last two are NaN at the end of
+        a session)
+    """
+    first_ns = _timestamp_ns(df[in_col])
+    second_ns = _timestamp_ns(df[out_col]) if out_col and out_col in df.columns else first_ns
+
+    has_second = second_ns != NAT_NS
+    in_ns = np.where(has_second & (second_ns < first_ns), second_ns, first_ns)
+    out_ns = np.where(has_second, np.maximum(first_ns, second_ns), first_ns)
+    out_ns = np.where(first_ns == NAT_NS, NAT_NS, out_ns)
+
+    vehicle_codes = _entity_ids(df, 'vehicle', vehicle_col)
+    keep = (vehicle_codes != MISSING_ID) & (in_ns != NAT_NS)
+    rows = np.flatnonzero(keep)
+    order = rows[np.lexsort((in_ns[rows], vehicle_codes[rows]))]
+
+    codes = vehicle_codes[order]
+    weigh_in = in_ns[order]
+    weigh_out = out_ns[order]
+    has_out = has_second[order] & (out_col is not None and out_col in df.columns)
+    count = len(order)
+
+    # Boundaries: a new vehicle, or a gap longer than gap_hours since the previous weigh-out
+    gap_ns = weigh_in[1:] - weigh_out[:-1]
+    continues = (codes[1:] == codes[:-1]) & (gap_ns <= gap_hours * 60 * NS_PER_MINUTE)
+    session_start = np.concatenate([[True], ~continues]) if count else np.zeros(0, dtype=bool)
+    session_id = np.cumsum(session_start) - 1
+    start_rows = np.flatnonzero(session_start)
+    trip_in_session = np.arange(count) - start_rows[session_id] if count else np.zeros(0, dtype=np.int64)
+
+    turnaround = np.full(count, np.nan)
+    cycle = np.full(count, np.nan)
+    if count > 1:
+        turnaround[:-1] = np.where(continues, gap_ns / NS_PER_MINUTE, np.nan)
+        cycle[:-1] = np.where(continues, (weigh_in[1:] - weigh_in[:-1]) / NS_PER_MINUTE, np.nan)
+    dwell = np.where(has_out, (weigh_out - weigh_in) / NS_PER_MINUTE, np.nan)
+
+    shift_ns = SHIFT_HOURS * 60 * NS_PER_MINUTE
+    offset_ns = SHIFT_START_HOUR * 60 * NS_PER_MINUTE
+    shift_start = (weigh_in - offset_ns) // shift_ns * shift_ns + offset_ns
+
+    site_codes = _entity_ids(df, 'site', site_col)[order]
+    return pd.DataFrame({
+        'vehicle_id': codes,
+        'vehicle': get_entity_dictionary('vehicle').decode(codes),
+        'site_id': site_codes,
+        'site': get_entity_dictionary('site').decode(site_codes),
+        'weigh_in': weigh_in.view('datetime64[ns]'),
+        'weigh_out': weigh_out.view('datetime64[ns]'),
+        'session_id': session_id,
+        'trip_in_session': trip_in_session,
+        'shift_start': shift_start.view('datetime64[ns]'),
+        'dwell_minutes': dwell,
+        'turnaround_minutes': turnaround,
+        'cycle_minutes': cycle,
+    })
+
+
+def session_spans(trips):
+    """Per session: first weigh-in, last weigh-out and trip count (segment reductions over sorted trips)"""
+    if trips.empty:
+        return pd.DataFrame(columns=['vehicle_id', 'start', 'end', 'trips', 'active_minutes'])
+    session_id = trips['session_id'].values
+    starts = np.flatnonzero(np.concatenate([[True], session_id[1:] != session_id[:-1]]))
+    weigh_in = trips['weigh_in'].values.view(np.int64)
+    weigh_out = trips['weigh_out'].values.view(np.int64)
+    spans = pd.DataFrame({
+        'vehicle_id': trips['vehicle_id'].values[starts],
+        'start': np.minimum.reduceat(weigh_in, starts).view('datetime64[ns]'),
+        'end': np.maximum.reduceat(weigh_out, starts).view('datetime64[ns]'),
+        'trips': np.diff(np.append(starts, len(trips))),
+    })
+    spans['active_minutes'] = (spans['end'] - spans['start']).dt.total_seconds() / 60
+    return spans
+
+
+def fleet_efficiency(df, vehicle_col='vehicle_id', site_col='site_id', in_col='load_timestamp',
+                     out_col='empty_timestamp', gap_hours=SESSION_GAP_HOURS):
+    """
+    Per-vehicle and per-site fleet-efficiency tables from trip cycles.
+
+    Returns:
+        FleetEfficiency
+    """
+    trips = sessionize_trips(df, vehicle_col, site_col, in_col, out_col, gap_hours)
+    spans = session_spans(trips)
+
+    by_vehicle = trips.groupby('vehicle_id', sort=False)
+    vehicles = pd.DataFrame({
+        'Trips': by_vehicle.size(),
+        'Sessions': by_vehicle['session_id'].nunique(),
+        'Shifts_Worked': by_vehicle['shift_start'].nunique(),
+        'Avg_Dwell_min': by_vehicle['dwell_minutes'].mean(),
+        'Median_Dwell_min': by_vehicle['dwell_minutes'].median(),
+        'Avg_Turnaround_min': by_vehicle['turnaround_minutes'].mean(),
+        'Median_Turnaround_min': by_vehicle['turnaround_minutes'].median(),
+        'Avg_Cycle_min': by_vehicle['cycle_minutes'].mean(),
+        'Active_Hours': spans.groupby('vehicle_id', sort=False)['active_minutes'].sum() / 60,
+    })
+    vehicles['Trips_per_Shift'] = vehicles['Trips'] / vehicles['Shifts_Worked']
+    vehicles = vehicles.round(2).sort_values('Trips', ascending=False)
+    vehicles.index = pd.Index(get_entity_dictionary('vehicle').decode(vehicles.index), name='Vehicle No')
+
+    sited = trips[trips['site_id'] != MISSING_ID]
+    by_site = sited.groupby('site_id', sort=False)
+    vehicle_shifts = sited.drop_duplicates(['site_id', 'vehicle_id', 'shift_start']) \
+        .groupby('site_id', sort=False).size()
+    sites = pd.DataFrame({
+        'Trips': by_site.size(),
+        'Vehicles': by_site['vehicle_id'].nunique(),
+        'Avg_Dwell_min': by_site['dwell_minutes'].mean(),
+        'Median_Dwell_min': by_site['dwell_minutes'].median(),
+        'Avg_Turnaround_min': by_site['turnaround_minutes'].mean(),
+        'Median_Turnaround_min': by_site['turnaround_minutes'].median(),
+        'Trips_per_Vehicle_Shift': by_site.size() / vehicle_shifts,
+    }).round(2).sort_values('Trips', ascending=False)
+    sites.index = pd.Index(get_entity_dictionary('site').decode(sites.index), name='site')
+
+    return FleetEfficiency(trips=trips, vehicles=vehicles.reset_index(), sites=sites.reset_index())
+
+
+# ---------------------------------------------------------------------------
+# FUSED AGGREGATION
+# ---------------------------------------------------------------------------
+# All eight outputs are derived from one "fact cube": a single groupby over the
+# shared dimension keys that keeps trip counts and weight sums / sums of squares.
+# Every output then regroups the (much smaller) cube instead of rescanning the
+# full dataset; distinct counts stay exact because the cube keeps each dimension.
+# Agencies, clusters, sites and vehicles are grouped on their interned ids
+# (entities.py), so spelling variants collapse into one entity; the outputs
+# label them with display names.
+
+AGENCY_ID, CLUSTER_ID, SITE_ID, VEHICLE_ID = (code_column(kind) for kind in ('agency', 'cluster', 'site', 'vehicle'))
+
+# Entity kind -> display column of the cube and the outputs
+ENTITY_LABELS = {'agency': 'agency', 'cluster': 'cluster', 'site': 'site', 'vehicle': 'Vehicle No'}
+
+CUBE_DIMENSIONS = ['Date', 'hour', AGENCY_ID, CLUSTER_ID, SITE_ID, VEHICLE_ID, 'Material Name']
+
+KPI_METRICS = [
+    'Total Trips',
+    'Total Weight Collected (kg)',
+    'Average Weight per Trip (kg)',
+    'Total Active Days',
+    'Average Trips per Day',
+    'Average Weight per Day (kg)',
+    'Fleet Size (Unique Vehicles)',
+    'Sites Covered',
+    'Average Trips per Vehicle',
+    'Vehicle Utilization Rate (%)',
+    'Weight Efficiency (kg/vehicle/day)'
+]
+
+
+def label_entities(cube):
+    """
+    Add the display column of each entity id column (in place).
+
+    Ids of the cube are floats, NaN where the entity is missing, so groupbys and
+    nunique() skip missing entities as they skip a missing name.
+    """
+    for kind, label in ENTITY_LABELS.items():
+        code = code_column(kind)
+        if code in cube.columns:
+            cube[code] = cube[code].astype(np.float64).where(cube[code] != MISSING_ID)
+            cube[label] = get_entity_dictionary(kind).decode(cube[code])
+    return cube
+
+
+def encode_entities(cube):
+    """Re-intern a cube's ids from its display columns (ids are only stable within a process)"""
+    for kind, label in ENTITY_LABELS.items():
+        if label in cube.columns:
+            cube[code_column(kind)] = get_entity_dictionary(kind).encode(cube[label])
+    return label_entities(cube)
+
+
+def build_fact_cube(df):
+    """Group the trips once by every dimension any output needs (entities by interned id)"""
+    missing_codes = [kind for kind in ENTITY_LABELS if code_column(kind) not in df.columns]
+    if missing_codes:
+        df = add_entity_codes(df.copy(deep=False), missing_codes)
+    dimensions = [col for col in CUBE_DIMENSIONS if col in df.columns]
+    weight = pd.to_numeric(df['Net Weight'], errors='coerce') if 'Net Weight' in df.columns \
+        else pd.Series(np.nan, index=df.index)
+    tickets = df['Ticket No'].notna() if 'Ticket No' in df.columns else pd.Series(True, index=df.index)
+
+    facts = df[dimensions].assign(
+        _rows=1,
+        _tickets=tickets.astype(np.int64),
+        _weight=weight,
+        _weight_n=weight.notna().astype(np.int64),
+        _weight_sq=weight ** 2
+    )
+    cube = facts.groupby(dimensions, dropna=False, sort=False).agg(
+        rows=('_rows', 'sum'),
+        tickets=('_tickets', 'sum'),
+        weight=('_weight', 'sum'),
+        weight_n=('_weight_n', 'sum'),
+        weight_sq=('_weight_sq', 'sum')
+    ).reset_index()
+    for col in CUBE_DIMENSIONS:
+        if col not in cube.columns:
+            cube[col] = np.nan
+    return label_entities(cube)
+
+
+def _labelled(frame, kinds):
+    """Reset a frame indexed by entity ids, replacing each id level with its display column"""
+    frame = frame.reset_index()
+    for kind in kinds:
+        code = code_column(kind)
+        frame.insert(frame.columns.get_loc(code), ENTITY_LABELS[kind],
+                     get_entity_dictionary(kind).decode(frame[code]))
+        frame = frame.drop(columns=code)
+    return frame
+
+
+def _weight_stats(grouped):
+    """Trip count, weight sum/mean/std from grouped cube measures"""
+    sums = grouped[['tickets', 'weight', 'weight_n', 'weight_sq']].sum()
+    mean = sums['weight'] / sums['weight_n'].where(sums['weight_n'] > 0)
+    variance = (sums['weight_sq'] - sums['weight'] ** 2 / sums['weight_n'].where(sums['weight_n'] > 0)) \
+        / (sums['weight_n'] - 1).where(sums['weight_n'] > 1)
+    return sums['tickets'], sums['weight'], mean, np.sqrt(variance.clip(lower=0))
+
+
+def _mode_by(cube, keys, column):
+    """Most frequent value of column per key group (ties -> smallest, like Series.mode)"""
+    counts = cube.dropna(subset=[column]).groupby(keys + [column])['rows'].sum().reset_index()
+    counts = counts.sort_values(keys + ['rows', column], ascending=[True] * len(keys) + [False, True],
+                                kind='mergesort')
+    return counts.drop_duplicates(subset=keys).set_index(keys)[column]
+
+
+def distinct_sketches(cube):
+    """HyperLogLog sketches of vehicle and site ids per (day, agency, site) cell of a fact cube"""
+    return SketchRollup.build(cube, ['Date', AGENCY_ID, SITE_ID], [VEHICLE_ID, SITE_ID])
+
+
+def aggregate_outputs(cube, target_date, total_rows, sketches=None):
+    """
+    Compute all eight outputs from the fact cube.
+
+    With sketches (distinct_sketches() of this cube or of a later superset of
+    it, e.g. the full history when cube is an as-of slice), the KPI unique
+    vehicle/site counts are merged from the cells up to the cube's last date
+    instead of counted exactly.
+
+    Returns:
+        AnalysisResults
+    """
+    available_dates = cube['Date'].dropna().unique()
+
+    # Output 1: agencies by trip count
+    agencies = cube.groupby(AGENCY_ID)['rows'].sum().sort_values(ascending=False, kind='mergesort')
+    agencies.index = get_entity_dictionary('agency').decode(agencies.index)
+    agency_summary = AgencySummary(
+        primary_agency=agencies.index[0] if len(agencies) else None,
+        all_agencies=agencies.to_dict(),
+        total_agencies=len(agencies)
+    )
+
+    # Output 2: target day totals (falls back to the closest day with data)
+    day_cube = cube[cube['Date'] == target_date]
+    if day_cube.empty and len(available_dates):
+        target_date = pd.Timestamp(min(sorted(available_dates), key=lambda x: abs((x - target_date).days)))
+        day_cube = cube[cube['Date'] == target_date]
+    day_summary = DaySummary(
+        date=target_date,
+        total_trips=int(day_cube['rows'].sum()),
+        total_weight=day_cube['weight'].sum(),
+        unique_vehicles=day_cube[VEHICLE_ID].nunique(),
+        unique_sites=day_cube[SITE_ID].nunique()
+    )
+
+    # Output 3: trips per hour on the target day
+    if day_cube.empty:
+        hourly = pd.DataFrame()
+    else:
+        by_hour = day_cube.groupby('hour')
+        trips, weight, mean, _ = _weight_stats(by_hour)
+        hourly = pd.DataFrame({
+            'Trip_Count': trips,
+            'Total_Weight_kg': weight,
+            'Avg_Weight_kg': mean,
+            'Unique_Vehicles': by_hour[VEHICLE_ID].nunique(),
+            'Unique_Sites': by_hour[SITE_ID].nunique()
+        }).round(2)
+        hourly.index.name = 'Hour'
+        hourly.insert(0, 'Time_Period', hourly.index.map(lambda x: f"{int(x):02d}:00-{int(x) + 1:02d}:00"))
+        hourly = hourly.reset_index()
+
+    # Output 4: cluster / site performance over the full history
+    by_site = cube.groupby([CLUSTER_ID, SITE_ID])
+    trips, weight, mean, std = _weight_stats(by_site)
+    cluster_performance = pd.DataFrame({
+        'Total_Trips': trips,
+        'Total_Weight_kg': weight,
+        'Avg_Weight_per_Trip': mean,
+        'Weight_Std_Dev': std,
+        'Unique_Vehicles': by_site[VEHICLE_ID].nunique(),
+        'First_Trip_Date': by_site['Date'].min(),
+        'Last_Trip_Date': by_site['Date'].max(),
+    }).round(2)
+    primary_agency = _mode_by(cube, [CLUSTER_ID, SITE_ID], AGENCY_ID).reindex(cluster_performance.index)
+    cluster_performance['Primary_Agency'] = pd.Series(
+        get_entity_dictionary('agency').decode(primary_agency), index=cluster_performance.index).fillna('Unknown')
+    cluster_performance['Days_Active'] = (
+        cluster_performance['Last_Trip_Date'] - cluster_performance['First_Trip_Date']
+    ).dt.days + 1
+    cluster_performance['Trips_per_Day'] = (cluster_performance['Total_Trips'] / cluster_performance['Days_Active']).round(2)
+    cluster_performance['Weight_per_Day_kg'] = (cluster_performance['Total_Weight_kg'] / cluster_performance['Days_Active']).round(2)
+    cluster_performance = _labelled(cluster_performance.sort_values('Total_Trips', ascending=False),
+                                    ['cluster', 'site'])
+
+    # Output 5: daily trends
+    by_day = cube.groupby('Date')
+    trips, weight, _, _ = _weight_stats(by_day)
+    daily_stats = pd.DataFrame({
+        'Daily_Trips': trips,
+        'Daily_Weight_kg': weight,
+        'Daily_Vehicles': by_day[VEHICLE_ID].nunique(),
+        'Daily_Sites': by_day[SITE_ID].nunique()
+    }).round(2)
+    daily_stats['Trips_7day_MA'] = daily_stats['Daily_Trips'].rolling(window=7).mean().round(2)
+    daily_stats['Weight_7day_MA'] = daily_stats['Daily_Weight_kg'].rolling(window=7).mean().round(2)
+
+    # Output 6: vehicle utilization
+    by_vehicle = cube.groupby(VEHICLE_ID)
+    trips, weight, mean, _ = _weight_stats(by_vehicle)
+    vehicle_stats = pd.DataFrame({
+        'Total_Trips': trips,
+        'Total_Weight_kg': weight,
+        'Avg_Weight_per_Trip': mean,
+        'First_Trip': by_vehicle['Date'].min(),
+        'Last_Trip': by_vehicle['Date'].max(),
+        'Days_Active': by_vehicle['Date'].nunique(),
+        'Sites_Served': by_vehicle[SITE_ID].nunique(),
+    }).round(2)
+    primary_cluster = _mode_by(cube, [VEHICLE_ID], CLUSTER_ID).reindex(vehicle_stats.index)
+    vehicle_stats['Primary_Cluster'] = pd.Series(
+        get_entity_dictionary('cluster').decode(primary_cluster), index=vehicle_stats.index).fillna('Unknown')
+    vehicle_stats['Trips_per_Active_Day'] = (vehicle_stats['Total_Trips'] / vehicle_stats['Days_Active']).round(2)
+    vehicle_stats = vehicle_stats.sort_values('Total_Trips', ascending=False)
+
+    # Output 7: material breakdown
+    by_material = cube.groupby('Material Name')
+    trips, weight, mean, _ = _weight_stats(by_material)
+    material_stats = pd.DataFrame({
+        'Total_Trips': trips,
+        'Total_Weight_kg': weight,
+        'Avg_Weight_per_Trip': mean,
+        'Vehicles_Used': by_material[VEHICLE_ID].nunique(),
+        'Sites_Collected': by_material[SITE_ID].nunique()
+    }).round(2)
+    material_stats['Percentage_of_Trips'] = (material_stats['Total_Trips'] / material_stats['Total_Trips'].sum() * 100).round(2)
+    material_stats['Percentage_of_Weight'] = (material_stats['Total_Weight_kg'] / material_stats['Total_Weight_kg'].sum() * 100).round(2)
+    material_stats = material_stats.sort_values('Total_Weight_kg', ascending=False)
+
+    # Output 8: KPIs - vehicle active days come from output 6 instead of another groupby
+    total_weight = cube['weight'].sum()
+    total_days = (cube['Date'].max() - cube['Date'].min()).days + 1
+    if sketches is None:
+        unique_vehicles = cube[VEHICLE_ID].nunique()
+        unique_sites = cube[SITE_ID].nunique()
+    else:
+        in_range = (sketches.cells['Date'] <= cube['Date'].max()).values
+        unique_vehicles = sketches.count(VEHICLE_ID, in_range)
+        unique_sites = sketches.count(SITE_ID, in_range)
+    utilization = vehicle_stats['Days_Active'].mean() / total_days * 100
+    kpis = pd.DataFrame({
+        'Metric': KPI_METRICS,
+        'Value': [
+            f"{total_rows:,}",
+            f"{total_weight:,.0f}",
+            f"{total_weight/total_rows:.1f}",
+            f"{total_days}",
+            f"{total_rows/total_days:.1f}",
+            f"{total_weight/total_days:,.0f}",
+            f"{unique_vehicles}",
+            f"{unique_sites}",
+            f"{total_rows/unique_vehicles:.1f}",
+            f"{utilization:.1f}",
+            f"{(total_weight / unique_vehicles / total_days):,.0f}"
+        ]
+    })
+
+    return AnalysisResults(
+        agencies=agency_summary,
+        day=day_summary,
+        hourly=hourly,
+        cluster_performance=cluster_performance,
+        daily_trends=daily_stats.reset_index(),
+        vehicle_utilization=_labelled(vehicle_stats, ['vehicle']),
+        materials=material_stats.reset_index(),
+        kpis=kpis
+    )
+
+
+# ---------------------------------------------------------------------------
+# PER-DAY CUBE CACHE
+# ---------------------------------------------------------------------------
+# Date is a cube dimension, so the fact cube splits exactly into one slice per
+# day. Each slice is persisted with the day's data version (a fingerprint of
+# that day's trips); on the next run only days whose version changed - new
+# days, or days with corrected records - are regrouped, and the full cube is
+# reassembled from the cached slices. Entity ids are only stable within a
+# process, so slices read from disk are re-interned from their display columns.
+
+CUBE_CACHE_FORMAT = 2
+CUBE_CACHE_INDEX = '_index.json'
+
+# Source columns the cube is derived from - a change in any of them changes the day's version
+VERSION_COLUMNS = ['Date', 'Time', 'agency', 'cluster', 'site', 'Vehicle No', 'Material Name',
+                   'Net Weight', 'Ticket No']
+
+
+def day_versions(df):
+    """
+    Data version per day: row count plus an order-independent sum of row hashes.
+
+    Returns:
+        pd.Series: date -> version string (days with trips only)
+    """
+    columns = [col for col in VERSION_COLUMNS if col in df.columns]
+    dated = df['Date'].notna()
+    row_hashes = pd.util.hash_pandas_object(df.loc[dated, columns], index=False)
+    grouped = row_hashes.groupby(df.loc[dated, 'Date'].values)
+    counts = grouped.size()
+    sums = grouped.sum()  # uint64 sum wraps around, which is fine for a fingerprint
+    return pd.Series(
+        [f"v{CUBE_CACHE_FORMAT}-{count}-{int(total):016x}" for count, total in zip(counts.values, sums.values)],
+        index=counts.index
+    )
+
+
+class DayCubeCache:
+    """Per-day fact cube slices persisted under cache_dir, keyed by date and data version"""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self._slices = {}  # day -> (version, cube slice) already loaded in this process
+        self._lock = threading.Lock()
+
+    def _day_path(self, day):
+        return os.path.join(self.cache_dir, f"date={day}.pkl")
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, CUBE_CACHE_INDEX)
+
+    def _load_index(self):
+        try:
+            with open(self._index_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        tmp_path = f"{self._index_path()}.tmp-{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, sort_keys=True)
+        os.replace(tmp_path, self._index_path())
+
+    def _write_slice(self, day, cube_slice):
+        tmp_path = f"{self._day_path(day)}.tmp-{os.getpid()}"
+        cube_slice.to_pickle(tmp_path)
+        os.replace(tmp_path, self._day_path(day))
+
+    def build_cube(self, df):
+        """
+        Fact cube for df, regrouping only the days whose data version changed.
+
+        Returns:
+            (cube, list of recomputed days as 'YYYY-MM-DD')
+        """
+        with self._lock:
+            return self._build_cube(df)
+
+    def _build_cube(self, df):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        versions = {pd.Timestamp(day).strftime('%Y-%m-%d'): version
+                    for day, version in day_versions(df).items()}
+        index = self._load_index()
+
+        stale = [day for day, version in versions.items()
+                 if index.get(day) != version or not os.path.exists(self._day_path(day))]
+        if stale:
+            fresh = build_fact_cube(df[df['Date'].isin(pd.to_datetime(stale))])
+            for date, cube_slice in fresh.groupby('Date', sort=False):
+                day = date.strftime('%Y-%m-%d')
+                cube_slice = cube_slice.reset_index(drop=True)
+                self._write_slice(day, cube_slice)
+                self._slices[day] = (versions[day], cube_slice)
+                index[day] = versions[day]
+
+        removed = [day for day in index if day not in versions]
+        for day in removed:
+            try:
+                os.remove(self._day_path(day))
+            except OSError:
+                pass
+            del index[day]
+            self._slices.pop(day, None)
+
+        if stale or removed:
+            self._save_index(index)
+
+        slices = []
+        for day, version in sorted(versions.items()):
+            cached = self._slices.get(day)
+            if cached is None or cached[0] != version:
+                cached = (version, encode_entities(pd.read_pickle(self._day_path(day))))
+                self._slices[day] = cached
+            slices.append(cached[1])
+
+        # Trips without a date cannot be cached by day - they are grouped every time
+        undated = df[df['Date'].isna()]
+        if len(undated):
+            slices.append(build_fact_cube(undated))
+
+        if not slices:
+            return build_fact_cube(df), stale
+        return pd.concat(slices, ignore_index=True, sort=False), stale
+
+
+_day_cube_caches = {}
+
+
+def get_day_cube_cache(cache_dir):
+    """Shared DayCubeCache per directory, so loaded slices are reused across analyzer instances"""
+    cache_dir = os.path.abspath(cache_dir)
+    if cache_dir not in _day_cube_caches:
+        _day_cube_caches[cache_dir] = DayCubeCache(cache_dir)
+    return _day_cube_caches[cache_dir]
 
 class WasteManagementAnalyzer:
-    def __init__(self, data_file_path, target_date=None):
+    def __init__(self, data_file_path=None, target_date=None, verbose=True, df=None, cache_dir=None,
+                 exact_counts=False):
         """
         Initialize the analyzer with data file path and optional target date
         If no target date provided, uses the most recent date in data
+
+        Pass verbose=False for headless use (no report printing), and df= to
+        analyse an already loaded DataFrame instead of reading data_file_path.
+        With cache_dir, per-day aggregates are kept there and only new or
+        changed days are recomputed. Distinct vehicle/site KPIs come from
+        mergeable HyperLogLog sketches unless exact_counts=True.
         """
         self.data_file_path = data_file_path
-        self.df = None
+        self.df = df.copy() if df is not None else None
         self.target_date = target_date
-        self.load_data()
+        self.verbose = verbose
+        self.cache_dir = cache_dir
+        self.exact_counts = exact_counts
+        self._cube = None
+        self._sketches = None
+        self._outputs = None
+        if self.df is None:
+            self.load_data()
         if self.df is not None:
             self.prepare_data()
+
+    def _print(self, *args, **kwargs):
+        if self.verbose:
+            print(*args, **kwargs)
         
     def load_data(self):
         """Load and basic clean the dataset"""
@@ -39,47 +834,54 @@ class WasteManagementAnalyzer:
                 f"../data/waste_management_data_updated.csv"
             ]
             
+            # gzip-compressed copies (<name>.gz) are read too; pandas infers the codec
+            possible_paths = [candidate for path in possible_paths for candidate in (path, f"{path}.gz")]
+
             for path in possible_paths:
                 try:
                     if os.path.exists(path):
-                        self.df = pd.read_csv(path)
-                        print(f"✅ Data loaded successfully from {path}: {len(self.df)} records")
+                        self.df = pd.read_csv(path, compression='infer')
+                        self._print(f"✅ Data loaded successfully from {path}: {len(self.df)} records")
                         self.data_file_path = path
                         return
                 except (FileNotFoundError, pd.errors.EmptyDataError):
                     continue
                     
             # If no file found, provide helpful message
-            print(f"❌ Error: Could not find file '{self.data_file_path}'")
-            print("💡 Please ensure the file is in one of these locations:")
+            self._print(f"❌ Error: Could not find file '{self.data_file_path}'")
+            self._print("💡 Please ensure the file is in one of these locations:")
             for path in possible_paths:
-                print(f"   - {path}")
-            print("\n🔧 Current working directory:", os.getcwd())
-            print("📁 Files in current directory:", os.listdir('.'))
+                self._print(f"   - {path}")
+            self._print("\n🔧 Current working directory:", os.getcwd())
+            self._print("📁 Files in current directory:", os.listdir('.'))
             if os.path.exists('data'):
-                print("📁 Files in data directory:", os.listdir('data'))
+                self._print("📁 Files in data directory:", os.listdir('data'))
             
         except Exception as e:
-            print(f"❌ Error loading data: {e}")
+            self._print(f"❌ Error loading data: {e}")
             return
     
     def prepare_data(self):
         """Prepare and clean data for analysis"""
         if self.df is None:
-            print("❌ No data available to prepare")
+            self._print("❌ No data available to prepare")
             return
             
         try:
-            # Convert date columns
-            self.df['Date'] = pd.to_datetime(self.df['Date'])
-            self.df['fetch_timestamp'] = pd.to_datetime(self.df['fetch_timestamp'])
+            # Convert date columns (explicit formats, parsed once per distinct value)
+            self.df['Date'] = parse_dates(self.df['Date'])
+            if 'fetch_timestamp' in self.df.columns:
+                self.df['fetch_timestamp'] = parse_timestamps(self.df['fetch_timestamp'])
             
-            # Clean time column and create datetime
+            # Clean time column and create trip, load and empty timestamps
             self.df['Time_clean'] = self.df['Time'].astype(str)
-            self.df['datetime'] = pd.to_datetime(self.df['Date'].astype(str) + ' ' + self.df['Time_clean'], errors='coerce')
+            add_trip_timestamps(self.df)
             
             # Extract hour from time for hourly analysis
             self.df['hour'] = self.df['datetime'].dt.hour
+
+            # Interned ids for agency, cluster, site and vehicle - every groupby runs on these
+            add_entity_codes(self.df, ENTITY_LABELS)
             
             # Set target date if not provided
             if self.target_date is None:
@@ -87,332 +889,276 @@ class WasteManagementAnalyzer:
             else:
                 self.target_date = pd.to_datetime(self.target_date)
                 
-            print(f"📅 Target analysis date: {self.target_date.strftime('%Y-%m-%d')}")
+            self._print(f"📅 Target analysis date: {self.target_date.strftime('%Y-%m-%d')}")
             
         except Exception as e:
-            print(f"❌ Error preparing data: {e}")
+            if not self.verbose:
+                raise
+            self._print(f"❌ Error preparing data: {e}")
             import traceback
             traceback.print_exc()
     
+    def fact_cube(self):
+        """The trips grouped into the fact cube (cached until the data changes)"""
+        if self._cube is None and self.cache_dir:
+            self._cube, recomputed = get_day_cube_cache(self.cache_dir).build_cube(self.df)
+            self._print(f"♻️  Day cache: {len(recomputed)} days recomputed, "
+                        f"{self._cube['Date'].nunique() - len(recomputed)} reused")
+        elif self._cube is None:
+            self._cube = build_fact_cube(self.df)
+        return self._cube
+
+    def compute_outputs(self):
+        """
+        Compute all 8 outputs as structured data, without printing.
+
+        The trips are grouped once into a fact cube (cached until the data changes)
+        and every output is rolled up from it. If the target date has no trips,
+        the closest date with data is used and becomes the target date.
+
+        Returns:
+            AnalysisResults
+        """
+        cube = self.fact_cube()
+        if self._outputs is None or self._outputs.day.date != self.target_date:
+            sketches = None if self.exact_counts else self.distinct_sketches()
+            self._outputs = aggregate_outputs(cube, self.target_date, len(self.df), sketches)
+            self.target_date = self._outputs.day.date
+        return self._outputs
+
+    def distinct_sketches(self):
+        """Per (day, agency, site) distinct-count sketches of the fact cube, built once"""
+        if self._sketches is None:
+            self._sketches = distinct_sketches(self.fact_cube())
+        return self._sketches
+
+    def distinct_count(self, column, start_date=None, end_date=None, agencies=None, sites=None, exact=False):
+        """
+        Distinct vehicles or sites ('vehicle_id'/'site_id', or 'Vehicle No'/'site') over any
+        range of days, agencies and sites. Agencies and sites may be given in any spelling.
+
+        Approximate (merged sketches) unless exact=True, which counts the fact cube.
+        """
+        column = {label: code_column(kind) for kind, label in ENTITY_LABELS.items()}.get(column, column)
+        source = self.fact_cube() if exact else self.distinct_sketches().cells
+        selected = pd.Series(True, index=source.index)
+        if start_date is not None:
+            selected &= source['Date'] >= pd.to_datetime(start_date)
+        if end_date is not None:
+            selected &= source['Date'] <= pd.to_datetime(end_date)
+        if agencies is not None:
+            selected &= source[AGENCY_ID].isin(get_entity_dictionary('agency').ids_for(agencies))
+        if sites is not None:
+            selected &= source[SITE_ID].isin(get_entity_dictionary('site').ids_for(sites))
+
+        if exact:
+            return int(source.loc[selected, column].nunique())
+        return self.distinct_sketches().count(column, selected.values)
+
     def output_1_agency_name(self):
         """Output 1: Agency Name(s)"""
-        print("\n" + "="*50)
-        print("📋 OUTPUT 1: AGENCY NAMES")
-        print("="*50)
+        self._print("\n" + "="*50)
+        self._print("📋 OUTPUT 1: AGENCY NAMES")
+        self._print("="*50)
         
-        agencies = self.df['agency'].value_counts()
+        result = dict(self.compute_outputs().agencies._asdict())
+        if not self.verbose:
+            return result
         
-        print("Agencies in dataset:")
-        for agency, count in agencies.items():
-            print(f"  • {agency}: {count:,} trips ({count/len(self.df)*100:.1f}%)")
+        self._print("Agencies in dataset:")
+        for agency, count in result['all_agencies'].items():
+            self._print(f"  • {agency}: {count:,} trips ({count/len(self.df)*100:.1f}%)")
         
-        # Return primary agency (most trips)
-        primary_agency = agencies.index[0]
-        print(f"\n🏢 Primary Agency: {primary_agency}")
+        self._print(f"\n🏢 Primary Agency: {result['primary_agency']}")
         
-        return {
-            'primary_agency': primary_agency,
-            'all_agencies': agencies.to_dict(),
-            'total_agencies': len(agencies)
-        }
+        return result
     
     def output_2_total_trips_day(self):
         """Output 2: Total trips done on target day"""
-        print("\n" + "="*50)
-        print(f"📊 OUTPUT 2: TOTAL TRIPS ON {self.target_date.strftime('%Y-%m-%d')}")
-        print("="*50)
-        
-        day_data = self.df[self.df['Date'] == self.target_date]
-        total_trips = len(day_data)
-        
-        if total_trips == 0:
-            print(f"⚠️  No trips found for {self.target_date.strftime('%Y-%m-%d')}")
-            # Get closest date with data
-            available_dates = sorted(self.df['Date'].unique())
-            closest_date = min(available_dates, key=lambda x: abs((x - self.target_date).days))
-            day_data = self.df[self.df['Date'] == closest_date]
-            total_trips = len(day_data)
-            print(f"📅 Showing data for closest available date: {closest_date.strftime('%Y-%m-%d')}")
-            self.target_date = closest_date
-        
-        # Additional statistics for the day
-        total_weight = day_data['Net Weight'].sum() if 'Net Weight' in day_data.columns else 0
-        unique_vehicles = day_data['Vehicle No'].nunique() if 'Vehicle No' in day_data.columns else 0
-        unique_sites = day_data['site'].nunique() if 'site' in day_data.columns else 0
-        
-        print(f"🚛 Total Trips: {total_trips:,}")
-        print(f"⚖️  Total Net Weight: {total_weight:,.0f} kg")
-        print(f"🚚 Unique Vehicles: {unique_vehicles}")
-        print(f"📍 Sites Covered: {unique_sites}")
+        requested_date = self.target_date
+        self._print("\n" + "="*50)
+        self._print(f"📊 OUTPUT 2: TOTAL TRIPS ON {requested_date.strftime('%Y-%m-%d')}")
+        self._print("="*50)
         
-        return {
-            'date': self.target_date,
-            'total_trips': total_trips,
-            'total_weight': total_weight,
-            'unique_vehicles': unique_vehicles,
-            'unique_sites': unique_sites
-        }
+        result = dict(self.compute_outputs().day._asdict())
+        
+        if result['date'] != requested_date:
+            self._print(f"⚠️  No trips found for {requested_date.strftime('%Y-%m-%d')}")
+            self._print(f"📅 Showing data for closest available date: {result['date'].strftime('%Y-%m-%d')}")
+        
+        self._print(f"🚛 Total Trips: {result['total_trips']:,}")
+        self._print(f"⚖️  Total Net Weight: {result['total_weight']:,.0f} kg")
+        self._print(f"🚚 Unique Vehicles: {result['unique_vehicles']}")
+        self._print(f"📍 Sites Covered: {result['unique_sites']}")
+        
+        return result
     
     def output_3_trips_per_hour(self):
         """Output 3: DataFrame with trips per hour for target day"""
-        print("\n" + "="*50)
-        print(f"⏰ OUTPUT 3: TRIPS PER HOUR ON {self.target_date.strftime('%Y-%m-%d')}")
-        print("="*50)
-        
-        day_data = self.df[self.df['Date'] == self.target_date].copy()
-        
-        if len(day_data) == 0:
-            print("No data available for the target date")
-            return pd.DataFrame()
-        
-        # Create hourly summary
-        hourly_stats = day_data.groupby('hour').agg({
-            'Ticket No': 'count',
-            'Net Weight': ['sum', 'mean'],
-            'Vehicle No': 'nunique',
-            'site': 'nunique'
-        }).round(2)
+        hourly_stats = self.compute_outputs().hourly
+        if not self.verbose:
+            return hourly_stats
+        self._print("\n" + "="*50)
+        self._print(f"⏰ OUTPUT 3: TRIPS PER HOUR ON {self.target_date.strftime('%Y-%m-%d')}")
+        self._print("="*50)
         
-        # Flatten column names
-        hourly_stats.columns = ['Trip_Count', 'Total_Weight_kg', 'Avg_Weight_kg', 'Unique_Vehicles', 'Unique_Sites']
-        hourly_stats.index.name = 'Hour'
+        if len(hourly_stats) == 0:
+            self._print("No data available for the target date")
+            return hourly_stats
         
-        # Add hour labels
-        hourly_stats['Time_Period'] = hourly_stats.index.map(lambda x: f"{x:02d}:00-{x+1:02d}:00")
-        
-        # Reorder columns
-        hourly_stats = hourly_stats[['Time_Period', 'Trip_Count', 'Total_Weight_kg', 'Avg_Weight_kg', 'Unique_Vehicles', 'Unique_Sites']]
-        
-        print("Hourly Trip Distribution:")
-        print(hourly_stats.to_string())
+        self._print("Hourly Trip Distribution:")
+        self._print(hourly_stats.set_index('Hour').to_string())
         
         # Peak hour analysis
-        peak_hour = hourly_stats['Trip_Count'].idxmax()
-        peak_trips = hourly_stats.loc[peak_hour, 'Trip_Count']
-        print(f"\n🔥 Peak Hour: {peak_hour}:00-{peak_hour+1}:00 with {peak_trips} trips")
+        peak = hourly_stats.loc[hourly_stats['Trip_Count'].idxmax()]
+        peak_hour = int(peak['Hour'])
+        self._print(f"\n🔥 Peak Hour: {peak_hour}:00-{peak_hour+1}:00 with {peak['Trip_Count']} trips")
         
-        return hourly_stats.reset_index()
+        return hourly_stats
     
     def output_4_cluster_performance(self):
         """Output 4: DataFrame with cluster-wide performance for all sites"""
-        print("\n" + "="*50)
-        print("🏘️  OUTPUT 4: CLUSTER-WIDE PERFORMANCE")
-        print("="*50)
-        
-        # Group by cluster and site for comprehensive analysis
-        cluster_performance = self.df.groupby(['cluster', 'site']).agg({
-            'Ticket No': 'count',
-            'Net Weight': ['sum', 'mean', 'std'],
-            'Vehicle No': 'nunique',
-            'Date': ['min', 'max'],
-            'agency': lambda x: x.mode().iloc[0] if len(x.mode()) > 0 else 'Unknown'
-        }).round(2)
+        self._print("\n" + "="*50)
+        self._print("🏘️  OUTPUT 4: CLUSTER-WIDE PERFORMANCE")
+        self._print("="*50)
         
-        # Flatten column names
-        cluster_performance.columns = [
-            'Total_Trips', 'Total_Weight_kg', 'Avg_Weight_per_Trip', 'Weight_Std_Dev',
-            'Unique_Vehicles', 'First_Trip_Date', 'Last_Trip_Date', 'Primary_Agency'
-        ]
-        
-        # Calculate additional metrics
-        cluster_performance['Days_Active'] = (
-            pd.to_datetime(cluster_performance['Last_Trip_Date']) - 
-            pd.to_datetime(cluster_performance['First_Trip_Date'])
-        ).dt.days + 1
-        
-        cluster_performance['Trips_per_Day'] = (
-            cluster_performance['Total_Trips'] / cluster_performance['Days_Active']
-        ).round(2)
+        cluster_performance = self.compute_outputs().cluster_performance
+        if not self.verbose:
+            return cluster_performance
         
-        cluster_performance['Weight_per_Day_kg'] = (
-            cluster_performance['Total_Weight_kg'] / cluster_performance['Days_Active']
-        ).round(2)
-        
-        # Sort by total trips
-        cluster_performance = cluster_performance.sort_values('Total_Trips', ascending=False)
-        
-        print("Cluster Performance Summary:")
-        print(cluster_performance.to_string())
+        self._print("Cluster Performance Summary:")
+        self._print(cluster_performance.set_index(['cluster', 'site']).to_string())
         
         # Top performing clusters
-        print(f"\n🏆 Top Performing Site: {cluster_performance.index[0]} with {cluster_performance.iloc[0]['Total_Trips']} trips")
+        top = cluster_performance.iloc[0]
+        self._print(f"\n🏆 Top Performing Site: {(top['cluster'], top['site'])} with {top['Total_Trips']} trips")
         
-        return cluster_performance.reset_index()
+        return cluster_performance
     
     def output_5_daily_trends(self):
         """Output 5: Daily trends analysis"""
-        print("\n" + "="*50)
-        print("📈 OUTPUT 5: DAILY TRENDS ANALYSIS")
-        print("="*50)
-        
-        daily_stats = self.df.groupby('Date').agg({
-            'Ticket No': 'count',
-            'Net Weight': 'sum',
-            'Vehicle No': 'nunique',
-            'site': 'nunique'
-        }).round(2)
+        self._print("\n" + "="*50)
+        self._print("📈 OUTPUT 5: DAILY TRENDS ANALYSIS")
+        self._print("="*50)
         
-        daily_stats.columns = ['Daily_Trips', 'Daily_Weight_kg', 'Daily_Vehicles', 'Daily_Sites']
-        
-        # Calculate moving averages
-        daily_stats['Trips_7day_MA'] = daily_stats['Daily_Trips'].rolling(window=7).mean().round(2)
-        daily_stats['Weight_7day_MA'] = daily_stats['Daily_Weight_kg'].rolling(window=7).mean().round(2)
+        daily_stats = self.compute_outputs().daily_trends
+        if not self.verbose:
+            return daily_stats
         
         # Recent performance (last 7 days)
-        recent_data = daily_stats.tail(7)
+        recent_data = daily_stats.set_index('Date').tail(7)
         avg_recent_trips = recent_data['Daily_Trips'].mean()
         avg_recent_weight = recent_data['Daily_Weight_kg'].mean()
         
-        print(f"📊 Recent 7-day Average:")
-        print(f"   Trips per day: {avg_recent_trips:.1f}")
-        print(f"   Weight per day: {avg_recent_weight:,.0f} kg")
+        self._print(f"📊 Recent 7-day Average:")
+        self._print(f"   Trips per day: {avg_recent_trips:.1f}")
+        self._print(f"   Weight per day: {avg_recent_weight:,.0f} kg")
         
         # Show recent trends
-        print(f"\n📅 Last 7 Days Performance:")
-        print(recent_data[['Daily_Trips', 'Daily_Weight_kg', 'Daily_Vehicles']].to_string())
+        self._print(f"\n📅 Last 7 Days Performance:")
+        self._print(recent_data[['Daily_Trips', 'Daily_Weight_kg', 'Daily_Vehicles']].to_string())
         
-        return daily_stats.reset_index()
+        return daily_stats
     
     def output_6_vehicle_utilization(self):
         """Output 6: Vehicle utilization analysis"""
-        print("\n" + "="*50)
-        print("🚛 OUTPUT 6: VEHICLE UTILIZATION ANALYSIS")
-        print("="*50)
-        
-        vehicle_stats = self.df.groupby('Vehicle No').agg({
-            'Ticket No': 'count',
-            'Net Weight': ['sum', 'mean'],
-            'Date': ['min', 'max', 'nunique'],
-            'site': 'nunique',
-            'cluster': lambda x: x.mode().iloc[0] if len(x.mode()) > 0 else 'Unknown'
-        }).round(2)
-        
-        vehicle_stats.columns = [
-            'Total_Trips', 'Total_Weight_kg', 'Avg_Weight_per_Trip',
-            'First_Trip', 'Last_Trip', 'Days_Active', 'Sites_Served', 'Primary_Cluster'
-        ]
+        self._print("\n" + "="*50)
+        self._print("🚛 OUTPUT 6: VEHICLE UTILIZATION ANALYSIS")
+        self._print("="*50)
         
-        # Calculate utilization metrics
-        vehicle_stats['Trips_per_Active_Day'] = (
-            vehicle_stats['Total_Trips'] / vehicle_stats['Days_Active']
-        ).round(2)
-        
-        # Sort by total trips
-        vehicle_stats = vehicle_stats.sort_values('Total_Trips', ascending=False)
+        vehicle_stats = self.compute_outputs().vehicle_utilization
+        if not self.verbose:
+            return vehicle_stats
         
         # Show top performers
-        top_vehicles = vehicle_stats.head(10)
-        print("Top 10 Most Active Vehicles:")
-        print(top_vehicles[['Total_Trips', 'Total_Weight_kg', 'Days_Active', 'Trips_per_Active_Day']].to_string())
+        top_vehicles = vehicle_stats.set_index('Vehicle No').head(10)
+        self._print("Top 10 Most Active Vehicles:")
+        self._print(top_vehicles[['Total_Trips', 'Total_Weight_kg', 'Days_Active', 'Trips_per_Active_Day']].to_string())
         
-        print(f"\n📋 Fleet Summary:")
-        print(f"   Total Vehicles: {len(vehicle_stats)}")
-        print(f"   Average Trips per Vehicle: {vehicle_stats['Total_Trips'].mean():.1f}")
-        print(f"   Most Active Vehicle: {vehicle_stats.index[0]} ({vehicle_stats.iloc[0]['Total_Trips']} trips)")
+        self._print(f"\n📋 Fleet Summary:")
+        self._print(f"   Total Vehicles: {len(vehicle_stats)}")
+        self._print(f"   Average Trips per Vehicle: {vehicle_stats['Total_Trips'].mean():.1f}")
+        self._print(f"   Most Active Vehicle: {vehicle_stats.iloc[0]['Vehicle No']} ({vehicle_stats.iloc[0]['Total_Trips']} trips)")
         
-        return vehicle_stats.reset_index()
+        return vehicle_stats
     
     def output_7_material_breakdown(self):
         """Output 7: Material type analysis"""
-        print("\n" + "="*50)
-        print("🗂️  OUTPUT 7: MATERIAL TYPE BREAKDOWN")
-        print("="*50)
-        
-        material_stats = self.df.groupby('Material Name').agg({
-            'Ticket No': 'count',
-            'Net Weight': ['sum', 'mean'],
-            'Vehicle No': 'nunique',
-            'site': 'nunique'
-        }).round(2)
-        
-        material_stats.columns = ['Total_Trips', 'Total_Weight_kg', 'Avg_Weight_per_Trip', 'Vehicles_Used', 'Sites_Collected']
+        self._print("\n" + "="*50)
+        self._print("🗂️  OUTPUT 7: MATERIAL TYPE BREAKDOWN")
+        self._print("="*50)
         
-        # Calculate percentages
-        material_stats['Percentage_of_Trips'] = (material_stats['Total_Trips'] / material_stats['Total_Trips'].sum() * 100).round(2)
-        material_stats['Percentage_of_Weight'] = (material_stats['Total_Weight_kg'] / material_stats['Total_Weight_kg'].sum() * 100).round(2)
+        material_stats = self.compute_outputs().materials
+        if not self.verbose:
+            return material_stats
         
-        material_stats = material_stats.sort_values('Total_Weight_kg', ascending=False)
-        
-        print("Material Type Analysis:")
-        print(material_stats.to_string())
+        self._print("Material Type Analysis:")
+        self._print(material_stats.set_index('Material Name').to_string())
         
         # Dominant material
-        dominant_material = material_stats.index[0]
-        print(f"\n🏆 Dominant Material: {dominant_material}")
-        print(f"   {material_stats.loc[dominant_material, 'Percentage_of_Weight']:.1f}% of total weight")
+        dominant = material_stats.iloc[0]
+        self._print(f"\n🏆 Dominant Material: {dominant['Material Name']}")
+        self._print(f"   {dominant['Percentage_of_Weight']:.1f}% of total weight")
         
-        return material_stats.reset_index()
+        return material_stats
     
     def output_8_efficiency_metrics(self):
         """Output 8: Overall efficiency and KPI metrics"""
-        print("\n" + "="*50)
-        print("⚡ OUTPUT 8: EFFICIENCY & KPI METRICS")
-        print("="*50)
-        
-        # Calculate various efficiency metrics
-        total_trips = len(self.df)
-        total_weight = self.df['Net Weight'].sum()
-        total_days = (self.df['Date'].max() - self.df['Date'].min()).days + 1
-        unique_vehicles = self.df['Vehicle No'].nunique()
-        unique_sites = self.df['site'].nunique()
-        
-        # Create efficiency metrics DataFrame
-        metrics = {
-            'Metric': [
-                'Total Trips',
-                'Total Weight Collected (kg)',
-                'Average Weight per Trip (kg)',
-                'Total Active Days',
-                'Average Trips per Day',
-                'Average Weight per Day (kg)',
-                'Fleet Size (Unique Vehicles)',
-                'Sites Covered',
-                'Average Trips per Vehicle',
-                'Vehicle Utilization Rate (%)',
-                'Weight Efficiency (kg/vehicle/day)'
-            ],
-            'Value': [
-                f"{total_trips:,}",
-                f"{total_weight:,.0f}",
-                f"{total_weight/total_trips:.1f}",
-                f"{total_days}",
-                f"{total_trips/total_days:.1f}",
-                f"{total_weight/total_days:,.0f}",
-                f"{unique_vehicles}",
-                f"{unique_sites}",
-                f"{total_trips/unique_vehicles:.1f}",
-                f"{(self.df.groupby('Vehicle No')['Date'].nunique().mean() / total_days * 100):.1f}",
-                f"{(total_weight / unique_vehicles / total_days):,.0f}"
-            ]
-        }
+        self._print("\n" + "="*50)
+        self._print("⚡ OUTPUT 8: EFFICIENCY & KPI METRICS")
+        self._print("="*50)
         
-        kpi_df = pd.DataFrame(metrics)
+        kpi_df = self.compute_outputs().kpis
+        if not self.verbose:
+            return kpi_df
         
-        print("Key Performance Indicators:")
-        for _, row in kpi_df.iterrows():
-            print(f"  📊 {row['Metric']}: {row['Value']}")
+        self._print("Key Performance Indicators:")
+        for metric, value in zip(kpi_df['Metric'], kpi_df['Value']):
+            self._print(f"  📊 {metric}: {value}")
         
         # Performance benchmarks
-        print(f"\n🎯 Performance Assessment:")
-        trips_per_day = total_trips / total_days
+        self._print(f"\n🎯 Performance Assessment:")
+        total_days = (self.df['Date'].max() - self.df['Date'].min()).days + 1
+        trips_per_day = len(self.df) / total_days
         if trips_per_day > 100:
-            print(f"   ✅ High Activity: {trips_per_day:.1f} trips/day")
+            self._print(f"   ✅ High Activity: {trips_per_day:.1f} trips/day")
         elif trips_per_day > 50:
-            print(f"   🟡 Moderate Activity: {trips_per_day:.1f} trips/day") 
+            self._print(f"   🟡 Moderate Activity: {trips_per_day:.1f} trips/day") 
         else:
-            print(f"   🔴 Low Activity: {trips_per_day:.1f} trips/day")
+            self._print(f"   🔴 Low Activity: {trips_per_day:.1f} trips/day")
             
         return kpi_df
     
+    def trip_cycle_analysis(self, gap_hours=SESSION_GAP_HOURS):
+        """Trip cycles: time at the weighbridge, turnaround and trips per shift, per vehicle and site"""
+        in_col = 'load_timestamp' if 'load_timestamp' in self.df.columns else 'datetime'
+        out_col = 'empty_timestamp' if 'empty_timestamp' in self.df.columns else None
+        result = fleet_efficiency(self.df, in_col=in_col, out_col=out_col, gap_hours=gap_hours)
+        if not self.verbose:
+            return result
+        
+        self._print("\n" + "="*50)
+        self._print("🔁 TRIP CYCLE ANALYSIS")
+        self._print("="*50)
+        
+        self._print("Top 10 Vehicles by Trips:")
+        self._print(result.vehicles.set_index('Vehicle No').head(10)[
+            ['Trips', 'Trips_per_Shift', 'Median_Dwell_min', 'Median_Turnaround_min', 'Active_Hours']].to_string())
+        
+        self._print("\n📍 Site Turnaround:")
+        self._print(result.sites.set_index('site').to_string())
+        
+        return result
+    
     def generate_all_outputs(self):
         """Generate all 8 outputs"""
         if self.df is None:
-            print("❌ Cannot generate outputs: No data loaded")
-            print("Please fix the file path issue first.")
+            self._print("❌ Cannot generate outputs: No data loaded")
+            self._print("Please fix the file path issue first.")
             return {}
             
-        print("🚀 WASTE MANAGEMENT DATA ANALYSIS")
-        print("=" * 60)
+        self._print("🚀 WASTE MANAGEMENT DATA ANALYSIS")
+        self._print("=" * 60)
         
         results = {}
         
@@ -426,19 +1172,37 @@ class WasteManagementAnalyzer:
             results['output_7'] = self.output_7_material_breakdown()
             results['output_8'] = self.output_8_efficiency_metrics()
             
-            print("\n" + "="*60)
-            print("✅ ALL OUTPUTS GENERATED SUCCESSFULLY!")
-            print("="*60)
+            self._print("\n" + "="*60)
+            self._print("✅ ALL OUTPUTS GENERATED SUCCESSFULLY!")
+            self._print("="*60)
             
         except Exception as e:
-            print(f"❌ Error generating outputs: {e}")
+            if not self.verbose:
+                raise
+            self._print(f"❌ Error generating outputs: {e}")
             import traceback
             traceback.print_exc()
             
         return results
 
+
+def analyze(data_file_path=None, target_date=None, df=None, cache_dir=None, exact_counts=False):
+    """
+    Headless analysis: load (or take) the trips and return all outputs as AnalysisResults.
+
+    Nothing is printed and errors are raised rather than reported.
+    """
+    analyzer = WasteManagementAnalyzer(data_file_path, target_date=target_date, verbose=False, df=df,
+                                       cache_dir=cache_dir, exact_counts=exact_counts)
+    if analyzer.df is None:
+        raise FileNotFoundError(f"Could not find data file '{data_file_path}'")
+    return analyzer.compute_outputs()
+
+
 # USAGE EXAMPLE:
 if __name__ == "__main__":
+    warnings.filterwarnings('ignore')
+
     # Method 1: Try with just the filename (if in same directory)
     print("🔍 Attempting to load data...")
     print("📁 Current working directory:", os.getcwd())
@@ -8,13 +8,22 @@ Author: <your‑name>
 Date: 2025‑06‑16
 """
 
+import argparse
+import codecs
 import csv
 import datetime as dt
+import io
+import json
 import os
 import sys
-from typing import List, Dict, Any
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # ---------------------------------------------------------------------------
 # CONFIGURATION
@@ -31,9 +40,33 @@ ENDPOINTS: List[str] = [
     "https://zigmaglobal.in/allipuram/api/product/search.php",
 ]
 
-# Output folder and file name pattern
+# Fetching: endpoints are pulled concurrently over one pooled session
+MAX_CONCURRENCY = len(ENDPOINTS)  # simultaneous requests - every endpoint at once
+CONNECT_TIMEOUT = 5            # seconds
+READ_TIMEOUT = 15              # seconds, default per endpoint
+ENDPOINT_READ_TIMEOUTS: Dict[str, float] = {}  # per-endpoint overrides (slow sites)
+MAX_RETRIES = 3                # retries on connection errors / 429 / 5xx
+BACKOFF_FACTOR = 0.5           # sleeps 0.5s, 1s, 2s ... between retries
+
+# Output folder, canonical dataset and per-endpoint watermark store
 OUTPUT_DIR = "./output"
-FILENAME_PATTERN = "zigma_weight_records_{ts}.csv"  # ts will be YYYYMMDD_HHMMSS
+CANONICAL_FILENAME = "zigma_weight_records.csv"
+WATERMARK_FILENAME = "zigma_watermarks.json"
+RECENT_KEYS_FILENAME = "zigma_recent_keys.json"
+
+# Records up to this many days before an endpoint's watermark are pulled again
+# (late or backdated tickets) and deduplicated against the recent-key window
+KEY_WINDOW_DAYS = 3
+
+# Formats tried when parsing the API's Date / Time fields
+DATE_FORMATS = ["%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%d/%m/%y", "%Y/%m/%d"]
+TIME_FORMATS = ["%H:%M:%S", "%H:%M", "%I:%M:%S %p", "%I:%M %p"]
+
+# A record is identified by its endpoint and ticket number
+DEDUP_KEY = ("_source_file", "ticket_no")
+
+# Records with an unparseable Date are logged individually up to this many per endpoint
+MAX_UNDATED_LOGGED = 5
 
 # Swaccha Andhra canonical column order
 COLUMN_ORDER: List[str] = [
@@ -85,63 +118,498 @@ def transform_record(raw: Dict[str, Any]) -> Dict[str, Any]:
 
     return rec
 
+# ---------------------------------------------------------------------------
+# STREAMING JSON
+# ---------------------------------------------------------------------------
+# Responses are parsed incrementally: only the current record and one network
+# chunk are held in memory, whatever the payload size.
+
+STREAM_CHUNK_SIZE = 64 * 1024
+_WHITESPACE = " \t\r\n"
+_DELIMITERS = _WHITESPACE + ",:]}"
+
+
+class _JsonStream:
+    """Text buffer over an iterator of chunks, decoding one JSON value at a time."""
+
+    def __init__(self, chunks: Iterator[str]):
+        self._chunks = iter(chunks)
+        self._decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        for chunk in self._chunks:
+            if chunk:
+                # Drop consumed text so the buffer stays about one chunk long
+                self.buf = self.buf[self.pos:] + chunk
+                self.pos = 0
+                return True
+        self.eof = True
+        return False
+
+    def peek(self) -> str:
+        """Next non-whitespace character ('' at end of input)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos}, found {self.peek()!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+                # A number may continue in the next chunk - only trust it once a delimiter follows
+                if self.eof or (end < len(self.buf) and self.buf[end] in _DELIMITERS):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            if not self._fill():
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+                self.pos = end
+                return value
+
+    def array_items(self) -> Iterator[Any]:
+        """Yield the elements of the array starting at the current position."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            separator = self.peek()
+            self.pos += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or ']' in array, found {separator!r}")
+
+
+def iter_json_records(chunks: Iterator[str]) -> Iterator[Any]:
+    """
+    Stream the records of a payload that is either a JSON array or an object
+    holding the records as its first list value (the two shapes the API returns).
+    """
+    stream = _JsonStream(chunks)
+    first = stream.peek()
+    if first == "[":
+        yield from stream.array_items()
+        return
+    if first != "{":
+        raise ValueError(f"Unrecognized payload structure (starts with {first!r})")
+
+    stream.expect("{")
+    while stream.peek() not in ("}", ""):
+        stream.value()          # key
+        stream.expect(":")
+        if stream.peek() == "[":
+            yield from stream.array_items()
+            return
+        stream.value()          # non-list value - skip
+        if stream.peek() == ",":
+            stream.pos += 1
+    raise ValueError("Object payload contains no list of records")
+
+
+def iter_response_text(resp: requests.Response) -> Iterator[str]:
+    """Decoded text chunks of a streamed response."""
+    decoder = codecs.getincrementaldecoder(resp.encoding or "utf-8")(errors="replace")
+    for chunk in resp.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+        yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
 # ---------------------------------------------------------------------------
 # DATA COLLECTION
 # ---------------------------------------------------------------------------
 
-def fetch_endpoint(url: str) -> List[Dict[str, Any]]:
-    """Return list of JSON records from endpoint (or empty list on error)."""
+def build_session(pool_size: int = MAX_CONCURRENCY) -> requests.Session:
+    """Session with a shared connection pool and exponential-backoff retries."""
+    retry = Retry(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        read=MAX_RETRIES,
+        status=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def endpoint_timeout(url: str) -> Tuple[float, float]:
+    """(connect, read) timeout for an endpoint."""
+    return CONNECT_TIMEOUT, ENDPOINT_READ_TIMEOUTS.get(url, READ_TIMEOUT)
+
+
+def stream_endpoint(url: str, session: Optional[requests.Session] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield JSON records from endpoint as they are parsed.
+
+    A failure part-way through (truncated body, reset, timeout) is re-raised
+    after the records parsed so far, so callers can tell a partial stream
+    from a complete one.
+    """
+    session = session or build_session(pool_size=1)
     try:
-        resp = requests.get(url, timeout=15)
-        resp.raise_for_status()
-        data = resp.json()
-        # API may return a list directly or a dict with a key – handle both
-        if isinstance(data, list):
-            return data
-        elif isinstance(data, dict):
-            # find first list value within dict
-            for v in data.values():
-                if isinstance(v, list):
-                    return v
-        print(f"Warning: Unrecognized payload structure from {url}")
+        with session.get(url, timeout=endpoint_timeout(url), stream=True) as resp:
+            resp.raise_for_status()
+            # API may return a list directly or a dict with a key – handle both
+            for rec in iter_json_records(iter_response_text(resp)):
+                if isinstance(rec, dict):
+                    yield rec
     except Exception as exc:
         print(f"Error fetching {url}: {exc}")
-    return []
+        raise
+
+
+def fetch_endpoint(url: str, session: Optional[requests.Session] = None) -> List[Dict[str, Any]]:
+    """Return list of JSON records from endpoint (or empty list on error)."""
+    try:
+        return list(stream_endpoint(url, session))
+    except Exception:
+        return []
+
+
+# ---------------------------------------------------------------------------
+# WATERMARKS
+# ---------------------------------------------------------------------------
+# Each endpoint's watermark is the (timestamp, ticket number) of the newest
+# record already appended to the canonical dataset - the maximum over every
+# record pulled, whatever order the API returns them in. Only records past it,
+# or less than KEY_WINDOW_DAYS before it, are transformed; the watermark is
+# saved after the rows are on disk, and a crash in between only re-pulls rows
+# that the dedup key then drops. Records
+# whose Date cannot be parsed have no position: they are always pulled, left
+# to the dedup key, and never move the watermark.
+
+def _parse_first(value: str, formats: List[str]):
+    for fmt in formats:
+        try:
+            return dt.datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def record_position(raw: Dict[str, Any]) -> Tuple[str, int, str]:
+    """Sortable position of a raw API record: (ISO timestamp, numeric ticket, ticket)."""
+    date_value = str(raw.get("Date", "")).strip()
+    time_value = str(raw.get("Time", "")).strip()
+
+    day = _parse_first(date_value, DATE_FORMATS)
+    clock = _parse_first(time_value, TIME_FORMATS)
+    if day is None:
+        timestamp = ""
+    else:
+        if clock is not None:
+            day = day.replace(hour=clock.hour, minute=clock.minute, second=clock.second)
+        timestamp = day.strftime("%Y-%m-%d %H:%M:%S")
+
+    ticket = str(raw.get("Ticket No", "")).strip()
+    digits = "".join(ch for ch in ticket if ch.isdigit())
+    return timestamp, int(digits) if digits else -1, ticket
+
+
+def load_watermarks(path: str) -> Dict[str, Dict[str, Any]]:
+    """endpoint -> {"timestamp", "ticket_no", "ticket_num", "updated_at"}"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_watermarks(path: str, watermarks: Dict[str, Dict[str, Any]]):
+    """Write the watermark store atomically (temp file + rename)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(watermarks, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def watermark_position(mark: Optional[Dict[str, Any]]) -> Optional[Tuple[str, int, str]]:
+    if not mark:
+        return None
+    return mark.get("timestamp", ""), mark.get("ticket_num", -1), mark.get("ticket_no", "")
+
+
+def advance_watermark(mark: Optional[Dict[str, Any]], position: Tuple[str, int, str]) -> Optional[Dict[str, Any]]:
+    """Return the watermark moved up to position if it is newer (undated positions never move it)."""
+    current = watermark_position(mark)
+    if not position[0] or (current is not None and position <= current):
+        return mark
+    timestamp, ticket_num, ticket = position
+    return {
+        "timestamp": timestamp,
+        "ticket_num": ticket_num,
+        "ticket_no": ticket,
+        "updated_at": dt.datetime.utcnow().isoformat(),
+    }
+
+
+def window_start(mark: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Timestamp KEY_WINDOW_DAYS before the watermark - the oldest record pulled again"""
+    if not mark or not mark.get("timestamp"):
+        return None
+    start = dt.datetime.strptime(mark["timestamp"], "%Y-%m-%d %H:%M:%S") - dt.timedelta(days=KEY_WINDOW_DAYS)
+    return start.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def in_pull_window(position: Tuple[str, int, str], mark: Optional[Dict[str, Any]]) -> bool:
+    """True if a record at position is pulled: within the window before the watermark or later, or undated"""
+    start = window_start(mark)
+    return start is None or not position[0] or position[0] >= start
+
+
+# ---------------------------------------------------------------------------
+# RECENT DEDUP KEYS
+# ---------------------------------------------------------------------------
+# Only records inside an endpoint's pull window can be appended again, so only
+# their keys are kept: key -> [record timestamp, date last seen], pruned to
+# records dated within the window (undated records: seen within the last
+# KEY_WINDOW_DAYS). The file also records the canonical CSV's size at save
+# time; rows appended after that (a run that died before saving) are read back
+# from that offset, so a poll never scans the full history.
+
+def _canonical_row_key(row: Dict[str, str]) -> Tuple[Tuple[str, ...], str]:
+    timestamp, _, _ = record_position({"Date": row.get("date", ""), "Time": row.get("time", ""),
+                                       "Ticket No": row.get("ticket_no", "")})
+    return tuple(row.get(col, "") for col in DEDUP_KEY), timestamp
+
+
+def read_canonical_keys(path: str, offset: int = 0) -> Dict[Tuple[str, ...], List[str]]:
+    """Keys of the canonical rows starting at byte offset (0: the whole file)."""
+    keys = {}
+    if not os.path.exists(path):
+        return keys
+    today = dt.date.today().isoformat()
+    with open(path, "rb") as raw:
+        header = next(csv.reader([raw.readline().decode("utf-8")]), None)
+        if not header:
+            return keys
+        if offset > raw.tell():
+            raw.seek(offset)
+        with io.TextIOWrapper(raw, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f, fieldnames=header):
+                key, timestamp = _canonical_row_key(row)
+                keys[key] = [timestamp, today]
+    return keys
+
+
+def load_recent_keys(path: str, canonical_path: str) -> Dict[Tuple[str, ...], List[str]]:
+    """The saved recent-key window plus the keys of canonical rows appended since it was saved."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        stored = {}
+
+    keys = {(ep, ticket): entry for ep, tickets in stored.get("keys", {}).items()
+            for ticket, entry in tickets.items()}
+    offset = stored.get("canonical_size", 0)
+    size = os.path.getsize(canonical_path) if os.path.exists(canonical_path) else 0
+    if offset > size:
+        print(f"{canonical_path} is smaller than when its keys were saved – re-reading it")
+        offset = 0
+    if offset < size:
+        keys.update(read_canonical_keys(canonical_path, offset))
+    return keys
+
+
+def save_recent_keys(path: str, keys: Dict[Tuple[str, ...], List[str]],
+                     watermarks: Dict[str, Dict[str, Any]], canonical_path: str):
+    """Prune the keys to each endpoint's pull window and write them atomically with the CSV size."""
+    seen_cutoff = (dt.date.today() - dt.timedelta(days=KEY_WINDOW_DAYS)).isoformat()
+    starts = {}
+    pruned = {}
+    for (ep, ticket), (timestamp, seen) in keys.items():
+        if ep not in starts:
+            starts[ep] = window_start(watermarks.get(ep))
+        start = starts[ep]
+        keep = (start is None or timestamp >= start) if timestamp else seen >= seen_cutoff
+        if keep:
+            pruned.setdefault(ep, {})[ticket] = [timestamp, seen]
+
+    size = os.path.getsize(canonical_path) if os.path.exists(canonical_path) else 0
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"canonical_size": size, "keys": pruned}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class CanonicalWriter:
+    """
+    Appends transformed rows to the canonical CSV as they arrive.
+
+    Thread-safe, and skips rows whose dedup key is in `keys` (the recent-key
+    window, or every key in the file for a full re-check). Keys written or
+    seen again are recorded in `keys` with their timestamp and today's date.
+    """
+
+    def __init__(self, path: str, keys: Dict[Tuple[str, ...], List[str]]):
+        self.path = path
+        self.appended = 0
+        self.keys = keys
+        self._today = dt.date.today().isoformat()
+        self._lock = threading.Lock()
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=COLUMN_ORDER)
+        if is_new:
+            self._writer.writeheader()
+
+    def write(self, rec: Dict[str, Any], timestamp: str = "") -> bool:
+        key = tuple(rec.get(col, "") for col in DEDUP_KEY)
+        with self._lock:
+            known = key in self.keys
+            self.keys[key] = [timestamp, self._today]
+            if known:
+                return False
+            self._writer.writerow(rec)
+            self.appended += 1
+            return True
+
+    def close(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 # ---------------------------------------------------------------------------
 # MAIN PIPELINE
 # ---------------------------------------------------------------------------
 
-def main():
-    # 1. Gather data from all endpoints
-    raw_records: List[Dict[str, Any]] = []
-    for ep in ENDPOINTS:
-        print(f"Fetching {ep} …")
-        for rec in fetch_endpoint(ep):
-            rec["_endpoint"] = ep  # annotate for lineage
-            raw_records.append(rec)
-    print(f"Fetched {len(raw_records)} total records.")
-
-    if not raw_records:
-        print("No data retrieved – exiting.")
-        sys.exit(1)
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Fetch Zigma weighbridge records into a CSV")
+    parser.add_argument("--endpoint", action="append", dest="endpoints",
+                        help="Endpoint URL to fetch (repeatable; default: all ENDPOINTS)")
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--full", action="store_true",
+                        help="Ignore watermarks and re-check every record against the whole canonical file")
+    return parser.parse_args(argv)
 
-    # 2. Transform records
-    transformed: List[Dict[str, Any]] = [transform_record(r) for r in raw_records]
 
-    # 3. Ensure output folder exists
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+def pull_endpoint(ep: str, session: requests.Session, mark: Optional[Dict[str, Any]],
+                  stored_mark: Optional[Dict[str, Any]], writer: CanonicalWriter):
+    """
+    Stream one endpoint: records in the pull window of `mark` are transformed
+    and written as they are parsed, the writer dropping keys it has already
+    seen. Returns (fetched, appended, new watermark, completed).
 
-    # 4. Write CSV
-    ts_str = dt.datetime.now().strftime("%Y%m%d_%H%M%S")
-    outfile = os.path.join(OUTPUT_DIR, FILENAME_PATTERN.format(ts=ts_str))
+    The new watermark is the maximum position over the whole response, so the
+    API's ordering does not matter. If the stream breaks, the rows written so
+    far are kept but the watermark stays at `stored_mark` and completed is
+    False: the records after the break may be older than those before it, and
+    advancing past a partial stream would skip them for good.
+    """
+    started = time.perf_counter()
+    fetched = appended = undated = 0
+    new_mark = stored_mark
+    try:
+        for raw in stream_endpoint(ep, session):
+            fetched += 1
+            raw["_endpoint"] = ep  # annotate for lineage
+            position = record_position(raw)
+            if not position[0]:
+                undated += 1
+                if undated <= MAX_UNDATED_LOGGED:
+                    print(f"Unparseable Date {raw.get('Date')!r} for ticket {position[2]!r} from {ep} "
+                          f"– pulled, deduplicated by ticket")
+            if not in_pull_window(position, mark):
+                continue
+            if writer.write(transform_record(raw), position[0]):
+                appended += 1
+            new_mark = advance_watermark(new_mark, position)
+    except Exception:
+        print(f"Incomplete stream from {ep} after {fetched} records ({appended} new) – watermark kept")
+        return fetched, appended, stored_mark, False
+    if undated:
+        print(f"{undated} records from {ep} had an unparseable Date")
+    print(f"Fetched {fetched} records from {ep} in {time.perf_counter() - started:.1f}s ({appended} new)")
+    return fetched, appended, new_mark, True
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    endpoints = args.endpoints or ENDPOINTS
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    watermark_path = os.path.join(args.output_dir, WATERMARK_FILENAME)
+    keys_path = os.path.join(args.output_dir, RECENT_KEYS_FILENAME)
+    outfile = os.path.join(args.output_dir, CANONICAL_FILENAME)
+
+    stored = load_watermarks(watermark_path)
+    watermarks = {} if args.full else stored
+    # Without watermarks every record is pulled, so only the whole file's keys can dedup them
+    keys = read_canonical_keys(outfile) if args.full else load_recent_keys(keys_path, outfile)
+
+    # 1. Stream all endpoints concurrently, appending new rows as they arrive
+    started = time.perf_counter()
+    print(f"Fetching {len(endpoints)} endpoints (max {args.max_concurrency} at a time) …")
+    session = build_session(pool_size=args.max_concurrency)
+    try:
+        with CanonicalWriter(outfile, keys) as writer, \
+                ThreadPoolExecutor(max_workers=max(1, args.max_concurrency)) as pool:
+            results = list(pool.map(
+                lambda ep: pull_endpoint(ep, session, watermarks.get(ep), stored.get(ep), writer),
+                endpoints
+            ))
+    finally:
+        session.close()
+
+    total_fetched = sum(fetched for fetched, _, _, _ in results)
+    print(f"Fetched {total_fetched} total records in {time.perf_counter() - started:.1f}s.")
+
+    if not total_fetched:
+        print("No data retrieved – exiting.")
+        sys.exit(1)
 
-    with open(outfile, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=COLUMN_ORDER)
-        writer.writeheader()
-        writer.writerows(transformed)
+    # 2. Move the watermarks now that the rows are on disk – only for endpoints
+    #    whose stream finished; the others are re-pulled from their old mark
+    incomplete = []
+    for ep, (_, _, new_mark, completed) in zip(endpoints, results):
+        if not completed:
+            incomplete.append(ep)
+        elif new_mark:
+            stored[ep] = new_mark
+    # Keys last: if this run dies before they are saved, the rows it appended
+    # are past the saved CSV size and are read back by the next run
+    save_watermarks(watermark_path, stored)
+    save_recent_keys(keys_path, writer.keys, stored, outfile)
+    if incomplete:
+        print(f"Watermarks not advanced for {len(incomplete)} incomplete endpoint(s): {', '.join(incomplete)}")
 
-    print(f"CSV written to {outfile} (rows: {len(transformed)})")
+    print(f"Appended {writer.appended} rows to {outfile}")
 
 
 if __name__ == "__main__":
@@ -5,18 +5,28 @@ Integrates properly with consolidated callbacks
 """
 
 import pandas as pd
+import numpy as np
 import logging
-from dash import html, dash_table, dcc
+from dash import html, dash_table, dcc, clientside_callback, ClientsideFunction, Input, Output
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import json
 import os
+from utils.columnar import encode_columnar
+from utils.compressed_io import resolve_csv_path, read_csv_any
+from data.entities import MISSING_ID, add_entity_codes, code_column, entity_mask
+from data.sketches import SketchRollup
 
 logger = logging.getLogger(__name__)
 
 # Global data storage
 _cached_data = None
+_distinct_rollup = (None, None)  # (frame, SketchRollup) for the frame it was built from
+
+# Rollup cells for distinct counts: one HyperLogLog sketch per day x agency x cluster x site
+DISTINCT_KEY_COLUMNS = ['Date', 'agency_id', 'cluster_id', 'site_id']
+DISTINCT_COUNT_COLUMNS = ['agency_id', 'site_id', 'vehicle_id']
 
 def load_csv_data():
     """
@@ -36,8 +46,9 @@ def load_csv_data():
         ]
         
         for path in possible_paths:
-            if os.path.exists(path):
-                csv_files.append(path)
+            resolved = resolve_csv_path(path)
+            if resolved:
+                csv_files.append(resolved)
         
         if csv_files:
             # Load the first found CSV file
@@ -50,7 +61,7 @@ def load_csv_data():
             
             for encoding in encodings:
                 try:
-                    df = pd.read_csv(csv_path, encoding=encoding)
+                    df = read_csv_any(csv_path, encoding=encoding)
                     logger.info(f"✅ Successfully loaded CSV with {encoding} encoding")
                     break
                 except UnicodeDecodeError:
@@ -80,6 +91,9 @@ def load_csv_data():
                     # Convert to string and clean
                     df[col] = df[col].astype(str).str.strip().str.lower()
             
+            # Integer agency/cluster/site/vehicle codes - filters and groupbys run on these
+            add_entity_codes(df)
+            
             logger.info(f"Successfully loaded and cleaned {len(df)} records from {csv_path}")
             return df
         
@@ -120,6 +134,7 @@ def get_sample_data():
     df = pd.DataFrame(sample_data)
     df['Date'] = pd.to_datetime(df['Date'])
     df['weight_tons'] = df['weight'] / 1000
+    add_entity_codes(df)
     
     logger.info(f"Using sample data with {len(df)} records")
     return df
@@ -201,6 +216,7 @@ def get_dynamic_filter_options(df):
 def filter_data(df, agency='all', cluster='all', site='all', start_date=None, end_date=None):
     """
     Apply filters to dataframe using your CSV columns directly
+    (matched on the integer entity codes when the loader added them)
     """
     if df.empty:
         return df
@@ -210,15 +226,15 @@ def filter_data(df, agency='all', cluster='all', site='all', start_date=None, en
         
         # Apply agency filter using 'agency' column
         if agency and agency != 'all' and 'agency' in filtered_df.columns:
-            filtered_df = filtered_df[filtered_df['agency'] == agency]
+            filtered_df = filtered_df[entity_mask(filtered_df, 'agency', [agency], 'agency')]
         
         # Apply cluster filter using 'cluster' column
         if cluster and cluster != 'all' and 'cluster' in filtered_df.columns:
-            filtered_df = filtered_df[filtered_df['cluster'] == cluster]
+            filtered_df = filtered_df[entity_mask(filtered_df, 'cluster', [cluster], 'cluster')]
         
         # Apply site filter using 'site' column
         if site and site != 'all' and 'site' in filtered_df.columns:
-            filtered_df = filtered_df[filtered_df['site'] == site]
+            filtered_df = filtered_df[entity_mask(filtered_df, 'site', [site], 'site')]
         
         # Apply date filters
         if 'Date' in filtered_df.columns:
@@ -243,9 +259,52 @@ def apply_filters_to_data(df, agency='all', cluster='all', site='all', start_dat
     """Alias for filter_data() - maintains compatibility"""
     return filter_data(df, agency, cluster, site, start_date, end_date)
 
-def create_filtered_data_display(filtered_df, theme):
+def get_distinct_rollup(df):
+    """Distinct-count sketches per rollup cell of df, rebuilt when a different frame is passed"""
+    global _distinct_rollup
+    if _distinct_rollup[0] is not df:
+        keys = [col for col in DISTINCT_KEY_COLUMNS if col in df.columns]
+        counted = [col for col in DISTINCT_COUNT_COLUMNS if col in df.columns]
+        _distinct_rollup = (df, SketchRollup.build(df, keys, counted))
+        logger.info(f"🧮 Distinct-count sketches built: {_distinct_rollup[1].stats()}")
+    return _distinct_rollup[1]
+
+def distinct_count(df, kind, agency='all', cluster='all', site='all', start_date=None, end_date=None, exact=False):
+    """
+    Number of distinct agencies/sites/vehicles among the rows filter_data() would return.
+
+    By default the count is approximate (HyperLogLog, merged from the sketches of
+    the selected day x agency x cluster x site cells); exact=True filters the rows
+    and counts them exactly.
+    """
+    column = code_column(kind)
+    if df.empty or column not in df.columns:
+        return 0
+
+    if exact:
+        codes = filter_data(df, agency, cluster, site, start_date, end_date)[column]
+        return int(codes[codes != MISSING_ID].nunique())
+
+    rollup = get_distinct_rollup(df)
+    cells = rollup.cells
+    selected = np.ones(len(cells), dtype=bool)
+    for key_kind, value in [('agency', agency), ('cluster', cluster), ('site', site)]:
+        if value and value != 'all' and code_column(key_kind) in cells.columns:
+            selected &= entity_mask(cells, key_kind, [value]).values
+    if 'Date' in cells.columns:
+        dates = pd.to_datetime(cells['Date'])
+        if start_date:
+            selected &= (dates >= pd.to_datetime(start_date)).values
+        if end_date:
+            selected &= (dates <= pd.to_datetime(end_date)).values
+    return rollup.count(column, selected)
+
+def create_filtered_data_display(filtered_df, theme, filters=None):
     """
     Create display component for filtered data - used by consolidated callbacks
+
+    With filters (the filter_data() arguments), the agency and vehicle cards are
+    answered from the cached data's distinct-count sketches instead of a scan.
     """
     try:
         if filtered_df.empty:
@@ -265,8 +324,12 @@ def create_filtered_data_display(filtered_df, theme):
         total_records = len(filtered_df)
         total_weight = filtered_df['Net Weight'].sum() if 'Net Weight' in filtered_df.columns else 0
         weight_tons = total_weight / 1000
-        unique_agencies = filtered_df['agency'].nunique() if 'agency' in filtered_df.columns else 0
-        unique_vehicles = filtered_df['Vehicle No'].nunique() if 'Vehicle No' in filtered_df.columns else 0
+        if filters is not None:
+            unique_agencies = distinct_count(get_cached_data(), 'agency', **filters)
+            unique_vehicles = distinct_count(get_cached_data(), 'vehicle', **filters)
+        else:
+            unique_agencies = filtered_df['agency'].nunique() if 'agency' in filtered_df.columns else 0
+            unique_vehicles = filtered_df['Vehicle No'].nunique() if 'Vehicle No' in filtered_df.columns else 0
         
         # Create summary cards
         summary_cards = html.Div([
@@ -374,7 +437,8 @@ def create_filtered_data_display(filtered_df, theme):
             display_df = display_df[available_columns]
         
         data_table = dash_table.DataTable(
-            data=display_df.to_dict('records'),
+            id='filtered-data-table',
+            data=[],  # Decoded clientside from 'filtered-data-table-store'
             columns=[{"name": col.title(), "id": col} for col in display_df.columns],
             style_table={'overflowX': 'auto'},
             style_cell={
@@ -406,6 +470,7 @@ def create_filtered_data_display(filtered_df, theme):
                 "color": theme["text_primary"],
                 "marginBottom": "1rem"
             }),
+            dcc.Store(id='filtered-data-table-store', data=encode_columnar(display_df)),
             data_table
         ])
         
@@ -427,6 +492,13 @@ def create_filtered_data_display(filtered_df, theme):
             })
         ])
 
+# Fill the recent-records DataTable from its columnar store (assets/columnar.js)
+clientside_callback(
+    ClientsideFunction(namespace='columnar', function_name='toRowData'),
+    Output('filtered-data-table', 'data'),
+    Input('filtered-data-table-store', 'data')
+)
+
 # Utility function to check if CSV file exists
 def check_csv_file():
     """Check if CSV file exists and return info"""
@@ -439,10 +511,11 @@ def check_csv_file():
     
     found_files = []
     for path in possible_paths:
-        if os.path.exists(path):
-            size = os.path.getsize(path)
+        resolved = resolve_csv_path(path)
+        if resolved:
+            size = os.path.getsize(resolved)
             found_files.append({
-                'path': path,
+                'path': resolved,
                 'size': size,
                 'size_mb': round(size / (1024 * 1024), 2)
             })
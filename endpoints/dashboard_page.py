@@ -700,7 +700,7 @@ def register_dashboard_routes(server):
             return {'error': 'Authentication required'}, 401
         
         try:
-            from data_loader import get_cached_data, filter_data
+            from data_loader import get_cached_data, filter_data, distinct_count
             
             # Get filter parameters from request
             agency = request.args.get('agency', 'all')
@@ -708,6 +708,7 @@ def register_dashboard_routes(server):
             site = request.args.get('site', 'all')
             start_date = request.args.get('start_date')
             end_date = request.args.get('end_date')
+            exact_counts = request.args.get('exact') == 'true'
             
             # Load and filter CSV data
             df = get_cached_data()
@@ -724,7 +725,10 @@ def register_dashboard_routes(server):
             # Calculate statistics
             record_count = len(filtered_df)
             total_weight = filtered_df['weight'].sum() if 'weight' in filtered_df.columns and not filtered_df.empty else 0
-            vehicle_count = filtered_df['vehicle'].nunique() if 'vehicle' in filtered_df.columns and not filtered_df.empty else 0
+            vehicle_count = 0
+            if 'vehicle' in filtered_df.columns and not filtered_df.empty:
+                vehicle_count = distinct_count(df, 'vehicle', agency, cluster, site, start_date, end_date,
+                                               exact=exact_counts)
             
             filter_response = {
                 "agency": agency,
@@ -735,6 +739,7 @@ def register_dashboard_routes(server):
                 "record_count": record_count,
                 "total_weight": f"{total_weight:,.0f} kg",
                 "vehicle_count": vehicle_count,
+                "vehicle_count_exact": exact_counts,
                 "timestamp": datetime.now().isoformat(),
                 "source": "CSV Data",
                 "total_records_available": len(df)
@@ -756,7 +761,7 @@ def register_dashboard_routes(server):
             return {'error': 'Authentication required'}, 401
         
         try:
-            from data_loader import get_cached_data, filter_data
+            from data_loader import get_cached_data, filter_data, distinct_count
             
             # Get filter parameters from request
             agency = request.args.get('agency', 'all')
@@ -764,6 +769,7 @@ def register_dashboard_routes(server):
             site = request.args.get('site', 'all')
             start_date = request.args.get('start_date')
             end_date = request.args.get('end_date')
+            exact_counts = request.args.get('exact') == 'true'
             
             # Load and filter CSV data
             df = get_cached_data()
@@ -780,7 +786,10 @@ def register_dashboard_routes(server):
             # Calculate statistics
             record_count = len(filtered_df)
             total_weight = filtered_df['Net Weight'].sum() if 'Net Weight' in filtered_df.columns and not filtered_df.empty else 0
-            vehicle_count = filtered_df['Vehicle No'].nunique() if 'Vehicle No' in filtered_df.columns and not filtered_df.empty else 0
+            vehicle_count = 0
+            if 'Vehicle No' in filtered_df.columns and not filtered_df.empty:
+                vehicle_count = distinct_count(df, 'vehicle', agency, cluster, site, start_date, end_date,
+                                               exact=exact_counts)
             
             filter_response = {
                 "agency": agency,
@@ -791,6 +800,7 @@ def register_dashboard_routes(server):
                 "record_count": record_count,
                 "total_weight": f"{total_weight:,.0f} kg",
                 "vehicle_count": vehicle_count,
+                "vehicle_count_exact": exact_counts,
                 "timestamp": datetime.now().isoformat(),
                 "source": "CSV Data with Cascading Filters",
                 "total_records_available": len(df)
@@ -0,0 +1,108 @@
+# endpoints/export_routes.py
+"""
+Filtered Data Export Endpoint
+Streams the current filter selection as CSV, gzip CSV or Parquet
+"""
+
+from flask import Response, request, session, jsonify, stream_with_context
+import logging
+
+from data.entities import drop_entity_codes
+from utils.data_export import (
+    EXPORT_FORMATS,
+    build_export_filename,
+    get_available_formats,
+    iter_export
+)
+
+logger = logging.getLogger(__name__)
+
+
+def get_admin_export_data():
+    """Admin dashboard selection (multi-select agency/cluster/site + date range)"""
+    from layouts.admin_dashboard import get_processed_dataframe, apply_admin_filters
+
+    df = get_processed_dataframe()
+    if df.empty:
+        return df
+
+    return apply_admin_filters(
+        df,
+        request.args.getlist('agency') or None,
+        request.args.getlist('cluster') or None,
+        request.args.getlist('site') or None,
+        request.args.get('start_date'),
+        request.args.get('end_date')
+    )
+
+
+def get_analytics_export_data():
+    """Analytics filter container selection (single agency/cluster/site + date range)"""
+    from data_loader import get_global_data, filter_data
+
+    df = get_global_data()
+    if df.empty:
+        return df
+
+    return filter_data(
+        df,
+        request.args.get('agency', 'all'),
+        request.args.get('cluster', 'all'),
+        request.args.get('site', 'all'),
+        request.args.get('start_date'),
+        request.args.get('end_date')
+    )
+
+
+EXPORT_SOURCES = {
+    'admin': get_admin_export_data,
+    'analytics': get_analytics_export_data,
+}
+
+
+def register_export_routes(server):
+    """Register the streaming export route"""
+
+    @server.route('/api/export/filtered-data')
+    def export_filtered_data():
+        """Stream the filtered selection as a file download"""
+        if not session.get('swaccha_session_id'):
+            return {'error': 'Authentication required'}, 401
+
+        fmt = request.args.get('format', 'csv')
+        source = request.args.get('source', 'admin')
+
+        if fmt not in get_available_formats():
+            return jsonify({
+                'error': 'Unsupported export format',
+                'available_formats': get_available_formats()
+            }), 400
+
+        if source not in EXPORT_SOURCES:
+            return jsonify({
+                'error': 'Unknown export source',
+                'available_sources': list(EXPORT_SOURCES)
+            }), 400
+
+        try:
+            df = drop_entity_codes(EXPORT_SOURCES[source]())
+            chunks = iter_export(df, fmt)  # Parquet resolves its schema here, before streaming
+        except Exception as e:
+            logger.error(f"❌ Error preparing export data: {e}")
+            return jsonify({
+                'error': 'Error preparing export data',
+                'message': str(e)
+            }), 500
+
+        filename = build_export_filename(fmt)
+        logger.info(f"📤 Streaming {len(df):,} records from '{source}' as {fmt}: {filename}")
+
+        return Response(
+            stream_with_context(chunks),
+            mimetype=EXPORT_FORMATS[fmt]['mimetype'],
+            headers={
+                'Content-Disposition': f'attachment; filename="{filename}"',
+                'X-Export-Records': str(len(df)),
+                'Cache-Control': 'no-store'
+            }
+        )
@@ -0,0 +1,95 @@
+# endpoints/lookup_routes.py
+"""
+Ticket and Vehicle Lookup Endpoints
+Point lookups served from the per-version lookup index (services/lookup_index.py)
+"""
+
+from flask import request, session, jsonify
+import json
+import logging
+
+from data.entities import drop_entity_codes
+from services.lookup_index import get_lookup_index, MAX_LOOKUP_ROWS
+from utils.columnar import encode_columnar
+
+logger = logging.getLogger(__name__)
+
+
+def lookup_response(index, positions):
+    """JSON body for matched rows - columnar unless ?format=records"""
+    df = drop_entity_codes(index.rows(positions))
+    wire_format = 'records' if request.args.get('format') == 'records' else 'columnar'
+    if wire_format == 'records':
+        records = json.loads(df.to_json(orient='records', date_format='iso'))
+    else:
+        records = encode_columnar(df)
+
+    return jsonify({
+        'success': True,
+        'count': int(len(positions)),
+        'truncated': bool(len(positions) > MAX_LOOKUP_ROWS),
+        'records_encoding': wire_format,
+        'records': records
+    })
+
+
+def register_lookup_routes(server):
+    """Register the ticket / vehicle / search lookup routes"""
+
+    @server.route('/api/lookup/ticket')
+    def lookup_ticket():
+        """?ticket=T0451[&site=Kurnool][&source=...] - hash lookup on (source, site, ticket)"""
+        if not session.get('swaccha_session_id'):
+            return {'error': 'Authentication required'}, 401
+
+        ticket = request.args.get('ticket', '').strip()
+        if not ticket:
+            return jsonify({'error': 'ticket is required'}), 400
+
+        try:
+            index = get_lookup_index()
+            positions = index.ticket_rows(ticket, request.args.get('site'), request.args.get('source'))
+            return lookup_response(index, positions)
+        except Exception as e:
+            logger.error(f"❌ Error looking up ticket {ticket}: {e}")
+            return jsonify({'error': 'Lookup failed', 'message': str(e)}), 500
+
+    @server.route('/api/lookup/vehicle/<vehicle>')
+    def lookup_vehicle(vehicle):
+        """Trips of a vehicle in time order, optionally within ?start_date=&end_date= (YYYY-MM-DD)"""
+        if not session.get('swaccha_session_id'):
+            return {'error': 'Authentication required'}, 401
+
+        try:
+            index = get_lookup_index()
+            if index.vehicle_col is None:
+                # Viz files written before vehicle_no was carried into the viz rows
+                return jsonify({
+                    'error': 'No vehicle column in the admin dataset',
+                    'message': 'Rebuild the viz partitions to add vehicle_no'
+                }), 404
+            positions = index.vehicle_rows(vehicle, request.args.get('start_date') or None,
+                                           request.args.get('end_date') or None)
+            return lookup_response(index, positions)
+        except ValueError as e:
+            return jsonify({'error': 'Invalid date', 'message': str(e)}), 400
+        except Exception as e:
+            logger.error(f"❌ Error looking up vehicle {vehicle}: {e}")
+            return jsonify({'error': 'Lookup failed', 'message': str(e)}), 500
+
+    @server.route('/api/lookup/search')
+    def lookup_search():
+        """?q=<ticket [site] | vehicle> - the admin grid search box, as an API"""
+        if not session.get('swaccha_session_id'):
+            return {'error': 'Authentication required'}, 401
+
+        try:
+            index = get_lookup_index()
+            positions = index.search(request.args.get('q', ''), request.args.get('start_date') or None,
+                                     request.args.get('end_date') or None)
+            return lookup_response(index, positions)
+        except ValueError as e:
+            return jsonify({'error': 'Invalid date', 'message': str(e)}), 400
+        except Exception as e:
+            logger.error(f"❌ Error in lookup search: {e}")
+            return jsonify({'error': 'Lookup failed', 'message': str(e)}), 500
@@ -3,7 +3,8 @@ import os
 import time
 from threading import Thread
 from datetime import datetime
-import pandas as pd
+
+from utils.compressed_io import resolve_csv_path, read_csv_any
 
 class CSVFileWatcher:
     def __init__(self, csv_path, callback_func=None, check_interval=2):
@@ -39,9 +40,9 @@ class CSVFileWatcher:
         print(f"⏹️ Stopped watching: {self.csv_path}")
         
     def _get_file_mtime(self):
-        """Get file modification time"""
+        """Get file modification time (of the plain or compressed file)"""
         try:
-            return os.path.getmtime(self.csv_path)
+            return os.path.getmtime(resolve_csv_path(self.csv_path) or self.csv_path)
         except OSError:
             return 0
             
@@ -80,12 +81,12 @@ def load_csv_data():
         csv_path = os.path.join('data', 'waste_management_data_updated.csv')
         
         # Check if file exists
-        if not os.path.exists(csv_path):
+        if not resolve_csv_path(csv_path):
             print(f"❌ CSV file not found: {csv_path}")
             return None
             
         # Load data
-        df = pd.read_csv(csv_path)
+        df = read_csv_any(csv_path)
         _latest_data = df
         _data_timestamp = datetime.now()
         
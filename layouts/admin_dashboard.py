@@ -5,6 +5,7 @@ ENHANCED: Admin Dashboard with minimal date filter and proper cascading filters
 2. Cross-join filtering: Agency -> Cluster -> Site cascade
 """
 
+import dash
 from dash import html, dcc, callback, Output, Input, State, callback_context
 import dash_ag_grid as dag
 from datetime import datetime, date
@@ -21,7 +22,12 @@ from flask import jsonify
 import flask
 import traceback
 import logging
-from dash import clientside_callback
+from dash import clientside_callback, ClientsideFunction
+from utils.columnar import encode_columnar, decode_columnar
+from utils.data_export import get_available_formats
+from services.admin_data_service import admin_data_service
+from services.lookup_index import get_lookup_index
+from data.entities import drop_entity_codes, entity_mask
 
 logger = logging.getLogger(__name__)
 
@@ -30,64 +36,9 @@ def get_current_theme():
     return session.get('current_theme', 'dark')
 
 def get_embedded_csv_data():
-    """Load CSV data from data/csv_data_combined.csv using pandas"""
+    """Get the admin CSV data as records (serialization boundary only - prefer get_processed_dataframe)"""
     try:
-        # 🔥 FIXED: Check multiple possible CSV file paths
-        possible_paths = [
-            'data/csv_data_combined.csv',
-            'data/csv_outputs_data_viz.csv',
-            'data/data.csv',
-            'csv_data_combined.csv',
-            'csv_outputs_data_viz.csv'
-        ]
-        
-        csv_path = None
-        for path in possible_paths:
-            if os.path.exists(path):
-                csv_path = path
-                break
-        
-        if not csv_path:
-            logger.error(f"❌ No CSV file found in any of these paths: {possible_paths}")
-            # 🔥 ADDED: Return sample data for testing if no CSV found
-            return get_sample_data_for_testing()
-        
-        logger.info(f"📁 Loading CSV from: {csv_path}")
-        
-        # Read the CSV file using pandas with proper encoding
-        try:
-            df = pd.read_csv(csv_path, encoding='utf-8')
-            logger.info(f"✅ Successfully loaded with UTF-8 encoding")
-        except UnicodeDecodeError:
-            try:
-                df = pd.read_csv(csv_path, encoding='latin-1')
-                logger.info(f"✅ Successfully loaded with Latin-1 encoding")
-            except:
-                df = pd.read_csv(csv_path, encoding='cp1252')
-                logger.info(f"✅ Successfully loaded with CP1252 encoding")
-        
-        # 🔥 FIXED: Debug CSV structure
-        logger.info(f"📋 CSV Columns detected: {list(df.columns)}")
-        logger.info(f"📊 CSV Shape: {df.shape}")
-        logger.info(f"📝 First few rows preview:")
-        for i, row in df.head(3).iterrows():
-            logger.info(f"   Row {i}: {dict(row)}")
-        
-        # Parse date column with DD-MM-YYYY format if it exists
-        date_columns = ['date', 'Date', 'DATE', 'transaction_date', 'Date_Time']
-        for date_col in date_columns:
-            if date_col in df.columns:
-                df['date_parsed'] = df[date_col].apply(parse_dd_mm_yyyy_date)
-                logger.info(f"📅 Parsed date column '{date_col}'. Sample dates: {df[date_col].head(3).tolist()}")
-                break
-        
-        logger.info(f"✅ Loaded {len(df)} records from CSV")
-        
-        # Convert DataFrame to dictionary format for JavaScript
-        csv_data = df.to_dict('records')
-        
-        return csv_data
-        
+        return admin_data_service.get_records()
     except Exception as e:
         logger.error(f"❌ Error loading CSV data: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
@@ -152,10 +103,10 @@ def get_sample_data_for_testing():
 def get_filter_options_from_embedded_data():
     """Extract unique filter options from CSV data using pandas"""
     try:
-        # 🔥 FIXED: Load CSV data with better error handling
-        csv_data = get_embedded_csv_data()
+        # 🔥 FIXED: Use the shared prepared frame - no records round trip
+        df = admin_data_service.get_frame()
         
-        if not csv_data:
+        if df.empty:
             logger.warning("⚠️ No CSV data available, returning empty options")
             return {
                 'agencies': ['No data available'],
@@ -165,8 +116,6 @@ def get_filter_options_from_embedded_data():
                 'machines': ['No data available']
             }
         
-        # Convert to DataFrame for easier processing
-        df = pd.DataFrame(csv_data)
         logger.info(f"🔍 Processing {len(df)} records to extract filter options")
         
         # 🔥 FIXED: Extract unique values with better column name detection
@@ -216,6 +165,61 @@ def get_filter_options_from_embedded_data():
             'machines': ['Error loading data']
         }
 
+def build_filter_hierarchy(df):
+    """
+    Build a compact Agency -> Cluster -> Site payload for the clientside cascade.
+
+    Names are stored once in 'agencies', 'clusters' and 'sites'; 'links' holds one
+    [agency_idx, cluster_idx, site_idx] triple per distinct combination (-1 = missing).
+    """
+    empty = {'agencies': [], 'clusters': [], 'sites': [], 'links': []}
+    if df is None or df.empty:
+        return empty
+
+    def find_column(possible_column_names):
+        for col_name in possible_column_names:
+            if col_name in df.columns:
+                return col_name
+        return None
+
+    agency_col = find_column(['agency_name', 'Agency', 'agency', 'AGENCY'])
+    cluster_col = find_column(['Cluster', 'cluster', 'CLUSTER'])
+    site_col = find_column(['Site', 'site', 'SITE', 'site_name'])
+
+    if not agency_col:
+        logger.warning("⚠️ No agency column found, filter hierarchy is empty")
+        return empty
+
+    def clean(col):
+        if not col:
+            return pd.Series('', index=df.index)
+        return df[col].fillna('').astype(str).str.strip()
+
+    triples = pd.DataFrame({
+        'agency': clean(agency_col),
+        'cluster': clean(cluster_col),
+        'site': clean(site_col)
+    }).drop_duplicates()
+    triples = triples[triples['agency'] != '']
+
+    hierarchy = {}
+    codes = {}
+    for level, key in [('agency', 'agencies'), ('cluster', 'clusters'), ('site', 'sites')]:
+        names = sorted(name for name in triples[level].unique() if name)
+        lookup = {name: idx for idx, name in enumerate(names)}
+        hierarchy[key] = names
+        codes[level] = triples[level].map(lookup).fillna(-1)
+
+    hierarchy['links'] = [
+        [int(a), int(c), int(s)]
+        for a, c, s in zip(codes['agency'], codes['cluster'], codes['site'])
+    ]
+
+    logger.info(f"🔗 Filter hierarchy: {len(hierarchy['agencies'])} agencies, "
+                f"{len(hierarchy['clusters'])} clusters, {len(hierarchy['sites'])} sites, "
+                f"{len(hierarchy['links'])} links")
+    return hierarchy
+
 def parse_dd_mm_yyyy_date(date_str):
     """Parse date string in DD-MM-YYYY format"""
     if not date_str or pd.isna(date_str):
@@ -232,41 +236,12 @@ def parse_dd_mm_yyyy_date(date_str):
             return None
 
 def get_processed_dataframe():
-    """Get processed DataFrame for dash_ag_grid"""
+    """
+    Get processed DataFrame for dash_ag_grid.
+    Shared per dataset version by the admin data service - do not modify in place.
+    """
     try:
-        csv_data = get_embedded_csv_data()
-        if not csv_data:
-            logger.warning("⚠️ No CSV data available for processing")
-            return pd.DataFrame()
-        
-        df = pd.DataFrame(csv_data)
-        logger.info(f"🔄 Processing DataFrame with {len(df)} records")
-        
-        # Format date column
-        date_columns = ['date', 'Date', 'DATE', 'transaction_date']
-        for date_col in date_columns:
-            if date_col in df.columns:
-                df['date_formatted'] = df[date_col].apply(lambda x: x if pd.notna(x) else 'N/A')
-                break
-        
-        # Ensure numeric columns are properly formatted
-        numeric_columns = ['net_weight_calculated', 'Total_capacity_per_day', 'weight', 'capacity']
-        for col in numeric_columns:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-                logger.info(f"   Processed numeric column: {col}")
-        
-        # Sort by date if possible
-        for date_col in date_columns:
-            if date_col in df.columns:
-                df['date_sort'] = df[date_col].apply(parse_dd_mm_yyyy_date)
-                df = df.sort_values('date_sort', ascending=False, na_position='last')
-                df = df.drop('date_sort', axis=1)
-                break
-        
-        logger.info(f"✅ DataFrame processed successfully")
-        return df
-        
+        return admin_data_service.get_frame()
     except Exception as e:
         logger.error(f"❌ Error processing DataFrame: {str(e)}")
         return pd.DataFrame()
@@ -277,7 +252,8 @@ def create_dash_dashboard_layout(title, icon, theme_name="dark"):
     theme = theme_styles["theme"]
     
     # 🔥 FIXED: Get processed data with better error handling
-    df = get_processed_dataframe()
+    # (without the process-local entity codes - this frame goes into browser stores)
+    df = drop_entity_codes(get_processed_dataframe())
     logger.info(f"🏗️ Creating dashboard layout with {len(df)} records")
     
     # 🔥 FIXED: Get filter options from the data with debugging
@@ -470,8 +446,9 @@ def create_dash_dashboard_layout(title, icon, theme_name="dark"):
     # Create the main layout structure
     layout = html.Div([
         # CSS and external resources
-        dcc.Store(id='csv-data-store', data=df.to_dict('records') if not df.empty else []),
-        dcc.Store(id='filtered-data-store', data=df.to_dict('records') if not df.empty else []),
+        dcc.Store(id='csv-data-store', data=encode_columnar(df)),
+        dcc.Store(id='filtered-data-store', data=encode_columnar(df)),
+        dcc.Store(id='filter-hierarchy-store', data=build_filter_hierarchy(df)),
         dcc.Store(id='filters-initialized', data=False),
         
         html.Link(
@@ -723,7 +700,25 @@ def create_dash_dashboard_layout(title, icon, theme_name="dark"):
                         html.Div([
                             html.Div([
                                 html.Button("🔄 Refresh", id="refresh-btn", className="grid-btn"),
-                                html.Button("📊 Export CSV", id="export-btn", className="grid-btn secondary"),
+                                html.Button("📊 Export", id="export-btn", className="grid-btn secondary"),
+                                dcc.Dropdown(
+                                    id='export-format-selector',
+                                    options=[{'label': fmt.upper(), 'value': fmt} for fmt in get_available_formats()],
+                                    value='csv',
+                                    clearable=False,
+                                    searchable=False,
+                                    persistence=False,
+                                    style={'width': '120px', 'display': 'inline-block', 'verticalAlign': 'middle'}
+                                ),
+                                html.Span(id="export-status", className="export-status"),
+                                dcc.Input(
+                                    id='grid-search-input',
+                                    type='text',
+                                    placeholder='🔎 Ticket (T0451 Kurnool) or vehicle (AP39UQ4518)',
+                                    debounce=True,
+                                    className="grid-search-input",
+                                    style={'width': '300px', 'display': 'inline-block', 'verticalAlign': 'middle'}
+                                ),
                                 html.Button("🧹 Clear Filters", id="clear-filters-btn", className="grid-btn secondary"),
                                 html.Button("🔧 Reset Columns", id="reset-columns-btn", className="grid-btn secondary", 
                                            title="Reset column order and visibility")
@@ -734,7 +729,7 @@ def create_dash_dashboard_layout(title, icon, theme_name="dark"):
                         dag.AgGrid(
                             id='csv-grid',
                             columnDefs=column_defs,
-                            rowData=df.to_dict('records') if not df.empty else [],
+                            rowData=[],  # Filled clientside from 'filtered-data-store'
                             defaultColDef={
                                 "filter": True,
                                 "sortable": True,
@@ -806,148 +801,120 @@ def create_dash_dashboard_layout(title, icon, theme_name="dark"):
     
     return layout
 
-# 🔥 ENHANCED: Cascading Filter Callbacks - Agency -> Cluster -> Site
+# 🔥 ENHANCED: Cascading Filter Callback - Agency -> Cluster -> Site
+# Resolved in the browser from 'filter-hierarchy-store' so that an agency change
+# updates cluster AND site options in one step, without any server round trip.
+clientside_callback(
+    """
+    function(selectedAgencies, selectedClusters, hierarchy) {
+        const noUpdate = window.dash_clientside.no_update;
+        const ctx = window.dash_clientside.callback_context;
+        const triggered = (ctx && ctx.triggered && ctx.triggered.length) ? ctx.triggered[0].prop_id : '';
 
-@callback(
+        if (!hierarchy || !hierarchy.links || hierarchy.links.length === 0) {
+            return [[], "No data available", null, [], "No data available", null];
+        }
+
+        const isActive = (values) => Array.isArray(values) && values.length > 0 &&
+            !(values.length === 1 && values[0] === 'none');
+        const toOptions = (names, indexSet) => Array.from(indexSet)
+            .map(i => names[i])
+            .sort()
+            .map(name => ({label: name, value: name}));
+
+        const agencyFilter = isActive(selectedAgencies) ? new Set(selectedAgencies) : null;
+        // A new agency selection clears the cluster selection, so sites only follow agencies
+        const agencyChanged = triggered !== 'cluster-filter.value';
+        const clusterFilter = (!agencyChanged && isActive(selectedClusters)) ? new Set(selectedClusters) : null;
+
+        const clusterIdx = new Set();
+        const siteIdx = new Set();
+        for (const [a, c, s] of hierarchy.links) {
+            if (agencyFilter && !agencyFilter.has(hierarchy.agencies[a])) continue;
+            if (c >= 0) clusterIdx.add(c);
+            if (clusterFilter && (c < 0 || !clusterFilter.has(hierarchy.clusters[c]))) continue;
+            if (s >= 0) siteIdx.add(s);
+        }
+
+        const siteOptions = toOptions(hierarchy.sites, siteIdx);
+        const sitePlaceholder = (agencyFilter || clusterFilter)
+            ? `Select Site... (${siteOptions.length} available)`
+            : "Select Agency/Cluster first...";
+
+        if (!agencyChanged) {
+            return [noUpdate, noUpdate, noUpdate, siteOptions, sitePlaceholder, null];
+        }
+
+        const clusterOptions = toOptions(hierarchy.clusters, clusterIdx);
+        const clusterPlaceholder = hierarchy.clusters.length
+            ? `Select Cluster... (${clusterOptions.length} available)`
+            : "No cluster data found";
+
+        return [clusterOptions, clusterPlaceholder, null, siteOptions, sitePlaceholder, null];
+    }
+    """,
     [Output('cluster-filter', 'options'),
      Output('cluster-filter', 'placeholder'),
-     Output('cluster-filter', 'value')],  # 🔥 ADDED: Clear value when options change
-    [Input('agency-filter', 'value')],
-    [State('csv-data-store', 'data')],
-    prevent_initial_call=False
-)
-def update_cluster_options_based_on_agency(selected_agencies, csv_data):
-    """Update cluster options based on selected agencies - CASCADING FILTER"""
-    try:
-        if not csv_data:
-            return [], "No data available", None
-        
-        df = pd.DataFrame(csv_data)
-        
-        if df.empty:
-            return [], "No data available", None
-        
-        # 🔥 ENHANCED: Filter clusters based on selected agencies
-        if selected_agencies and selected_agencies != ['none']:
-            logger.info(f"🔗 Filtering clusters for agencies: {selected_agencies}")
-            
-            # Find the agency column
-            agency_col = None
-            for col in ['agency_name', 'Agency', 'agency', 'AGENCY']:
-                if col in df.columns:
-                    agency_col = col
-                    break
-            
-            if agency_col:
-                # Filter dataframe to only include selected agencies
-                filtered_df = df[df[agency_col].isin(selected_agencies)]
-                logger.info(f"   Found {len(filtered_df)} records for selected agencies")
-            else:
-                filtered_df = df
-                logger.warning("   No agency column found, using all data")
-        else:
-            # No agencies selected, return all clusters
-            filtered_df = df
-            logger.info("🔗 No agencies selected, showing all clusters")
-        
-        # Get unique clusters from filtered data
-        cluster_col = None
-        for col in ['Cluster', 'cluster', 'CLUSTER']:
-            if col in filtered_df.columns:
-                cluster_col = col
-                break
-        
-        if cluster_col:
-            unique_clusters = filtered_df[cluster_col].dropna().astype(str).str.strip()
-            unique_clusters = unique_clusters[unique_clusters != ''].unique()
-            cluster_options = [{'label': cluster, 'value': cluster} for cluster in sorted(unique_clusters)]
-            
-            placeholder = f"Select Cluster... ({len(cluster_options)} available)"
-            logger.info(f"   Updated cluster options: {len(cluster_options)} clusters available")
-            
-            return cluster_options, placeholder, None  # 🔥 CLEAR: Reset cluster selection
-        else:
-            logger.warning("   No cluster column found")
-            return [], "No cluster data found", None
-            
-    except Exception as e:
-        logger.error(f"❌ Error updating cluster options: {str(e)}")
-        return [], "Error loading clusters", None
-
-@callback(
-    [Output('site-filter', 'options'),
+     Output('cluster-filter', 'value'),
+     Output('site-filter', 'options'),
      Output('site-filter', 'placeholder'),
-     Output('site-filter', 'value')],  # 🔥 ADDED: Clear value when options change
+     Output('site-filter', 'value')],
     [Input('agency-filter', 'value'),
      Input('cluster-filter', 'value')],
-    [State('csv-data-store', 'data')],
+    [State('filter-hierarchy-store', 'data')],
     prevent_initial_call=False
 )
-def update_site_options_based_on_agency_and_cluster(selected_agencies, selected_clusters, csv_data):
-    """Update site options based on selected agencies and clusters - CASCADING FILTER"""
-    try:
-        if not csv_data:
-            return [], "No data available", None
-        
-        df = pd.DataFrame(csv_data)
-        
-        if df.empty:
-            return [], "No data available", None
-        
-        # 🔥 ENHANCED: Filter sites based on both agencies and clusters
-        filtered_df = df.copy()
-        
-        # First filter by agencies if selected
-        if selected_agencies and selected_agencies != ['none']:
-            agency_col = None
-            for col in ['agency_name', 'Agency', 'agency', 'AGENCY']:
-                if col in df.columns:
-                    agency_col = col
-                    break
-            
-            if agency_col:
-                filtered_df = filtered_df[filtered_df[agency_col].isin(selected_agencies)]
-                logger.info(f"🔗 Filtered by agencies: {len(filtered_df)} records remaining")
-        
-        # Then filter by clusters if selected
-        if selected_clusters and selected_clusters != ['none']:
-            cluster_col = None
-            for col in ['Cluster', 'cluster', 'CLUSTER']:
-                if col in filtered_df.columns:
-                    cluster_col = col
-                    break
-            
-            if cluster_col:
-                filtered_df = filtered_df[filtered_df[cluster_col].isin(selected_clusters)]
-                logger.info(f"🔗 Filtered by clusters: {len(filtered_df)} records remaining")
-        
-        # Get unique sites from filtered data
-        site_col = None
-        for col in ['Site', 'site', 'SITE', 'site_name']:
-            if col in filtered_df.columns:
-                site_col = col
+
+def apply_admin_filters(df, selected_agencies=None, selected_clusters=None,
+                        selected_sites=None, start_date=None, end_date=None):
+    """Apply the admin dashboard Agency/Cluster/Site/Date filters to a DataFrame"""
+    logger.info(f"🔄 Applying filters: agencies={selected_agencies}, clusters={selected_clusters}, sites={selected_sites}")
+    
+    # Apply Agency filter
+    if selected_agencies and selected_agencies != ['none']:
+        agency_cols = ['agency_name', 'Agency', 'agency', 'AGENCY']
+        for col in agency_cols:
+            if col in df.columns:
+                df = df[entity_mask(df, 'agency', selected_agencies, col)]
+                logger.info(f"   Applied agency filter on column '{col}': {len(df)} records remaining")
                 break
-        
-        if site_col:
-            unique_sites = filtered_df[site_col].dropna().astype(str).str.strip()
-            unique_sites = unique_sites[unique_sites != ''].unique()
-            site_options = [{'label': site, 'value': site} for site in sorted(unique_sites)]
-            
-            if selected_agencies or selected_clusters:
-                placeholder = f"Select Site... ({len(site_options)} available)"
-            else:
-                placeholder = "Select Agency/Cluster first..."
+    
+    # Apply Cluster filter
+    if selected_clusters and selected_clusters != ['none']:
+        cluster_cols = ['Cluster', 'cluster', 'CLUSTER']
+        for col in cluster_cols:
+            if col in df.columns:
+                df = df[entity_mask(df, 'cluster', selected_clusters, col)]
+                logger.info(f"   Applied cluster filter on column '{col}': {len(df)} records remaining")
+                break
+    
+    # Apply Site filter
+    if selected_sites and selected_sites != ['none']:
+        site_cols = ['Site', 'site', 'SITE', 'site_name']
+        for col in site_cols:
+            if col in df.columns:
+                df = df[entity_mask(df, 'site', selected_sites, col)]
+                logger.info(f"   Applied site filter on column '{col}': {len(df)} records remaining")
+                break
+    
+    # 🔥 ENHANCED: Apply Date filter with new compact inputs
+    if start_date and end_date:
+        date_cols = ['date', 'Date', 'DATE', 'transaction_date']
+        for col in date_cols:
+            if col in df.columns:
+                date_parsed = pd.to_datetime(df[col], format='%d-%m-%Y', errors='coerce')
+                start_dt = pd.to_datetime(start_date)
+                end_dt = pd.to_datetime(end_date)
                 
-            logger.info(f"   Updated site options: {len(site_options)} sites available")
-            
-            return site_options, placeholder, None  # 🔥 CLEAR: Reset site selection
-        else:
-            logger.warning("   No site column found")
-            return [], "No site data found", None
-            
-    except Exception as e:
-        logger.error(f"❌ Error updating site options: {str(e)}")
-        return [], "Error loading sites", None
+                df = df[
+                    (date_parsed >= start_dt) & 
+                    (date_parsed <= end_dt) &
+                    (date_parsed.notna())
+                ]
+                logger.info(f"   Applied date filter on column '{col}': {len(df)} records remaining")
+                break
+    
+    return df
 
 # 🔥 ENHANCED: Updated filter data callback with new date inputs
 @callback(
@@ -973,62 +940,19 @@ def update_filtered_data(apply_clicks, clear_clicks, selected_agencies, selected
     
     try:
         ctx = callback_context
-        df = pd.DataFrame(csv_data)
+        # Entity codes are not sent to the browser; apply_admin_filters re-encodes the names
+        df = drop_entity_codes(decode_columnar(csv_data))
         
         if df.empty:
-            return [], "0", "0 kg", "0", "0", "0"
+            return encode_columnar(df), "0", "0 kg", "0", "0", "0"
         
         # If clear button was clicked, return original data
         if ctx.triggered and ctx.triggered[0]['prop_id'] == 'clear-all-filters-btn.n_clicks':
             logger.info("🧹 Clearing all filters, returning original data")
             
         else:
-            logger.info(f"🔄 Applying filters: agencies={selected_agencies}, clusters={selected_clusters}, sites={selected_sites}")
-            
-            # Apply Agency filter
-            if selected_agencies and selected_agencies != ['none']:
-                agency_cols = ['agency_name', 'Agency', 'agency', 'AGENCY']
-                for col in agency_cols:
-                    if col in df.columns:
-                        df = df[df[col].isin(selected_agencies)]
-                        logger.info(f"   Applied agency filter on column '{col}': {len(df)} records remaining")
-                        break
-            
-            # Apply Cluster filter
-            if selected_clusters and selected_clusters != ['none']:
-                cluster_cols = ['Cluster', 'cluster', 'CLUSTER']
-                for col in cluster_cols:
-                    if col in df.columns:
-                        df = df[df[col].isin(selected_clusters)]
-                        logger.info(f"   Applied cluster filter on column '{col}': {len(df)} records remaining")
-                        break
-            
-            # Apply Site filter
-            if selected_sites and selected_sites != ['none']:
-                site_cols = ['Site', 'site', 'SITE', 'site_name']
-                for col in site_cols:
-                    if col in df.columns:
-                        df = df[df[col].isin(selected_sites)]
-                        logger.info(f"   Applied site filter on column '{col}': {len(df)} records remaining")
-                        break
-            
-            # 🔥 ENHANCED: Apply Date filter with new compact inputs
-            if start_date and end_date:
-                date_cols = ['date', 'Date', 'DATE', 'transaction_date']
-                for col in date_cols:
-                    if col in df.columns:
-                        df['date_parsed'] = df[col].apply(parse_dd_mm_yyyy_date)
-                        start_dt = pd.to_datetime(start_date)
-                        end_dt = pd.to_datetime(end_date)
-                        
-                        df = df[
-                            (df['date_parsed'] >= start_dt) & 
-                            (df['date_parsed'] <= end_dt) &
-                            (df['date_parsed'].notna())
-                        ]
-                        df = df.drop('date_parsed', axis=1)
-                        logger.info(f"   Applied date filter on column '{col}': {len(df)} records remaining")
-                        break
+            df = apply_admin_filters(df, selected_agencies, selected_clusters,
+                                     selected_sites, start_date, end_date)
         
         # Calculate filtered statistics
         total_records = len(df)
@@ -1065,7 +989,7 @@ def update_filtered_data(apply_clicks, clear_clicks, selected_agencies, selected
                 total_capacity = df[col].sum()
                 break
         
-        filtered_data = df.to_dict('records')
+        filtered_data = encode_columnar(df)
         
         logger.info(f"✅ Filter results: {total_records} records, {total_weight} kg, {unique_contractors} contractors")
         
@@ -1080,16 +1004,44 @@ def update_filtered_data(apply_clicks, clear_clicks, selected_agencies, selected
         
     except Exception as e:
         logger.error(f"❌ Error in filter callback: {str(e)}")
-        return [], "Error", "Error", "Error", "Error", "Error"
+        return encode_columnar(None), "Error", "Error", "Error", "Error", "Error"
 
+# Search box - point lookups through the ticket/vehicle index instead of scanning the frame;
+# clearing the search restores the current filter selection
 @callback(
-    Output('csv-grid', 'rowData'),
-    Input('filtered-data-store', 'data'),
+    [Output('filtered-data-store', 'data', allow_duplicate=True),
+     Output('filtered-records', 'children', allow_duplicate=True)],
+    Input('grid-search-input', 'value'),
+    [State('agency-filter', 'value'),
+     State('cluster-filter', 'value'),
+     State('site-filter', 'value'),
+     State('start-date-input', 'value'),
+     State('end-date-input', 'value')],
     prevent_initial_call=True
 )
-def update_grid_with_filtered_data(filtered_data):
-    """Update the ag-Grid with filtered data"""
-    return filtered_data if filtered_data else []
+def search_grid(query, selected_agencies, selected_clusters, selected_sites, start_date, end_date):
+    """Show the trips matching a ticket or vehicle search in the grid"""
+    try:
+        if not (query or '').strip():
+            df = apply_admin_filters(get_processed_dataframe(), selected_agencies, selected_clusters,
+                                     selected_sites, start_date, end_date)
+            return encode_columnar(drop_entity_codes(df)), f"{len(df):,}"
+
+        index = get_lookup_index()
+        positions = index.search(query, start_date, end_date)
+        logger.info(f"🔎 Grid search '{query}': {len(positions)} matches")
+        return encode_columnar(drop_entity_codes(index.rows(positions))), f"{len(positions):,}"
+
+    except Exception as e:
+        logger.error(f"❌ Error in grid search: {str(e)}")
+        return dash.no_update, dash.no_update
+
+# Update the ag-Grid with filtered data - decoded in the browser (assets/columnar.js)
+clientside_callback(
+    ClientsideFunction(namespace='columnar', function_name='toRowData'),
+    Output('csv-grid', 'rowData'),
+    Input('filtered-data-store', 'data')
+)
 
 def clear_all_filters(n_clicks):
     """Clear all filter selections when clear button is clicked"""
@@ -1117,7 +1069,7 @@ def refresh_data_feedback(n_clicks):
 def update_grid_columns(selected_columns):
     """Update grid columns based on dropdown selection"""
     if not selected_columns:
-        df = get_processed_dataframe()
+        df = drop_entity_codes(get_processed_dataframe())
         return [{'field': c, 'filter': True, 'sortable': True, 'resizable': True} for c in df.columns]
     
     # Create column definitions for selected columns
@@ -1161,7 +1113,7 @@ def update_grid_columns(selected_columns):
 def reset_columns(n_clicks):
     """Reset column order and visibility to default"""
     if n_clicks:
-        df = get_processed_dataframe()
+        df = drop_entity_codes(get_processed_dataframe())
         default_columns = list(df.columns) if not df.empty else []
         
         default_options = {
@@ -1212,16 +1164,36 @@ def update_time(n_intervals):
     """Update current time display"""
     return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-@callback(
-    Output('csv-grid', 'exportDataAsCsv'),
+# Export streams the current filter selection from /api/export/filtered-data;
+# the browser keeps the page since the response is an attachment
+clientside_callback(
+    """
+    function(n_clicks, fmt, agencies, clusters, sites, startDate, endDate) {
+        if (!n_clicks) return window.dash_clientside.no_update;
+
+        const params = new URLSearchParams({source: 'admin', format: fmt || 'csv'});
+        (agencies || []).forEach(v => params.append('agency', v));
+        (clusters || []).forEach(v => params.append('cluster', v));
+        (sites || []).forEach(v => params.append('site', v));
+        if (startDate && endDate) {
+            params.append('start_date', startDate);
+            params.append('end_date', endDate);
+        }
+
+        window.location.assign('/api/export/filtered-data?' + params.toString());
+        return '⬇️ Preparing ' + (fmt || 'csv').toUpperCase() + ' export...';
+    }
+    """,
+    Output('export-status', 'children'),
     Input('export-btn', 'n_clicks'),
+    [State('export-format-selector', 'value'),
+     State('agency-filter', 'value'),
+     State('cluster-filter', 'value'),
+     State('site-filter', 'value'),
+     State('start-date-input', 'value'),
+     State('end-date-input', 'value')],
     prevent_initial_call=True
 )
-def export_csv(n_clicks):
-    """Export current grid data to CSV when export button is clicked"""
-    if n_clicks:
-        return True
-    return False
 
 def build_enhanced_dashboard(theme_name="dark", user_data=None, active_tab="tab-dashboard"):
     """Build the enhanced dashboard layout with properly connected filters"""
@@ -1262,12 +1234,17 @@ def register_enhanced_csv_routes(server):
     
     @server.route('/api/csv-data-enhanced')
     def get_enhanced_csv_data():
-        """Enhanced API endpoint to get CSV data for dash_ag_grid"""
+        """
+        Enhanced API endpoint to get CSV data for dash_ag_grid.
+        Records are columnar-encoded (utils/columnar.py); pass ?format=records for row dicts.
+        """
         if not session.get('swaccha_session_id'):
             return {'error': 'Authentication required'}, 401
         
+        wire_format = 'records' if request.args.get('format') == 'records' else 'columnar'
+        
         try:
-            df = get_processed_dataframe()
+            df = drop_entity_codes(get_processed_dataframe())
             
             if df.empty:
                 return flask.jsonify({
@@ -1300,7 +1277,8 @@ def register_enhanced_csv_routes(server):
                 'unique_contractors': unique_contractors,
                 'unique_machines': unique_machines,
                 'total_capacity': f"{total_capacity:,.0f}",
-                'records': df.to_dict('records'),
+                'records_encoding': wire_format,
+                'records': df.to_dict('records') if wire_format == 'records' else encode_columnar(df),
                 'columns_detected': {
                     'date_column': 'date',
                     'weight_column': 'net_weight_calculated',
@@ -1359,6 +1337,8 @@ __all__ = [
     'configure_upload_settings',
     'get_embedded_csv_data',
     'get_filter_options_from_embedded_data',
+    'apply_admin_filters',
+    'build_filter_hierarchy',
     'generate_sample_data',
     'get_processed_dataframe'
 ]
\ No newline at end of file
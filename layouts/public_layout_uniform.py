@@ -11,6 +11,8 @@ import logging
 import os
 import numpy as np
 from datetime import datetime, timedelta
+from utils.compressed_io import csv_path_exists, read_csv_any
+from data.entities import AGENCY_DISPLAY_NAMES, add_entity_codes, agency_display_name, is_configured_agency
 from utils.theme_utils import get_theme_styles, get_hover_overlay_css, get_theme_css_variables
 from components.navigation.hover_overlay import create_hover_overlay_banner  # ← IMPORT THE REAL ONE
 from utils.theme_utils import get_theme_styles
@@ -19,27 +21,17 @@ from utils.theme_utils import get_theme_styles
 # Initialize logger FIRST
 logger = logging.getLogger(__name__)
 
-# AGENCY NAMES MAPPING
-AGENCY_NAMES = {
-    'Zigma': 'Zigma Global Enviro Solutions Private Limited, Erode',
-    'Saurashtra': 'Saurastra Enviro Pvt Ltd, Gujarat', 
-    'Tharuni': 'Tharuni Associates, Guntur'
-}
+# AGENCY NAMES MAPPING - configured in the shared entity dictionary
+AGENCY_NAMES = AGENCY_DISPLAY_NAMES
 
 def get_display_agency_name(agency_key):
     """Get the full display name for an agency"""
     if not agency_key:
         return "Unknown Agency"
-        
-    # Try exact match first
-    if agency_key in AGENCY_NAMES:
-        return AGENCY_NAMES[agency_key]
     
-    # Try partial match (case insensitive)
-    agency_key_lower = agency_key.lower()
-    for key, full_name in AGENCY_NAMES.items():
-        if key.lower() in agency_key_lower or agency_key_lower in key.lower():
-            return full_name
+    # Configured agencies and their aliases are looked up in the entity dictionary
+    if is_configured_agency(agency_key):
+        return agency_display_name(agency_key)
     
     # If no match found, return the original key with warning
     logger.warning(f"⚠️ No agency mapping found for: '{agency_key}'")
@@ -49,8 +41,8 @@ def load_agency_data():
     """Load data from CSV with agency configuration logging"""
     try:
         csv_path = 'data/public_mini_processed_dates_fixed.csv'
-        if os.path.exists(csv_path):
-            df = pd.read_csv(csv_path)
+        if csv_path_exists(csv_path):
+            df = read_csv_any(csv_path)
             logger.info(f"✅ Loaded {len(df)} records from agency data")
             
             # Convert date columns to datetime if needed
@@ -62,6 +54,9 @@ def load_agency_data():
             # Clean column names
             df.columns = df.columns.str.strip()
             
+            # Integer agency/cluster/site codes for filters and joins
+            add_entity_codes(df)
+            
             # Log agency mappings
             if 'Agency' in df.columns:
                 unique_agencies = df['Agency'].dropna().unique()
@@ -28,6 +28,7 @@ from layouts.admin_dashboard import (
     configure_upload_settings
 )
 from file_watcher import start_file_monitoring, stop_file_monitoring
+from services.viz_mirror import start_viz_mirror, stop_viz_mirror
 from layouts.admin_dashboard import register_enhanced_csv_routes
 # ❌ REMOVED: from callbacks.filter_container_callbacks import register_filter_container_callbacks
 from data_loader import get_cached_data, refresh_cached_data
@@ -41,6 +42,8 @@ from endpoints.forecasting_page import register_forecasting_routes
 from endpoints.reviews_page import register_reviews_routes
 from endpoints.oauth_routes import register_oauth_routes
 from endpoints.debug_routes import register_debug_routes
+from endpoints.export_routes import register_export_routes
+from endpoints.lookup_routes import register_lookup_routes
 from callbacks.unified_dashboard_callbacks import register_unified_dashboard_callbacks
 # ✅ ONLY IMPORT: The consolidated callbacks
 #from callbacks.consolidated_filter_callbacks import register_all_callbacks
@@ -275,6 +278,7 @@ app.index_string = f'''
 </html>
 '''
 start_file_monitoring()
+start_viz_mirror()
 # ✅ CUSTOM DASHBOARD ROUTE REGISTRATION - AVOIDS CONFLICTS
 def register_custom_dashboard_routes(server):
     """Register dashboard routes without conflicts"""
@@ -334,7 +338,7 @@ def register_custom_dashboard_routes(server):
             return {'error': 'Authentication required'}, 401
         
         try:
-            from data_loader import get_cached_data, filter_data
+            from data_loader import get_cached_data, filter_data, distinct_count
             
             # Get filter parameters from request
             agency = request.args.get('agency', 'all')
@@ -342,6 +346,7 @@ def register_custom_dashboard_routes(server):
             site = request.args.get('site', 'all')
             start_date = request.args.get('start_date')
             end_date = request.args.get('end_date')
+            exact_counts = request.args.get('exact') == 'true'
             
             # Load and filter CSV data
             df = get_cached_data()
@@ -365,12 +370,11 @@ def register_custom_dashboard_routes(server):
             elif 'weight' in filtered_df.columns and not filtered_df.empty:
                 total_weight = filtered_df['weight'].sum()
             
-            # Use 'Vehicle No' column (as per your CSV structure)
+            # Distinct vehicles from the per-day sketches ('Vehicle No' / 'vehicle' codes); ?exact=true scans
             vehicle_count = 0
-            if 'Vehicle No' in filtered_df.columns and not filtered_df.empty:
-                vehicle_count = filtered_df['Vehicle No'].nunique()
-            elif 'vehicle' in filtered_df.columns and not filtered_df.empty:
-                vehicle_count = filtered_df['vehicle'].nunique()
+            if not filtered_df.empty:
+                vehicle_count = distinct_count(df, 'vehicle', agency, cluster, site, start_date, end_date,
+                                               exact=exact_counts)
             
             filter_response = {
                 "agency": agency,
@@ -381,6 +385,7 @@ def register_custom_dashboard_routes(server):
                 "record_count": record_count,
                 "total_weight": f"{total_weight:,.0f} kg",
                 "vehicle_count": vehicle_count,
+                "vehicle_count_exact": exact_counts,
                 "timestamp": time.time(),
                 "source": "CSV Data with Cascading Filters",
                 "total_records_available": len(df)
@@ -1434,6 +1439,8 @@ ensure_upload_directory(server)
 register_custom_dashboard_routes(server)  # Custom routes for dashboard functionality
 register_oauth_routes(server, google_auth_manager, GOOGLE_AUTH_AVAILABLE, logger)
 register_debug_routes(server)
+register_export_routes(server)
+register_lookup_routes(server)
 register_dashboard_flask_routes(server)
 # ✅ KEEP: Register dashboard Flask routes (moved from main to admin_dashboard)
 # This handles the /dashboard route without conflicts
@@ -1461,5 +1468,6 @@ if __name__ == '__main__':
         # Clean up file monitoring
         try:
             stop_file_monitoring()
+            stop_viz_mirror()
         except:
             pass
\ No newline at end of file
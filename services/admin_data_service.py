@@ -0,0 +1,184 @@
+# services/admin_data_service.py
+"""
+Admin Data Service
+Keeps one typed, pre-sorted DataFrame per dataset version for the admin dashboard
+"""
+
+import os
+import threading
+import logging
+from typing import List, Dict, Optional, Tuple
+
+import pandas as pd
+
+from utils.compressed_io import resolve_csv_path, read_csv_any
+from data.entities import add_entity_codes, drop_entity_codes
+
+logger = logging.getLogger(__name__)
+
+# Checked in order - the first existing file is the admin dataset
+ADMIN_DATA_PATHS = [
+    'data/csv_data_combined.csv',
+    'data/csv_outputs_data_viz.csv',
+    'data/data.csv',
+    'csv_data_combined.csv',
+    'csv_outputs_data_viz.csv'
+]
+
+DATE_COLUMNS = ['date', 'Date', 'DATE', 'transaction_date', 'Date_Time']
+NUMERIC_COLUMNS = ['net_weight_calculated', 'Total_capacity_per_day', 'weight', 'capacity']
+CSV_ENCODINGS = ['utf-8', 'latin-1', 'cp1252']
+
+
+class AdminDataService:
+    """Loads the admin CSV once per file version and hands out the prepared frame"""
+
+    def __init__(self, possible_paths: Optional[List[str]] = None):
+        self.possible_paths = possible_paths or ADMIN_DATA_PATHS
+        self._lock = threading.Lock()
+        self._version = None
+        self._frame = None
+
+    def find_csv_path(self) -> Optional[str]:
+        """Return the first existing admin CSV path (plain or compressed)"""
+        for path in self.possible_paths:
+            resolved = resolve_csv_path(path)
+            if resolved:
+                return resolved
+        return None
+
+    def get_dataset_version(self) -> Tuple:
+        """
+        Identify the current dataset version.
+
+        Returns:
+            tuple: (path, mtime_ns, size) for a CSV file, or ('sample',) when none exists
+        """
+        csv_path = self.find_csv_path()
+        if not csv_path:
+            return ('sample',)
+
+        try:
+            stat = os.stat(csv_path)
+            return (csv_path, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return ('sample',)
+
+    def get_frame(self) -> pd.DataFrame:
+        """
+        Get the prepared DataFrame for the current dataset version.
+
+        The same object is shared by every caller - treat it as read-only and
+        filter/select into new frames instead of modifying it in place.
+        """
+        version = self.get_dataset_version()
+        if self._frame is not None and version == self._version:
+            return self._frame
+
+        with self._lock:
+            if self._frame is None or version != self._version:
+                self._frame = self._build_frame(version)
+                self._version = version
+            return self._frame
+
+    def get_view(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Get the prepared frame, optionally restricted to existing columns"""
+        df = self.get_frame()
+        if columns is None:
+            return df
+        return df[[col for col in columns if col in df.columns]]
+
+    def get_records(self) -> List[Dict]:
+        """Serialize the prepared frame to records (serialization boundary only)"""
+        return drop_entity_codes(self.get_frame()).to_dict('records')
+
+    def invalidate(self):
+        """Drop the cached frame so the next call reloads"""
+        with self._lock:
+            self._frame = None
+            self._version = None
+
+    def _build_frame(self, version: Tuple) -> pd.DataFrame:
+        """Load and prepare the frame for a dataset version"""
+        try:
+            if version[0] == 'sample':
+                logger.error(f"❌ No CSV file found in any of these paths: {self.possible_paths}")
+                df = self._load_sample()
+            else:
+                df = self._load_csv(version[0])
+        except Exception as e:
+            logger.error(f"❌ Error loading CSV data: {str(e)}")
+            df = self._load_sample()
+
+        try:
+            df = self._prepare(df)
+        except Exception as e:
+            logger.error(f"❌ Error processing DataFrame: {str(e)}")
+            return pd.DataFrame()
+
+        logger.info(f"✅ Admin dataset ready: {len(df)} records, {len(df.columns)} columns (version {version})")
+        return df
+
+    def _load_csv(self, csv_path: str) -> pd.DataFrame:
+        """Read the CSV, trying the usual encodings in turn"""
+        logger.info(f"📁 Loading CSV from: {csv_path}")
+
+        for encoding in CSV_ENCODINGS[:-1]:
+            try:
+                df = read_csv_any(csv_path, encoding=encoding)
+                logger.info(f"✅ Successfully loaded with {encoding} encoding")
+                return df
+            except UnicodeDecodeError:
+                continue
+
+        df = read_csv_any(csv_path, encoding=CSV_ENCODINGS[-1])
+        logger.info(f"✅ Successfully loaded with {CSV_ENCODINGS[-1]} encoding")
+        return df
+
+    def _load_sample(self) -> pd.DataFrame:
+        """Sample data used when no CSV is available"""
+        from layouts.admin_dashboard import get_sample_data_for_testing
+        return pd.DataFrame(get_sample_data_for_testing())
+
+    def _prepare(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Parse dates, coerce numerics, add entity codes and sort newest first - done once per version"""
+        logger.info(f"📋 CSV Columns detected: {list(df.columns)}")
+        logger.info(f"📊 CSV Shape: {df.shape}")
+
+        # Parse date column with DD-MM-YYYY format if it exists
+        date_col = next((col for col in DATE_COLUMNS if col in df.columns), None)
+        if date_col:
+            df['date_parsed'] = pd.to_datetime(df[date_col], format='%d-%m-%Y', errors='coerce')
+            df['date_formatted'] = df[date_col].where(df[date_col].notna(), 'N/A')
+            logger.info(f"📅 Parsed date column '{date_col}'. Sample dates: {df[date_col].head(3).tolist()}")
+
+        # Ensure numeric columns are properly formatted
+        for col in NUMERIC_COLUMNS:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+
+        # Integer agency/cluster/site/vehicle codes for the filters
+        add_entity_codes(df)
+
+        # Sort by date, newest first (stable so ties keep file order)
+        if date_col:
+            df = df.sort_values('date_parsed', ascending=False, na_position='last', kind='mergesort')
+            df = df.reset_index(drop=True)
+
+        return df
+
+
+# Global service instance
+admin_data_service = AdminDataService()
+
+
+def get_admin_data_service() -> AdminDataService:
+    """Get the global admin data service"""
+    return admin_data_service
+
+
+__all__ = [
+    'AdminDataService',
+    'admin_data_service',
+    'get_admin_data_service'
+]
@@ -0,0 +1,227 @@
+# services/lookup_index.py
+"""
+Ticket and Vehicle Lookup Index
+Point lookups over the admin dataset without scanning it: a hash index on
+(source, site, ticket_no) and a per-vehicle sorted trip-offset index,
+rebuilt once per dataset version
+"""
+
+import threading
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from services.admin_data_service import admin_data_service
+from data.entities import code_column, get_entity_dictionary
+
+logger = logging.getLogger(__name__)
+
+# Candidate columns, checked in order
+SOURCE_COLUMNS = ['_source_company', 'agency_name', 'Agency', 'agency']
+SITE_COLUMNS = ['Site', 'site', 'site_name', 'SITE']
+TICKET_COLUMNS = ['ticket_no', 'Ticket No', 'ticket']
+VEHICLE_COLUMNS = ['Vehicle No', 'vehicle_no', 'vehicle']  # same order as entities.ENTITY_COLUMNS
+TIME_COLUMNS = ['date_parsed', 'datetime', 'Date', 'date']
+
+MAX_LOOKUP_ROWS = 5000
+
+
+def _find_column(df: pd.DataFrame, candidates: List[str]) -> Optional[str]:
+    return next((col for col in candidates if col in df.columns), None)
+
+
+def normalize_key(value) -> str:
+    """Lookup form of a ticket/site/source: trimmed, upper-case, inner whitespace collapsed"""
+    return ' '.join(str(value).upper().split())
+
+
+def _normalized_column(series: pd.Series) -> pd.Series:
+    """Vectorized normalize_key; missing values become ''"""
+    if pd.api.types.is_float_dtype(series) and (series.dropna() % 1 == 0).all():
+        series = series.astype('Int64').astype(object)  # ticket 1069.0 -> '1069'
+    text = series.where(series.notna(), '').astype(str).str.upper()
+    return text.str.split().str.join(' ').fillna('')
+
+
+class LookupIndex:
+    """Immutable point-lookup index over one version of a DataFrame"""
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.source_col = _find_column(df, SOURCE_COLUMNS)
+        self.site_col = _find_column(df, SITE_COLUMNS)
+        self.ticket_col = _find_column(df, TICKET_COLUMNS)
+        self.vehicle_col = _find_column(df, VEHICLE_COLUMNS)
+        self.time_col = _find_column(df, TIME_COLUMNS)
+
+        self._sources = _normalized_column(df[self.source_col]).values if self.source_col else None
+        self._sites = _normalized_column(df[self.site_col]).values if self.site_col else None
+        self._by_key = {}
+        self._by_ticket = {}
+        if self.ticket_col:
+            self._build_ticket_index(df)
+
+        # Vehicles are looked up by their interned id (entities), so every spelling
+        # of a number ('AP 39 uq-4518', 'AP39UQ4518') finds the same trips
+        self._vehicles = get_entity_dictionary('vehicle')
+        self._vehicle_order = np.empty(0, dtype=np.int64)
+        self._vehicle_starts = np.zeros(1, dtype=np.int64)
+        self._vehicle_times = np.empty(0, dtype=np.int64)
+        if self.vehicle_col:
+            self._build_vehicle_index(df)
+
+    def _build_ticket_index(self, df: pd.DataFrame):
+        """(source, site, ticket) -> row positions, plus ticket -> row positions"""
+        tickets = _normalized_column(df[self.ticket_col])
+        keys = pd.DataFrame({
+            'source': self._sources if self._sources is not None else '',
+            'site': self._sites if self._sites is not None else '',
+            'ticket': tickets.values
+        })
+        keys = keys[keys['ticket'] != '']
+        self._by_key = keys.groupby(['source', 'site', 'ticket'], sort=False).indices
+        self._by_ticket = keys.groupby('ticket', sort=False).indices
+        # groupby(...).indices are positions within the filtered frame - map back to df rows
+        rows = keys.index.values
+        self._by_key = {key: rows[positions] for key, positions in self._by_key.items()}
+        self._by_ticket = {key: rows[positions] for key, positions in self._by_ticket.items()}
+
+    def _build_vehicle_index(self, df: pd.DataFrame):
+        """Rows sorted by (vehicle id, time) with one [start, end) offset range per vehicle id"""
+        if code_column('vehicle') in df.columns:
+            codes = df[code_column('vehicle')].values.astype(np.int64)
+        else:
+            codes = self._vehicles.encode(df[self.vehicle_col]).astype(np.int64)
+
+        if self.time_col:
+            times = pd.to_datetime(df[self.time_col], errors='coerce').values.astype('datetime64[ns]').view(np.int64)
+        else:
+            times = np.zeros(len(df), dtype=np.int64)
+
+        rows = np.flatnonzero(codes >= 0)
+        order = rows[np.lexsort((times[rows], codes[rows]))]
+        counts = np.bincount(codes[order], minlength=int(codes.max()) + 1 if len(rows) else 0)
+
+        self._vehicle_order = order
+        self._vehicle_starts = np.concatenate([[0], np.cumsum(counts)])
+        self._vehicle_times = times[order]
+
+    def _vehicle_id(self, vehicle: str) -> Optional[int]:
+        """Interned id of a vehicle with trips in this index, else None"""
+        vehicle_id = self._vehicles.lookup(vehicle)
+        if vehicle_id is None or not 0 <= vehicle_id < len(self._vehicle_starts) - 1:
+            return None
+        if self._vehicle_starts[vehicle_id + 1] == self._vehicle_starts[vehicle_id]:
+            return None
+        return vehicle_id
+
+    def ticket_rows(self, ticket: str, site: Optional[str] = None, source: Optional[str] = None) -> np.ndarray:
+        """Row positions for a ticket, optionally narrowed to a site and/or source"""
+        ticket = normalize_key(ticket)
+        if site and source:
+            return self._by_key.get((normalize_key(source), normalize_key(site), ticket), np.empty(0, dtype=np.int64))
+
+        rows = self._by_ticket.get(ticket, np.empty(0, dtype=np.int64))
+        if site and self._sites is not None:
+            rows = rows[self._sites[rows] == normalize_key(site)]
+        if source and self._sources is not None:
+            rows = rows[self._sources[rows] == normalize_key(source)]
+        return rows
+
+    def vehicle_rows(self, vehicle: str, start=None, end=None) -> np.ndarray:
+        """Row positions for a vehicle in time order, optionally within [start, end] (dates inclusive)"""
+        code = self._vehicle_id(vehicle)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+
+        lo, hi = self._vehicle_starts[code], self._vehicle_starts[code + 1]
+        times = self._vehicle_times[lo:hi]
+        if start is not None:
+            lo += np.searchsorted(times, pd.Timestamp(start).value, side='left')
+        if end is not None:
+            end_ns = (pd.Timestamp(end).normalize() + pd.Timedelta(days=1)).value
+            hi = self._vehicle_starts[code] + np.searchsorted(times, end_ns, side='left')
+        return self._vehicle_order[lo:max(lo, hi)]
+
+    def has_vehicle(self, vehicle: str) -> bool:
+        return self._vehicle_id(vehicle) is not None
+
+    def search(self, query: str, start=None, end=None) -> np.ndarray:
+        """
+        Free-text search box lookup.
+
+        A vehicle number (spaces allowed) returns that vehicle's trips; otherwise
+        the first token that is a known ticket is looked up and the remaining
+        words narrow it to a site, e.g. "T0451 Kurnool".
+        """
+        query = (query or '').strip()
+        if not query:
+            return np.empty(0, dtype=np.int64)
+
+        if self.has_vehicle(query):
+            return self.vehicle_rows(query, start, end)
+
+        tokens = query.split()
+        for i, token in enumerate(tokens):
+            if normalize_key(token) in self._by_ticket:
+                site = ' '.join(tokens[:i] + tokens[i + 1:]) or None
+                return self.ticket_rows(token, site=site)
+
+        for token in tokens:
+            if self.has_vehicle(token):
+                return self.vehicle_rows(token, start, end)
+        return np.empty(0, dtype=np.int64)
+
+    def rows(self, positions: np.ndarray, limit: int = MAX_LOOKUP_ROWS) -> pd.DataFrame:
+        return self.df.iloc[positions[:limit]]
+
+    def stats(self) -> Dict:
+        return {
+            'records': len(self.df),
+            'ticket_keys': len(self._by_key),
+            'tickets': len(self._by_ticket),
+            'vehicles': int(np.count_nonzero(np.diff(self._vehicle_starts)))
+        }
+
+
+class LookupIndexService:
+    """Keeps one LookupIndex per admin dataset version"""
+
+    def __init__(self, data_service=admin_data_service):
+        self.data_service = data_service
+        self._lock = threading.Lock()
+        self._frame = None
+        self._index = None
+
+    def get_index(self) -> LookupIndex:
+        """Index for the current dataset version (rebuilt when the prepared frame changes)"""
+        df = self.data_service.get_frame()
+        if self._index is not None and df is self._frame:
+            return self._index
+
+        with self._lock:
+            if self._index is None or df is not self._frame:
+                self._index = LookupIndex(df)
+                self._frame = df
+                logger.info(f"🔎 Lookup index built: {self._index.stats()}")
+            return self._index
+
+
+# Global service instance
+lookup_index_service = LookupIndexService()
+
+
+def get_lookup_index() -> LookupIndex:
+    """Get the lookup index for the current admin dataset"""
+    return lookup_index_service.get_index()
+
+
+__all__ = [
+    'LookupIndex',
+    'LookupIndexService',
+    'lookup_index_service',
+    'get_lookup_index',
+    'normalize_key'
+]
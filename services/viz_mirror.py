@@ -0,0 +1,319 @@
+# services/viz_mirror.py
+"""
+Viz Mirror Service
+Keeps a local copy of the bucket's viz partitions in sync, downloading only
+objects whose generation changed, and assembles the
+data/csv_outputs_data_viz.csv file the admin dashboard reads - re-reading only
+the partitions (dates) that changed
+"""
+
+import csv
+import io
+import os
+import json
+import logging
+import shutil
+import threading
+from typing import Dict, List, Optional
+
+from data.storage_backend import GCSBackend, LocalBackend, StorageBackend, ObjectNotFound
+from utils.compressed_io import open_csv_binary, read_csv_any
+
+logger = logging.getLogger(__name__)
+
+# Bucket prefixes mirrored locally - only the viz partitions feed the dashboard file
+VIZ_PARTITION_PREFIX = 'csv_outputs/data/viz/'
+MIRROR_PREFIXES = [VIZ_PARTITION_PREFIX]
+
+DEFAULT_MIRROR_ROOT = 'data/mirror'
+DEFAULT_VIZ_OUTPUT = 'data/csv_outputs_data_viz.csv'
+DEFAULT_SYNC_INTERVAL = 60
+STATE_FILE = '_mirror_state.json'
+LAYOUT_FILE = '_viz_output_layout.json'
+
+
+def atomic_write_bytes(path: str, data: bytes):
+    """Write a file via temp file + rename so readers never see a partial file"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _csv_line(values: List[str]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerow(values)
+    return buffer.getvalue().encode('utf-8')
+
+
+def _copy_range(src, dst, length: int, chunk_size: int = 1 << 20):
+    """Copy length bytes from src's current position to dst"""
+    while length > 0:
+        chunk = src.read(min(chunk_size, length))
+        if not chunk:
+            raise IOError("Viz output is shorter than its recorded layout")
+        dst.write(chunk)
+        length -= len(chunk)
+
+
+class VizMirror:
+    """Generation-aware mirror of the viz partitions in a storage backend"""
+
+    def __init__(self, backend: StorageBackend, mirror_root: str = DEFAULT_MIRROR_ROOT,
+                 viz_output: str = DEFAULT_VIZ_OUTPUT, prefixes: Optional[List[str]] = None):
+        self.backend = backend
+        self.mirror_root = mirror_root
+        self.viz_output = viz_output
+        self.prefixes = prefixes or MIRROR_PREFIXES
+        self._lock = threading.Lock()
+        self._state = self._load_state()
+        self._headers = {}  # object name -> (generation, CSV header)
+        self._thread = None
+        self._stop = threading.Event()
+
+    def local_path(self, name: str) -> str:
+        """Local file for a bucket object"""
+        return os.path.join(self.mirror_root, *name.split('/'))
+
+    def _state_path(self) -> str:
+        return os.path.join(self.mirror_root, STATE_FILE)
+
+    def _load_state(self) -> Dict[str, int]:
+        """Object name -> generation of the local copy"""
+        try:
+            with open(self._state_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self):
+        atomic_write_bytes(self._state_path(), json.dumps(self._state, sort_keys=True).encode('utf-8'))
+
+    def _layout_path(self) -> str:
+        return os.path.join(self.mirror_root, LAYOUT_FILE)
+
+    def _load_layout(self) -> Dict:
+        """
+        Where each partition sits in the current viz output:
+        {'header': [...], 'size': bytes, 'sections': {name: [generation, start, end]}}.
+        Empty when the output is missing or does not match the recorded layout.
+        """
+        try:
+            with open(self._layout_path()) as f:
+                layout = json.load(f)
+            if os.path.getsize(self.viz_output) == layout.get('size'):
+                return layout
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def sync(self) -> Dict[str, int]:
+        """
+        Bring the mirror up to date with the bucket.
+
+        Returns:
+            dict: Counts of downloaded, deleted and unchanged objects
+        """
+        with self._lock:
+            stats = {'downloaded': 0, 'deleted': 0, 'unchanged': 0}
+            viz_changed = False
+            remote = {}
+
+            for prefix in self.prefixes:
+                for obj in self.backend.list_objects(prefix=prefix):
+                    remote[obj.name] = obj.generation
+
+            for name, generation in remote.items():
+                if self._state.get(name) == generation and os.path.exists(self.local_path(name)):
+                    stats['unchanged'] += 1
+                    continue
+                try:
+                    data, generation = self.backend.read_with_generation(name)
+                except ObjectNotFound:
+                    continue  # Deleted between listing and download (e.g. compaction)
+                atomic_write_bytes(self.local_path(name), data)
+                self._state[name] = generation
+                stats['downloaded'] += 1
+                viz_changed = viz_changed or name.startswith(VIZ_PARTITION_PREFIX)
+
+            for name in [name for name in self._state if name not in remote]:
+                try:
+                    os.remove(self.local_path(name))
+                except OSError:
+                    pass
+                del self._state[name]
+                stats['deleted'] += 1
+                viz_changed = viz_changed or name.startswith(VIZ_PARTITION_PREFIX)
+
+            if stats['downloaded'] or stats['deleted']:
+                self._save_state()
+            if viz_changed or not os.path.exists(self.viz_output):
+                self.assemble_viz_output()
+
+            logger.info(f"🔄 Mirror sync: {stats['downloaded']} downloaded, "
+                        f"{stats['deleted']} deleted, {stats['unchanged']} unchanged")
+            return stats
+
+    def viz_partition_names(self) -> List[str]:
+        """Mirrored viz partition objects, newest date first"""
+        names = [name for name in self._state
+                 if name.startswith(VIZ_PARTITION_PREFIX) and '/date=' in name]
+        return sorted(names, reverse=True)
+
+    def viz_partition_files(self) -> List[str]:
+        """Local viz partition files, newest date first"""
+        return [self.local_path(name) for name in self.viz_partition_names()]
+
+    def partition_header(self, name: str) -> List[str]:
+        """CSV header of a mirrored partition (cached per generation)"""
+        generation = self._state.get(name)
+        cached = self._headers.get(name)
+        if cached and cached[0] == generation:
+            return cached[1]
+        with io.BufferedReader(open_csv_binary(self.local_path(name))) as raw:
+            header = next(csv.reader([raw.readline().decode('utf-8')]), [])
+        self._headers[name] = (generation, header)
+        return header
+
+    def _write_partition_body(self, out, name: str, header: List[str]):
+        """Append a partition's rows in the output's column order"""
+        path = self.local_path(name)
+        if self.partition_header(name) == header:
+            # Same columns: copy the rows byte for byte, no parsing
+            with io.BufferedReader(open_csv_binary(path)) as raw:
+                raw.readline()
+                start = out.tell()
+                shutil.copyfileobj(raw, out)
+            if out.tell() > start:
+                out.seek(-1, os.SEEK_END)
+                if out.read(1) != b'\n':
+                    out.write(b'\n')
+            return
+
+        # Older/newer schema: align its columns with the output (text kept verbatim)
+        df_part = read_csv_any(path, dtype=str, keep_default_na=False).reindex(columns=header, fill_value='')
+        out.write(df_part.to_csv(index=False, header=False).encode('utf-8'))
+
+    def assemble_viz_output(self) -> bool:
+        """
+        Build the dashboard's viz CSV from the mirrored partitions (atomic swap).
+
+        Partitions whose generation is unchanged since the last assembly are
+        copied from the previous output by byte range; only changed dates are
+        read from their partition files.
+        """
+        names = self.viz_partition_names()
+        if not names:
+            return False
+
+        layout = self._load_layout()
+        header = list(layout.get('header', []))
+        for name in names:
+            header.extend(col for col in self.partition_header(name) if col not in header)
+        previous = layout.get('sections', {}) if layout.get('header') == header else {}
+
+        sections = {}
+        reused = 0
+        tmp_path = f"{self.viz_output}.tmp-{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(os.path.dirname(self.viz_output) or '.', exist_ok=True)
+        with open(tmp_path, 'w+b') as out:
+            out.write(_csv_line(header))
+            old = open(self.viz_output, 'rb') if previous else None
+            try:
+                for name in names:
+                    start = out.tell()
+                    section = previous.get(name)
+                    if old is not None and section and section[0] == self._state[name]:
+                        old.seek(section[1])
+                        _copy_range(old, out, section[2] - section[1])
+                        reused += 1
+                    else:
+                        self._write_partition_body(out, name, header)
+                    sections[name] = [self._state[name], start, out.tell()]
+            finally:
+                if old is not None:
+                    old.close()
+            size = out.tell()
+        os.replace(tmp_path, self.viz_output)
+        atomic_write_bytes(self._layout_path(), json.dumps(
+            {'header': header, 'size': size, 'sections': sections}, sort_keys=True).encode('utf-8'))
+
+        logger.info(f"✅ Assembled {self.viz_output} from {len(names)} partitions "
+                    f"({len(names) - reused} re-read, {reused} unchanged)")
+        return True
+
+    def start(self, interval: float = DEFAULT_SYNC_INTERVAL):
+        """Sync in a background thread every interval seconds"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sync_loop, args=(interval,), daemon=True)
+        self._thread.start()
+        logger.info(f"🔍 Started viz mirror every {interval}s into {self.mirror_root}")
+
+    def stop(self):
+        self._stop.set()
+
+    def _sync_loop(self, interval: float):
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"❌ Error syncing viz mirror: {e}")
+            self._stop.wait(interval)
+
+
+def create_viz_mirror_from_env() -> Optional[VizMirror]:
+    """
+    Build a mirror from the environment, or None when mirroring is not configured.
+
+    VIZ_MIRROR_BUCKET      - GCS bucket to mirror
+    VIZ_MIRROR_LOCAL_ROOT  - local-directory bucket stand-in (takes precedence, for testing)
+    VIZ_MIRROR_DIR         - where mirrored objects are kept (default data/mirror)
+    """
+    local_root = os.environ.get('VIZ_MIRROR_LOCAL_ROOT')
+    bucket_name = os.environ.get('VIZ_MIRROR_BUCKET')
+
+    if local_root:
+        backend = LocalBackend(local_root)
+    elif bucket_name:
+        backend = GCSBackend.from_bucket_name(bucket_name)
+    else:
+        return None
+
+    return VizMirror(backend, mirror_root=os.environ.get('VIZ_MIRROR_DIR', DEFAULT_MIRROR_ROOT))
+
+
+_viz_mirror = None
+
+
+def start_viz_mirror() -> Optional[VizMirror]:
+    """Start the background mirror if configured; returns it (or None)"""
+    global _viz_mirror
+
+    if _viz_mirror is None:
+        try:
+            _viz_mirror = create_viz_mirror_from_env()
+        except Exception as e:
+            logger.error(f"❌ Could not create viz mirror: {e}")
+            return None
+
+    if _viz_mirror:
+        interval = float(os.environ.get('VIZ_MIRROR_INTERVAL', DEFAULT_SYNC_INTERVAL))
+        _viz_mirror.start(interval)
+    return _viz_mirror
+
+
+def stop_viz_mirror():
+    if _viz_mirror:
+        _viz_mirror.stop()
+
+
+__all__ = [
+    'VizMirror',
+    'create_viz_mirror_from_env',
+    'start_viz_mirror',
+    'stop_viz_mirror'
+]
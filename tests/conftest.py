@@ -0,0 +1,7 @@
+# tests/conftest.py
+"""Make the repository root importable (utils, services, data, ...)"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
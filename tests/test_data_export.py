@@ -0,0 +1,43 @@
+# tests/test_data_export.py
+"""Streaming export round trips"""
+
+import io
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+from utils.data_export import iter_export
+
+
+def _is_text(arrow_type):
+    # pandas 3 infers large_string for str columns
+    return pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type)
+
+
+def test_parquet_export_with_string_columns():
+    df = pd.DataFrame({
+        'Agency': ['Saurashtra', 'Zigma', None],
+        'ticket_no': ['00123', 'T0002', 'T0003'],
+        'empty': [None, None, None],
+        'net_weight_calculated': [1.5, 2.0, 0.0],
+    })
+
+    data = b''.join(iter_export(df, 'parquet', chunk_rows=2))
+    table = pq.read_table(io.BytesIO(data))
+
+    assert table.num_rows == 3
+    assert _is_text(table.schema.field('Agency').type)
+    assert _is_text(table.schema.field('empty').type)
+    assert table.column('ticket_no').to_pylist() == ['00123', 'T0002', 'T0003']
+    assert table.column('Agency').to_pylist() == ['Saurashtra', 'Zigma', None]
+
+
+def test_csv_export_round_trip():
+    df = pd.DataFrame({'Site': ['Kurnool', 'Dhone'], 'weight': [10, 20]})
+
+    data = b''.join(iter_export(df, 'csv', chunk_rows=1))
+
+    assert pd.read_csv(io.BytesIO(data)).equals(df)
@@ -0,0 +1,65 @@
+# tests/test_sketches.py
+"""Distinct-count sketches against exact counts on the sample trips"""
+
+import os
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+np = pytest.importorskip("numpy")
+
+from data.entities import add_entity_codes
+from data.sketches import HyperLogLog, SketchRollup
+
+SAMPLE_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'data', 'waste_management_data_updateds.csv')
+
+
+@pytest.fixture(scope='module')
+def trips():
+    df = pd.read_csv(SAMPLE_CSV)
+    df['Date'] = pd.to_datetime(df['Date'])
+    return add_entity_codes(df)
+
+
+def _close(approx, exact):
+    # Small counts use linear counting and are all but exact
+    return abs(approx - exact) <= max(1, 0.05 * exact)
+
+
+def test_rollup_count_matches_nunique(trips):
+    rollup = SketchRollup.build(trips, ['Date', 'agency_id', 'site_id'], ['vehicle_id', 'site_id', 'Vehicle No'])
+
+    assert len(rollup.cells) == len(trips[['Date', 'agency_id', 'site_id']].drop_duplicates())
+    assert _close(rollup.count('vehicle_id'), trips['vehicle_id'].nunique())
+    assert _close(rollup.count('site_id'), trips['site_id'].nunique())
+    assert _close(rollup.count('Vehicle No'), trips['Vehicle No'].nunique())
+
+
+def test_rollup_count_over_selected_cells(trips):
+    rollup = SketchRollup.build(trips, ['Date', 'site_id'], ['vehicle_id'])
+    last_week = trips['Date'] > trips['Date'].max() - pd.Timedelta(days=7)
+
+    selected = (rollup.cells['Date'] > trips['Date'].max() - pd.Timedelta(days=7)).values
+    assert _close(rollup.count('vehicle_id', selected), trips.loc[last_week, 'vehicle_id'].nunique())
+    assert rollup.count('vehicle_id', np.zeros(len(rollup.cells), dtype=bool)) == 0
+
+
+def test_rollup_keeps_missing_keys_and_skips_missing_values():
+    df = pd.DataFrame({
+        'site': ['a', 'a', None, None],
+        'vehicle': ['V1', None, 'V2', 'V3'],
+    })
+    rollup = SketchRollup.build(df, ['site'], ['vehicle'])
+
+    assert len(rollup.cells) == 2
+    assert rollup.count('vehicle') == 3
+    assert rollup.count('vehicle', rollup.cells['site'].isna().values) == 2
+
+
+def test_hyperloglog_merge_and_round_trip():
+    left = HyperLogLog().add([f"V{i}" for i in range(100)])
+    right = HyperLogLog().add([f"V{i}" for i in range(50, 150)])
+
+    assert _close((left | right).count(), 150)
+    assert HyperLogLog.from_bytes(left.to_bytes()).count() == left.count()
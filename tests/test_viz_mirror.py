@@ -0,0 +1,87 @@
+# tests/test_viz_mirror.py
+"""Viz mirror sync and incremental assembly against a LocalBackend bucket"""
+
+import gzip
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from data.storage_backend import LocalBackend
+from services.viz_mirror import VIZ_PARTITION_PREFIX, VizMirror
+
+HEADER = "date,Site,ticket_no,Net Weight\n"
+
+
+def partition(date, *tickets):
+    return HEADER + "".join(f"{date},allipuram,{ticket},100\n" for ticket in tickets)
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    return LocalBackend(str(tmp_path / "bucket"))
+
+
+@pytest.fixture
+def mirror(bucket, tmp_path):
+    return VizMirror(bucket, mirror_root=str(tmp_path / "mirror"), viz_output=str(tmp_path / "viz.csv"))
+
+
+def put(bucket, date, body, suffix=".csv"):
+    data = body.encode() if suffix == ".csv" else gzip.compress(body.encode())
+    bucket.write_bytes(f"{VIZ_PARTITION_PREFIX}date={date}{suffix}", data)
+
+
+def read_output(mirror):
+    return pd.read_csv(mirror.viz_output, dtype=str, keep_default_na=False)
+
+
+def test_mirrors_only_viz_partitions(bucket, mirror):
+    put(bucket, "2025-06-04", partition("2025-06-04", "A1"))
+    bucket.write_bytes("csv_outputs/data/shards/shard-0001.csv", b"ticket_no\nA1\n")
+
+    stats = mirror.sync()
+
+    assert stats["downloaded"] == 1
+    assert list(read_output(mirror)["ticket_no"]) == ["A1"]
+
+
+def test_reassembles_only_changed_dates(bucket, mirror, monkeypatch):
+    put(bucket, "2025-06-03", partition("2025-06-03", "A1", "A2"))
+    put(bucket, "2025-06-04", partition("2025-06-04", "B1"), suffix=".csv.gz")
+    mirror.sync()
+
+    put(bucket, "2025-06-05", partition("2025-06-05", "C1"))
+    put(bucket, "2025-06-04", partition("2025-06-04", "B1", "B2"), suffix=".csv.gz")
+    reread = []
+    write_body = mirror._write_partition_body
+    monkeypatch.setattr(mirror, "_write_partition_body",
+                        lambda out, name, header: (reread.append(name), write_body(out, name, header)))
+    mirror.sync()
+
+    assert sorted(reread) == [f"{VIZ_PARTITION_PREFIX}date=2025-06-04.csv.gz",
+                              f"{VIZ_PARTITION_PREFIX}date=2025-06-05.csv"]
+    assert list(read_output(mirror)["ticket_no"]) == ["C1", "B1", "B2", "A1", "A2"]
+
+
+def test_new_column_realigns_every_partition(bucket, mirror):
+    put(bucket, "2025-06-03", partition("2025-06-03", "A1"))
+    mirror.sync()
+
+    put(bucket, "2025-06-04", "date,Site,ticket_no,Net Weight,vehicle_no\n2025-06-04,allipuram,B1,100,AP39\n")
+    mirror.sync()
+
+    df = read_output(mirror)
+    assert list(df.columns) == ["date", "Site", "ticket_no", "Net Weight", "vehicle_no"]
+    assert list(df["vehicle_no"]) == ["AP39", ""]
+
+
+def test_deleted_partition_leaves_output(bucket, mirror):
+    put(bucket, "2025-06-03", partition("2025-06-03", "A1"))
+    put(bucket, "2025-06-04", partition("2025-06-04", "B1"))
+    mirror.sync()
+
+    bucket.delete(f"{VIZ_PARTITION_PREFIX}date=2025-06-03.csv")
+    mirror.sync()
+
+    assert list(read_output(mirror)["ticket_no"]) == ["B1"]
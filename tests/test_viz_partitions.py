@@ -0,0 +1,49 @@
+# tests/test_viz_partitions.py
+"""Viz partition merges dedup on the source-record key"""
+
+import os
+import sys
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+# data/main.py is deployed as a standalone function and imports its siblings top-level
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data'))
+main = pytest.importorskip("main")
+
+from storage_backend import LocalBackend  # the same module main uses
+
+
+def viz_row(ticket, uploaded, site='allipuram', company='zigma'):
+    row = {col: '' for col in main.VIZ_REQUIRED_COLUMNS}
+    row.update({'Site': site, 'date': '05-06-2025', 'ticket_no': ticket,
+                'cloud_upload_timestamp': uploaded, '_source_company': company,
+                'net_weight_calculated': 100})
+    return row
+
+
+def read_partitions(backend):
+    return pd.concat([main.read_csv_blob(backend, name, dtype=main.KEY_COLUMN_DTYPES)
+                      for name in main.list_viz_partitions(backend)], ignore_index=True)
+
+
+def test_merge_uses_source_record_key(tmp_path):
+    backend = LocalBackend(str(tmp_path))
+    main.merge_into_viz_partitions(backend, pd.DataFrame([
+        viz_row('1', '2025-06-05 10:00:00'),
+        viz_row('2', '2025-06-05 10:05:00'),
+        viz_row('1', '2025-06-05 10:00:00', company='saurashtra'),
+    ]))
+    main.merge_into_viz_partitions(backend, pd.DataFrame([
+        # Same ticket and upload time under another site spelling is the same record
+        viz_row('1', '2025-06-05 10:00:00', site='Allipuram '),
+        # A re-used ticket number uploaded later is a new record, as in the key index
+        viz_row('2', '2025-06-05 18:00:00'),
+    ]))
+
+    df = read_partitions(backend)
+    keys = sorted(zip(df['_source_company'], df['ticket_no'], df['cloud_upload_timestamp']))
+    assert keys == [('saurashtra', '1', '2025-06-05 10:00:00'), ('zigma', '1', '2025-06-05 10:00:00'),
+                    ('zigma', '2', '2025-06-05 10:05:00'), ('zigma', '2', '2025-06-05 18:00:00')]
+    assert df.loc[(df['_source_company'] == 'zigma') & (df['ticket_no'] == '1'), 'Site'].item() == 'Allipuram '
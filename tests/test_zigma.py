@@ -0,0 +1,144 @@
+# tests/test_zigma.py
+"""Zigma API fetching against a stub HTTP server on localhost"""
+
+import csv
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+from data import zigma
+
+
+def api_record(ticket, date="2025-06-05", time_value="10:00:00"):
+    return {
+        "Date": date, "Time": time_value, "Site": "allipuram", "Material Name": "MSW",
+        "Ticket No": str(ticket), "Vehicle No": "AP39UQ4518", "Loaded Weight": "44120",
+        "Empty Weight": "15060", "Net Weight": "29060",
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        route = self.server.routes[self.path]
+        with self.server.lock:
+            self.server.hits[self.path] = self.server.hits.get(self.path, 0) + 1
+            hit = self.server.hits[self.path]
+        status, body = route(hit) if callable(route) else route[min(hit, len(route)) - 1]
+        if status == "truncate":
+            # Promise more bytes than are sent, then drop the connection
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body) * 2))
+            self.end_headers()
+            self.wfile.write(body.encode())
+            self.close_connection = True
+            return
+        data = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.routes, server.hits, server.lock = {}, {}, threading.Lock()
+    server.url = lambda path: f"http://127.0.0.1:{server.server_address[1]}{path}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(zigma, "BACKOFF_FACTOR", 0.1)
+
+
+def read_rows(output_dir):
+    with open(os.path.join(output_dir, zigma.CANONICAL_FILENAME), newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def test_retries_server_errors_with_backoff(stub):
+    stub.routes["/flaky"] = [(503, ""), (503, ""), (200, [api_record(1), api_record(2)])]
+
+    started = time.perf_counter()
+    records = zigma.fetch_endpoint(stub.url("/flaky"), zigma.build_session(pool_size=1))
+
+    assert [rec["Ticket No"] for rec in records] == ["1", "2"]
+    assert stub.hits["/flaky"] == 3
+    # No sleep before the first retry, BACKOFF_FACTOR * 2 before the second
+    assert time.perf_counter() - started >= 2 * zigma.BACKOFF_FACTOR
+
+
+def test_gives_up_after_max_retries(stub):
+    stub.routes["/down"] = [(503, "")]
+
+    assert zigma.fetch_endpoint(stub.url("/down"), zigma.build_session(pool_size=1)) == []
+    assert stub.hits["/down"] == zigma.MAX_RETRIES + 1
+
+
+def test_fetches_every_endpoint_concurrently(stub, tmp_path):
+    assert zigma.MAX_CONCURRENCY >= len(zigma.ENDPOINTS)
+
+    # Each response waits until all endpoints are being served at once
+    barrier = threading.Barrier(len(zigma.ENDPOINTS), timeout=5)
+
+    def concurrent_page(path):
+        def page(hit):
+            barrier.wait()
+            return 200, {"records": [api_record(f"{path}-1"), api_record(f"{path}-2")]}
+        return page
+
+    paths = [f"/site{i}" for i in range(len(zigma.ENDPOINTS))]
+    for path in paths:
+        stub.routes[path] = concurrent_page(path.strip("/"))
+
+    args = [arg for path in paths for arg in ("--endpoint", stub.url(path))]
+    zigma.main(args + ["--output-dir", str(tmp_path)])
+
+    assert len(read_rows(tmp_path)) == 2 * len(paths)
+    assert set(zigma.load_watermarks(str(tmp_path / zigma.WATERMARK_FILENAME))) == {stub.url(p) for p in paths}
+
+
+def test_repoll_appends_only_new_records(stub, tmp_path):
+    undated = api_record("U1", date="not a date")
+    stub.routes["/site"] = [
+        (200, [api_record(2, time_value="11:00:00"), api_record(1), undated]),
+        (200, [api_record(3, time_value="12:00:00"), api_record(2, time_value="11:00:00"),
+               api_record("late", date="2025-06-04"), api_record(1), undated]),
+    ]
+    args = ["--endpoint", stub.url("/site"), "--output-dir", str(tmp_path)]
+
+    zigma.main(args)
+    zigma.main(args)
+
+    tickets = [row["ticket_no"] for row in read_rows(tmp_path)]
+    assert sorted(tickets) == sorted(["1", "2", "U1", "3", "late"])
+    mark = zigma.load_watermarks(str(tmp_path / zigma.WATERMARK_FILENAME))[stub.url("/site")]
+    assert (mark["timestamp"], mark["ticket_no"]) == ("2025-06-05 12:00:00", "3")
+
+
+def test_partial_stream_keeps_watermark(stub, tmp_path):
+    stub.routes["/cut"] = [("truncate", json.dumps([api_record(1), api_record(2)])[:-40])]
+    stored = {"timestamp": "2025-06-01 00:00:00", "ticket_num": 0, "ticket_no": "0"}
+
+    with zigma.CanonicalWriter(str(tmp_path / zigma.CANONICAL_FILENAME), {}) as writer:
+        fetched, appended, mark, completed = zigma.pull_endpoint(
+            stub.url("/cut"), zigma.build_session(pool_size=1), stored, stored, writer)
+
+    assert not completed
+    assert mark is stored
+    assert appended == fetched  # whatever was parsed before the break is still written
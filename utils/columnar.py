@@ -0,0 +1,137 @@
+# utils/columnar.py
+"""
+Columnar JSON Wire Format
+Compact DataFrame encoding for Dash stores and JSON APIs.
+
+Instead of df.to_dict('records') (column names repeated on every row) a frame
+is sent once per column:
+
+    {
+        "encoding": "columnar",
+        "version": 1,
+        "length": 3,
+        "columns": ["Site", "net_weight_calculated"],
+        "data": [
+            {"type": "dict", "dictionary": ["Dhone", "Kurnool"], "codes": [1, 1, 0]},
+            {"type": "float", "values": [10.5, null, 3.0]}
+        ]
+    }
+
+Column types: "int", "float", "bool", "datetime" (epoch milliseconds),
+"dict" (dictionary-encoded strings, code -1 = null) and "str".
+The matching browser decoder lives in assets/columnar.js.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+COLUMNAR_ENCODING = "columnar"
+COLUMNAR_VERSION = 1
+
+# Dictionary-encode text columns whose distinct values are at most this share of rows
+DICTIONARY_MAX_RATIO = 0.5
+
+
+def _nullable_list(series):
+    """Convert a Series to a JSON-safe list with None for missing values"""
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def encode_column(series):
+    """Encode one Series into its columnar JSON representation"""
+    if pd.api.types.is_bool_dtype(series):
+        return {"type": "bool", "values": _nullable_list(series)}
+
+    if pd.api.types.is_integer_dtype(series) and not series.isna().any():
+        return {"type": "int", "values": series.astype('int64').tolist()}
+
+    if pd.api.types.is_numeric_dtype(series):
+        return {"type": "float", "values": _nullable_list(series.astype('float64'))}
+
+    if pd.api.types.is_datetime64_any_dtype(series):
+        if getattr(series.dt, 'tz', None) is not None:
+            series = series.dt.tz_convert('UTC').dt.tz_localize(None)
+        millis = series.values.astype('datetime64[ms]').astype('int64')
+        values = np.where(series.isna().values, None, millis.astype(object)).tolist()
+        return {"type": "datetime", "values": values}
+
+    codes, uniques = pd.factorize(series, sort=False)
+    if len(series) and len(uniques) <= DICTIONARY_MAX_RATIO * len(series):
+        return {
+            "type": "dict",
+            "dictionary": [str(value) for value in uniques],
+            "codes": codes.tolist()
+        }
+
+    return {"type": "str", "values": [None if pd.isna(v) else str(v) for v in series.tolist()]}
+
+
+def encode_columnar(df):
+    """Encode a DataFrame into the columnar wire format (index is dropped)"""
+    if df is None:
+        df = pd.DataFrame()
+
+    return {
+        "encoding": COLUMNAR_ENCODING,
+        "version": COLUMNAR_VERSION,
+        "length": int(len(df)),
+        "columns": [str(col) for col in df.columns],
+        "data": [encode_column(df[col]) for col in df.columns]
+    }
+
+
+def is_columnar(payload):
+    """True if payload is a columnar-encoded frame"""
+    return isinstance(payload, dict) and payload.get("encoding") == COLUMNAR_ENCODING
+
+
+def decode_column(encoded):
+    """Decode one encoded column back into a Series"""
+    col_type = encoded.get("type")
+
+    if col_type == "dict":
+        codes = np.asarray(encoded["codes"], dtype='int64')
+        dictionary = np.asarray(encoded["dictionary"] + [None], dtype=object)
+        # code -1 indexes the trailing None
+        return pd.Series(dictionary[codes], dtype=object)
+
+    values = encoded.get("values", [])
+
+    if col_type == "int":
+        return pd.Series(values, dtype='int64')
+    if col_type == "float":
+        return pd.Series(values, dtype='float64')
+    if col_type == "bool":
+        return pd.Series(values, dtype=object if None in values else bool)
+    if col_type == "datetime":
+        return pd.Series(pd.to_datetime(pd.Series(values, dtype='float64'), unit='ms'))
+
+    return pd.Series(values, dtype=object)
+
+
+def decode_columnar(payload):
+    """
+    Decode a columnar payload into a DataFrame.
+
+    Legacy list-of-records payloads are accepted too, so stores written
+    before the switch still load.
+    """
+    if not payload:
+        return pd.DataFrame()
+
+    if isinstance(payload, list):
+        return pd.DataFrame(payload)
+
+    if not is_columnar(payload):
+        raise ValueError("Payload is neither columnar-encoded nor a list of records")
+
+    if payload.get("version") != COLUMNAR_VERSION:
+        logger.warning(f"⚠️ Unexpected columnar version: {payload.get('version')}")
+
+    columns = payload.get("columns", [])
+    data = {name: decode_column(encoded) for name, encoded in zip(columns, payload.get("data", []))}
+    return pd.DataFrame(data, columns=columns)
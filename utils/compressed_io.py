@@ -0,0 +1,101 @@
+# utils/compressed_io.py
+"""
+Compressed CSV Reading Utilities
+Lets dashboard loaders read plain, gzip or zstd CSV files transparently -
+the format is detected from the file's magic bytes, not its name
+"""
+
+import io
+import os
+import gzip
+import logging
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Compressed variants tried after the plain path, in order
+COMPRESSED_SUFFIXES = ['.gz', '.zst']
+
+
+def detect_compression(path):
+    """Return 'gzip', 'zstd' or None for a file, based on its first bytes"""
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    if head.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if head.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    return None
+
+
+def resolve_csv_path(path):
+    """
+    Find the file for a CSV path: the path itself, else path.gz / path.zst.
+
+    Returns:
+        str or None: The existing file path
+    """
+    if os.path.exists(path):
+        return path
+    for suffix in COMPRESSED_SUFFIXES:
+        if os.path.exists(path + suffix):
+            return path + suffix
+    return None
+
+
+def csv_path_exists(path):
+    """True if the CSV exists plain or compressed"""
+    return resolve_csv_path(path) is not None
+
+
+def open_csv_binary(path):
+    """Open a CSV file as a binary stream, decompressing on the fly"""
+    compression = detect_compression(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'zstd':
+        if not ZSTD_AVAILABLE:
+            raise ImportError(f"zstandard is required to read {path}")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+
+def read_csv_any(path, **kwargs):
+    """
+    pd.read_csv for plain or compressed files.
+
+    Args:
+        path: CSV path; path.gz / path.zst are used when the plain file is absent
+        **kwargs: Passed to pd.read_csv (e.g. encoding)
+    """
+    resolved = resolve_csv_path(path)
+    if resolved is None:
+        raise FileNotFoundError(path)
+
+    if detect_compression(resolved) is None:
+        return pd.read_csv(resolved, **kwargs)
+
+    encoding = kwargs.pop('encoding', 'utf-8')
+    with open_csv_binary(resolved) as raw:
+        with io.TextIOWrapper(raw, encoding=encoding, newline='') as text:
+            return pd.read_csv(text, **kwargs)
+
+
+__all__ = [
+    'ZSTD_AVAILABLE',
+    'detect_compression',
+    'resolve_csv_path',
+    'csv_path_exists',
+    'open_csv_binary',
+    'read_csv_any'
+]
@@ -0,0 +1,141 @@
+# utils/data_export.py
+"""
+Streaming Data Export Utilities
+Turns a filtered DataFrame into CSV, gzip CSV or Parquet byte chunks
+so Flask can stream large extracts without building the whole file in memory
+"""
+
+import io
+import zlib
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Rows rendered per chunk - keeps each yielded block around a few MB
+EXPORT_CHUNK_ROWS = 10000
+
+EXPORT_FORMATS = {
+    'csv': {'extension': 'csv', 'mimetype': 'text/csv'},
+    'csv.gz': {'extension': 'csv.gz', 'mimetype': 'application/gzip'},
+    'parquet': {'extension': 'parquet', 'mimetype': 'application/vnd.apache.parquet'},
+}
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+
+def get_available_formats():
+    """Return export formats usable in this environment"""
+    return [fmt for fmt in EXPORT_FORMATS if fmt != 'parquet' or PARQUET_AVAILABLE]
+
+
+def build_export_filename(fmt, prefix="filtered_data"):
+    """Build a timestamped download filename for the given format"""
+    extension = EXPORT_FORMATS[fmt]['extension']
+    return f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+
+def iter_row_batches(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield consecutive row slices of the DataFrame"""
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def iter_csv_chunks(df, chunk_rows=EXPORT_CHUNK_ROWS, encoding='utf-8'):
+    """Yield the DataFrame as CSV bytes, one row batch at a time (header first)"""
+    yield df.iloc[0:0].to_csv(index=False).encode(encoding)
+    for batch in iter_row_batches(df, chunk_rows):
+        yield batch.to_csv(index=False, header=False).encode(encoding)
+
+
+def iter_gzip_csv_chunks(df, chunk_rows=EXPORT_CHUNK_ROWS, compresslevel=6):
+    """Yield a gzip stream of the CSV, compressing each batch as it is produced"""
+    # wbits=31 -> gzip container (header + CRC trailer) around the deflate stream
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 31)
+    for chunk in iter_csv_chunks(df, chunk_rows):
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only sink that hands written bytes back to the caller in pieces"""
+
+    def __init__(self):
+        self._pending = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._pending.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        # Parquet footers store absolute offsets, so report total bytes written
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._pending)
+        self._pending = []
+        return data
+
+
+def parquet_schema(df):
+    """
+    Arrow schema for the whole frame.
+
+    Inferred from the data, not an empty slice (which types every object column
+    as null); columns with no non-null values at all are written as strings.
+    """
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, pa.field(field.name, pa.string()))
+    return schema
+
+
+def iter_parquet_chunks(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Yield a Parquet file written as one row group per batch.
+
+    The schema is resolved before the generator is returned, so conversion
+    errors surface before a response has started streaming.
+    """
+    if not PARQUET_AVAILABLE:
+        raise ImportError("Parquet export requires pyarrow")
+    return _iter_parquet_chunks(df, parquet_schema(df), chunk_rows)
+
+
+def _iter_parquet_chunks(df, schema, chunk_rows):
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for batch in iter_row_batches(df, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(batch, schema=schema, preserve_index=False))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def iter_export(df, fmt='csv', chunk_rows=EXPORT_CHUNK_ROWS):
+    """Dispatch to the streaming generator for the requested format"""
+    if fmt == 'csv':
+        return iter_csv_chunks(df, chunk_rows)
+    if fmt == 'csv.gz':
+        return iter_gzip_csv_chunks(df, chunk_rows)
+    if fmt == 'parquet':
+        return iter_parquet_chunks(df, chunk_rows)
+    raise ValueError(f"Unsupported export format: {fmt}")